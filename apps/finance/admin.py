@@ -65,6 +65,40 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ('category', 'subcategory')
 
 
+@admin.register(BalanceAlert)
+class BalanceAlertAdmin(admin.ModelAdmin):
+    list_display = (
+        'account',
+        'kind',
+        'breach_date',
+        'current_balance',
+        'lowest_balance',
+        'minimum_balance',
+        'updated_at',
+    )
+    list_filter = ('kind',)
+    ordering = ('breach_date',)
+
+@admin.register(CategorizationRule)
+class CategorizationRuleAdmin(admin.ModelAdmin):
+    list_display = (
+        'name',
+        'pattern',
+        'account',
+        'transaction_type',
+        'min_value',
+        'max_value',
+        'category',
+        'beneficiary',
+        'priority',
+        'is_active',
+    )
+    list_editable = ('priority', 'is_active')
+    search_fields = ('name', 'pattern')
+    list_filter = ('is_active', 'transaction_type', 'account')
+    ordering = ('-priority', 'name')
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = (
@@ -146,6 +180,7 @@ class TransactionAdmin(admin.ModelAdmin):
                 'recurrence_type',
                 'recurrence_interval',
                 'recurrence_weekdays',
+                'recurrence_rule',
                 'recurrence_start_date',
                 'recurrence_end_type',
                 'recurrence_end_date',
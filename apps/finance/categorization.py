@@ -0,0 +1,159 @@
+"""
+Motor de categorização automática de transações.
+
+Todas as regras ativas (CategorizationRule) são compiladas em um único
+autômato de Aho-Corasick sobre os textos das regras: cada descrição é
+percorrida uma única vez, independentemente do número de regras, e só as
+regras cujos textos ocorrem nela têm as demais condições avaliadas.
+
+O motor compilado fica em cache no processo e só é reconstruído quando
+alguma regra muda (a marca é a quantidade de regras e o maior updated_at).
+"""
+import threading
+from collections import deque
+
+from django.db.models import Count, Max
+
+from .models import CategorizationRule, normalize_text
+
+_cache = {'stamp': None, 'engine': None}
+_lock = threading.Lock()
+
+
+class Automaton:
+    """Autômato de Aho-Corasick: encontra todos os padrões contidos em um texto."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = next_node
+            self.output[node] += (index,)
+
+        # Ligações de falha em largura; cada nó herda as saídas do seu sufixo
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def search(self, text):
+        """Índices dos padrões que ocorrem em text."""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class RuleEngine:
+    """Conjunto de regras compilado para avaliação em lote."""
+
+    def __init__(self, rules):
+        for rule in rules:
+            rule.pattern = normalize_text(rule.pattern)
+        # Ordem de preferência: maior prioridade, texto mais específico, mais antiga
+        self.rules = sorted(rules, key=lambda rule: (-rule.priority, -len(rule.pattern), rule.id))
+
+        self.patterns = sorted({rule.pattern for rule in self.rules if rule.pattern})
+        pattern_index = {pattern: index for index, pattern in enumerate(self.patterns)}
+        self.rules_by_pattern = [[] for _ in self.patterns]
+        self.generic_ranks = []
+        for rank, rule in enumerate(self.rules):
+            if rule.pattern:
+                self.rules_by_pattern[pattern_index[rule.pattern]].append(rank)
+            else:
+                self.generic_ranks.append(rank)
+        self.automaton = Automaton(self.patterns)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    @staticmethod
+    def _accepts(rule, value, account_id, transaction_type):
+        if rule.account_id is not None and rule.account_id != account_id:
+            return False
+        if rule.transaction_type and rule.transaction_type != transaction_type:
+            return False
+        if rule.min_value is not None and (value is None or value < rule.min_value):
+            return False
+        if rule.max_value is not None and (value is None or value > rule.max_value):
+            return False
+        return True
+
+    def match(self, description, value=None, account_id=None, transaction_type=None):
+        """Regra de maior preferência que atende à transação, ou None."""
+        if not self.rules:
+            return None
+        ranks = list(self.generic_ranks)
+        for index in self.automaton.search(normalize_text(description)):
+            ranks.extend(self.rules_by_pattern[index])
+        for rank in sorted(ranks):
+            rule = self.rules[rank]
+            if self._accepts(rule, value, account_id, transaction_type):
+                return rule
+        return None
+
+    def categorize(self, transactions):
+        """
+        Preenche categoria e beneficiário (quando vazios) das transações em
+        memória a partir das regras. Retorna quantas foram categorizadas.
+        """
+        categorized = 0
+        if not self.rules:
+            return categorized
+        for transaction in transactions:
+            if transaction.category_id and transaction.beneficiary_id:
+                continue
+            rule = self.match(
+                transaction.description,
+                transaction.value,
+                transaction.account_id,
+                transaction.transaction_type,
+            )
+            if rule is None:
+                continue
+            changed = False
+            if not transaction.category_id and rule.category_id:
+                transaction.category_id = rule.category_id
+                changed = True
+            if not transaction.beneficiary_id and rule.beneficiary_id:
+                transaction.beneficiary_id = rule.beneficiary_id
+                changed = True
+            categorized += changed
+        return categorized
+
+
+def get_engine():
+    """
+    Motor com as regras ativas atuais. Custa uma consulta agregada para
+    conferir a marca; a compilação só é refeita quando as regras mudaram.
+    """
+    stamp = CategorizationRule.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+    stamp = (stamp['count'], stamp['updated_at'])
+    with _lock:
+        if _cache['stamp'] != stamp:
+            _cache['engine'] = RuleEngine(list(CategorizationRule.objects.filter(is_active=True)))
+            _cache['stamp'] = stamp
+        return _cache['engine']
@@ -1,6 +1,8 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from .importers import FORMAT_CHOICES
 from .models import Account, Transaction, Category
+from .recurrence_rules import rule_frequency, validate_rule
 
 
 class AccountForm(forms.ModelForm):
@@ -176,6 +178,10 @@ class CompositeTransactionForm(forms.Form):
         if line_count == 0:
             raise ValidationError('Adicione pelo menos uma linha de transação.')
         
+        # Resolve de uma vez todas as contas e categorias referenciadas pelas linhas
+        accounts = Account.objects.in_bulk(self._referenced_ids(line_count, 'destination_account'))
+        categories = Category.objects.in_bulk(self._referenced_ids(line_count, 'category'))
+        
         # Valida cada linha
         line_error_messages = []
         for i in range(line_count):
@@ -224,15 +230,14 @@ class CompositeTransactionForm(forms.Form):
                 if not destination_account_id:
                     line_error_messages.append(f'Linha {i+1}: Conta de destino é obrigatória para transferências.')
                     continue
-                try:
-                    destination_account = Account.objects.get(id=destination_account_id)
-                    main_account = cleaned_data.get('account')
-                    if main_account and destination_account == main_account:
-                        line_error_messages.append(f'Linha {i+1}: A conta de destino deve ser diferente da conta principal.')
-                        continue
-                except Account.DoesNotExist:
+                destination_account = accounts.get(self._parse_id(destination_account_id))
+                if destination_account is None:
                     line_error_messages.append(f'Linha {i+1}: Conta de destino inválida.')
                     continue
+                main_account = cleaned_data.get('account')
+                if main_account and destination_account == main_account:
+                    line_error_messages.append(f'Linha {i+1}: A conta de destino deve ser diferente da conta principal.')
+                    continue
                 if category_id:
                     line_error_messages.append(f'Linha {i+1}: Transferências não devem ter categoria.')
                     continue
@@ -242,9 +247,8 @@ class CompositeTransactionForm(forms.Form):
                 if not category_id:
                     line_error_messages.append(f'Linha {i+1}: Categoria é obrigatória para transações normais.')
                     continue
-                try:
-                    category = Category.objects.get(id=category_id)
-                except Category.DoesNotExist:
+                category = categories.get(self._parse_id(category_id))
+                if category is None:
                     line_error_messages.append(f'Linha {i+1}: Categoria inválida.')
                     continue
                 if destination_account_id:
@@ -268,6 +272,20 @@ class CompositeTransactionForm(forms.Form):
         
         cleaned_data['lines'] = lines
         return cleaned_data
+    
+    @staticmethod
+    def _parse_id(value):
+        """Converte o ID enviado para inteiro; None se vazio ou inválido."""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def _referenced_ids(self, line_count, field):
+        """IDs válidos do campo informado em todas as linhas enviadas."""
+        ids = {self._parse_id(self.data.get(f'line_{i}_{field}')) for i in range(line_count)}
+        ids.discard(None)
+        return ids
 
 
 class RecurringTransactionForm(TransactionForm):
@@ -291,6 +309,13 @@ class RecurringTransactionForm(TransactionForm):
         help_text='Ex: 2 para quinzenal (weekly), 6 para semestral (monthly), 2 para bienal (yearly)',
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
+    recurrence_rule = forms.CharField(
+        label='Regra personalizada (RRULE)',
+        max_length=255,
+        required=False,
+        help_text='Opcional. Ex: FREQ=WEEKLY;BYDAY=MO,WE,FR ou FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1 (último dia útil do mês)',
+        widget=forms.TextInput(attrs={'class': 'form-control'})
+    )
     recurrence_start_date = forms.DateField(
         label='Data da primeira parcela (vencimento)',
         required=False,
@@ -303,6 +328,11 @@ class RecurringTransactionForm(TransactionForm):
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
+    recurrence_end_date = forms.DateField(
+        label='Data final',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
     recurrence_end_count = forms.IntegerField(
         label='Número de parcelas',
         min_value=1,
@@ -315,8 +345,10 @@ class RecurringTransactionForm(TransactionForm):
             'is_recurring',
             'recurrence_type',
             'recurrence_interval',
+            'recurrence_rule',
             'recurrence_start_date',
             'recurrence_end_type',
+            'recurrence_end_date',
             'recurrence_end_count',
         ]
     
@@ -334,11 +366,22 @@ class RecurringTransactionForm(TransactionForm):
         if is_recurring:
             # Valida campos obrigatórios para recorrência
             recurrence_type = cleaned_data.get('recurrence_type')
+            recurrence_rule = cleaned_data.get('recurrence_rule')
             recurrence_start_date = cleaned_data.get('recurrence_start_date')
             recurrence_end_type = cleaned_data.get('recurrence_end_type', 'never')
+            recurrence_end_date = cleaned_data.get('recurrence_end_date')
             recurrence_end_count = cleaned_data.get('recurrence_end_count')
             buy_date = cleaned_data.get('buy_date')
             
+            # Com regra personalizada, o tipo de recorrência vem do FREQ da regra
+            if recurrence_rule:
+                try:
+                    cleaned_data['recurrence_rule'] = validate_rule(recurrence_rule)
+                except ValueError as error:
+                    self.add_error('recurrence_rule', str(error))
+                else:
+                    recurrence_type = cleaned_data['recurrence_type'] = rule_frequency(recurrence_rule)
+            
             if not recurrence_type:
                 self.add_error('recurrence_type', 'Tipo de recorrência é obrigatório para transações recorrentes.')
             
@@ -350,5 +393,40 @@ class RecurringTransactionForm(TransactionForm):
             if recurrence_end_type == 'after_count':
                 if not recurrence_end_count or recurrence_end_count < 1:
                     self.add_error('recurrence_end_count', 'Número de parcelas deve ser maior que zero para recorrências finitas.')
+            elif recurrence_end_type == 'on_date':
+                if not recurrence_end_date:
+                    self.add_error('recurrence_end_date', 'Data final é obrigatória para recorrências que terminam em uma data.')
+                elif recurrence_start_date and recurrence_end_date < recurrence_start_date:
+                    self.add_error('recurrence_end_date', 'Data final deve ser maior ou igual à data da primeira parcela.')
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+
+class TransactionImportForm(forms.Form):
+    """Formulário para importação de extratos bancários (CSV ou OFX)."""
+    ENCODING_CHOICES = [
+        ('utf-8-sig', 'UTF-8'),
+        ('cp1252', 'Windows-1252 / Latin-1'),
+    ]
+    
+    account = forms.ModelChoiceField(
+        queryset=Account.objects.filter(is_closed=False),
+        label='Conta',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    statement_file = forms.FileField(
+        label='Arquivo do extrato',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.txt,.ofx,.qfx'})
+    )
+    file_format = forms.ChoiceField(
+        label='Formato',
+        choices=FORMAT_CHOICES,
+        initial='auto',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    encoding = forms.ChoiceField(
+        label='Codificação',
+        choices=ENCODING_CHOICES,
+        initial='utf-8-sig',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
@@ -0,0 +1,350 @@
+"""
+Importação de extratos bancários (CSV e OFX) em fluxo contínuo.
+
+O arquivo é lido linha a linha por um leitor (CSV ou OFX), cada linha é
+validada e identificada por um hash (import_fingerprint) e as transações são
+gravadas em lotes com bulk_create. Só um lote fica em memória por vez, então
+extratos com centenas de milhares de linhas são importados com memória limitada.
+
+Linhas já importadas na mesma conta são ignoradas: o hash é único por conta
+(constraint unique_transaction_import_fingerprint).
+"""
+import csv
+import hashlib
+import html
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+
+from . import ledger
+from .categorization import get_engine
+from .models import Transaction, normalize_text
+
+FORMAT_CHOICES = [
+    ('auto', 'Detectar pela extensão'),
+    ('csv', 'CSV'),
+    ('ofx', 'OFX'),
+]
+
+# Quantidade máxima de erros de linha guardados no relatório
+MAX_REPORTED_ERRORS = 100
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%Y%m%d')
+
+# Nomes aceitos no cabeçalho do CSV (sem acentos, em minúsculas)
+CSV_COLUMNS = {
+    'date': ('data', 'date', 'data lancamento', 'data do lancamento', 'data movimento'),
+    'description': ('descricao', 'description', 'historico', 'lancamento', 'memo'),
+    'value': ('valor', 'value', 'amount', 'quantia'),
+    'transaction_type': ('tipo', 'type', 'c/d', 'd/c'),
+    'reference': ('id', 'fitid', 'documento', 'doc', 'referencia'),
+}
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+class ImportLineError(ValueError):
+    """Linha do extrato que não pôde ser interpretada."""
+
+    def __init__(self, line_number, message):
+        super().__init__(f'Linha {line_number}: {message}')
+        self.line_number = line_number
+
+
+class ImportReport:
+    """Resumo de uma importação: contagens, erros de linha e vazão."""
+
+    def __init__(self):
+        self.created = 0
+        self.categorized = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.started_at = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, error):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(str(error))
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started_at
+
+    @property
+    def lines(self):
+        return self.created + self.skipped + self.error_count
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.lines} linha(s) em {self.elapsed:.1f}s ({self.lines_per_second:.0f} linhas/s): '
+            f'{self.created} importada(s) ({self.categorized} categorizada(s)), '
+            f'{self.skipped} já existente(s), {self.error_count} com erro'
+        )
+
+
+def detect_format(filename):
+    """Formato do extrato pela extensão do arquivo (OFX/QFX ou CSV)."""
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+
+def parse_amount(text):
+    """
+    Converte um valor de extrato em Decimal. Aceita os formatos 1.234,56 e
+    1,234.56, o prefixo R$, sinal negativo, parênteses e sufixos C/D.
+    """
+    text = (text or '').strip().upper().replace('R$', '').replace(' ', '')
+    negative = False
+    if text.startswith('(') and text.endswith(')'):
+        negative, text = True, text[1:-1]
+    if text.endswith('D'):
+        negative, text = True, text[:-1]
+    elif text.endswith('C'):
+        text = text[:-1]
+    if text.startswith('-') or text.endswith('-'):
+        negative, text = True, text.strip('-')
+    text = text.lstrip('+')
+
+    if ',' in text and '.' in text:
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    else:
+        text = text.replace(',', '.')
+
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError('valor inválido')
+    return -amount if negative else amount
+
+
+def parse_statement_date(text):
+    """Converte a data do extrato (inclusive DTPOSTED do OFX) em date."""
+    text = (text or '').strip()
+    if len(text) > 8 and text[:8].isdigit():
+        # OFX: AAAAMMDDHHMMSS[.XXX][-3:BRT]
+        text = text[:8]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError('data inválida')
+
+
+def read_csv(stream):
+    """
+    Lê um extrato CSV com cabeçalho, linha a linha. O separador (vírgula,
+    ponto e vírgula ou tabulação) é detectado pela primeira linha.
+    Gera (número da linha, campos brutos).
+    """
+    first_line = stream.readline()
+    delimiter = max((';', ',', '\t'), key=first_line.count)
+    reader = csv.reader(chain([first_line], stream), delimiter=delimiter)
+
+    header = [normalize_text(name) for name in next(reader, [])]
+    columns = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for index, name in enumerate(header):
+            if name in aliases:
+                columns[field] = index
+                break
+    missing = [field for field in ('date', 'value') if field not in columns]
+    if missing:
+        raise ValueError('Cabeçalho do CSV sem as colunas de data e valor.')
+
+    for line_number, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield line_number, {
+            field: row[index] if index < len(row) else ''
+            for field, index in columns.items()
+        }
+
+
+def read_ofx(stream):
+    """
+    Lê os lançamentos (<STMTTRN>) de um extrato OFX, em SGML (1.x) ou XML
+    (2.x), linha a linha. Gera (número da linha, campos brutos).
+    """
+    current = None
+    start_line = None
+    for line_number, line in enumerate(stream, start=1):
+        for closing, tag, text in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield start_line, {
+                        'date': current.get('DTPOSTED', ''),
+                        'value': current.get('TRNAMT', ''),
+                        'description': html.unescape(current.get('MEMO') or current.get('NAME', '')),
+                        'reference': current.get('FITID', ''),
+                    }
+                    current = None
+                elif not closing:
+                    current, start_line = {}, line_number
+            elif current is not None and not closing:
+                current[tag] = text.strip()
+
+
+READERS = {
+    'csv': read_csv,
+    'ofx': read_ofx,
+}
+
+
+def validate_line(line_number, raw):
+    """
+    Converte os campos brutos de uma linha nos valores da transação. O tipo
+    vem da coluna de tipo (C/D) quando houver, senão do sinal do valor.
+    """
+    try:
+        day = parse_statement_date(raw.get('date'))
+        amount = parse_amount(raw.get('value'))
+    except ValueError as error:
+        raise ImportLineError(line_number, str(error))
+    if not amount:
+        raise ImportLineError(line_number, 'valor zerado')
+
+    kind = normalize_text(raw.get('transaction_type'))[:1]
+    if kind in ('c', 'd'):
+        transaction_type = 'CR' if kind == 'c' else 'DB'
+    else:
+        transaction_type = 'CR' if amount > 0 else 'DB'
+
+    return {
+        'line_number': line_number,
+        'date': day,
+        'value': abs(amount).quantize(Decimal('0.01')),
+        'transaction_type': transaction_type,
+        'description': ' '.join((raw.get('description') or '').split())[:500],
+        'reference': (raw.get('reference') or '').strip(),
+    }
+
+
+def fingerprint_lines(account_id, lines):
+    """
+    Associa a cada linha o hash que a identifica na conta. Com identificador
+    do banco (FITID) o hash usa apenas ele; sem, usa data, valor, tipo e
+    descrição, mais a ordem entre linhas idênticas do arquivo (duas compras
+    iguais no mesmo dia continuam sendo duas transações).
+
+    O contador cresce com o número de linhas distintas sem FITID do arquivo
+    inteiro, não do lote: a ordem entre linhas idênticas precisa ser a mesma
+    em qualquer tamanho de lote, e o extrato não vem necessariamente ordenado
+    por data. Cada entrada guarda só o digest da chave (pouco mais de 100
+    bytes com o dicionário), alguns MB para um extrato de dezenas de
+    milhares de linhas.
+    """
+    occurrences = Counter()
+    for line in lines:
+        if line['reference']:
+            key = f"{account_id}|ref|{line['reference']}"
+        else:
+            key = '|'.join((
+                str(account_id),
+                line['date'].isoformat(),
+                str(line['value']),
+                line['transaction_type'],
+                normalize_text(line['description']),
+            ))
+            digest = hashlib.sha256(key.encode('utf-8')).digest()
+            occurrences[digest] += 1
+            key = f'{key}|{occurrences[digest]}'
+        yield hashlib.sha256(key.encode('utf-8')).hexdigest(), line
+
+
+def _validated_lines(rows, report):
+    for line_number, raw in rows:
+        try:
+            yield validate_line(line_number, raw)
+        except ImportLineError as error:
+            report.add_error(error)
+
+
+def _stored_fingerprints(account, chunk):
+    return set(Transaction.objects.filter(
+        account=account,
+        import_fingerprint__in=[fingerprint for fingerprint, _ in chunk],
+    ).values_list('import_fingerprint', flat=True))
+
+
+def _import_chunk(account, chunk, engine, report):
+    """
+    Grava um lote: ignora os hashes já importados (e os repetidos no próprio
+    lote), categoriza o restante pelas regras e insere tudo de uma vez.
+
+    Se outra importação da mesma conta gravar alguns desses hashes entre a
+    consulta e o INSERT, a constraint única rejeita o lote inteiro: os hashes
+    são consultados de novo e o lote é refeito só com o que ainda falta. Se a
+    nova consulta não trouxer nenhum hash a mais, a violação é de outra
+    constraint e o IntegrityError é propagado.
+    """
+    stored = _stored_fingerprints(account, chunk)
+    while True:
+        existing = set(stored)
+        transactions = []
+        for fingerprint, line in chunk:
+            if fingerprint in existing:
+                continue
+            existing.add(fingerprint)
+            transactions.append(Transaction(
+                account=account,
+                transaction_type=line['transaction_type'],
+                operation_type='simple',
+                value=line['value'],
+                description=line['description'],
+                buy_date=line['date'],
+                pay_date=line['date'],
+                status='registrado',
+                import_fingerprint=fingerprint,
+            ))
+        categorized = engine.categorize(transactions)
+        try:
+            with db_transaction.atomic(), ledger.deferred():
+                Transaction.objects.bulk_create(transactions)
+                ledger.record_transactions(transactions)
+        except IntegrityError:
+            found = _stored_fingerprints(account, chunk)
+            if found <= stored:
+                raise
+            stored = found
+            continue
+        break
+
+    report.categorized += categorized
+    report.created += len(transactions)
+    report.skipped += len(chunk) - len(transactions)
+
+
+def import_statement(account, stream, file_format, chunk_size=None):
+    """
+    Importa um extrato (stream de texto) na conta, em lotes de chunk_size
+    linhas (FINANCE_IMPORT_CHUNK_SIZE por padrão), aplicando as regras de
+    categorização. Cada lote é gravado atomicamente. Retorna um ImportReport.
+    """
+    chunk_size = chunk_size or getattr(settings, 'FINANCE_IMPORT_CHUNK_SIZE', 1000)
+    report = ImportReport()
+    engine = get_engine()
+
+    lines = fingerprint_lines(account.pk, _validated_lines(READERS[file_format](stream), report))
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(account, chunk, engine, report)
+
+    report.finish()
+    return report
@@ -0,0 +1,385 @@
+"""
+Manutenção incremental dos saldos consolidados por conta (AccountBalance).
+
+Cada transação contribui com seu valor com sinal (crédito positivo, débito
+negativo) para o total registrado da conta, se tiver pay_date, ou para o
+total pendente, caso contrário. Alterações são aplicadas como deltas com
+UPDATE ... SET total = total + delta, sem recalcular o histórico.
+
+Transações registradas também alimentam o resumo mensal da conta
+(AccountMonthSummary): créditos, débitos e resultado do mês de pay_date, e o
+saldo de fechamento desse mês e dos seguintes.
+
+Caminhos em lote podem agrupar vários deltas em uma única atualização por
+conta usando o gerenciador de contexto deferred().
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Account, AccountBalance, AccountMonthSummary, Transaction
+
+# Campos da transação que afetam o saldo consolidado
+ENTRY_FIELDS = ('account_id', 'value', 'transaction_type', 'pay_date')
+UPDATE_FIELD_NAMES = frozenset(ENTRY_FIELDS) | {'account'}
+
+ZERO = Decimal('0')
+
+_state = threading.local()
+
+
+def make_entry(account_id, value, transaction_type, pay_date):
+    """Representa a contribuição de uma transação para o saldo da sua conta."""
+    if account_id is None or value is None:
+        return None
+    signed = Decimal(value) if transaction_type == 'CR' else -Decimal(value)
+    return {
+        'account_id': account_id,
+        'signed_value': signed,
+        'is_credit': transaction_type == 'CR',
+        'pay_date': pay_date,
+    }
+
+
+def current_entry(transaction):
+    """Contribuição da transação com os valores atuais (em memória)."""
+    return make_entry(
+        transaction.account_id,
+        transaction.value,
+        transaction.transaction_type,
+        transaction.pay_date,
+    )
+
+
+def loaded_entry(transaction):
+    """Contribuição da transação com os valores carregados do banco."""
+    return make_entry(*(transaction.get_loaded_value(name) for name in ENTRY_FIELDS))
+
+
+def stored_entry(transaction_id):
+    """
+    Contribuição da transação com os valores gravados no banco, bloqueando a
+    linha até o fim da transação atual. Deve ser chamado dentro de um bloco
+    atômico.
+    """
+    values = Transaction.objects.select_for_update().filter(pk=transaction_id).values_list(*ENTRY_FIELDS).first()
+    return make_entry(*values) if values else None
+
+
+class _Deltas:
+    """
+    Deltas acumulados: (registrado, pendente) por conta e (créditos, débitos)
+    por conta e mês de pagamento.
+    """
+
+    def __init__(self):
+        self.accounts = defaultdict(lambda: [ZERO, ZERO])
+        self.months = defaultdict(lambda: defaultdict(lambda: [ZERO, ZERO]))
+
+    def collect(self, entry, sign):
+        if entry is None:
+            return
+        account_id = entry['account_id']
+        signed_value = sign * entry['signed_value']
+        totals = self.accounts[account_id]
+        if not entry['pay_date']:
+            totals[1] += signed_value
+            return
+        totals[0] += signed_value
+        month_totals = self.months[account_id][entry['pay_date'].replace(day=1)]
+        if entry['is_credit']:
+            month_totals[0] += signed_value
+        else:
+            month_totals[1] -= signed_value
+
+    def merge(self, other):
+        for account_id, (registered, pending) in other.accounts.items():
+            self.accounts[account_id][0] += registered
+            self.accounts[account_id][1] += pending
+        for account_id, months in other.months.items():
+            for month, (credits, debits) in months.items():
+                self.months[account_id][month][0] += credits
+                self.months[account_id][month][1] += debits
+
+
+def _apply_month(account_id, month, credits, debits, create_missing):
+    """
+    Aplica o delta de um mês ao resumo mensal e desloca o saldo de fechamento
+    dos meses seguintes. O mês ausente só é criado fora das exclusões.
+    """
+    net = credits - debits
+    summaries = AccountMonthSummary.objects.filter(account_id=account_id)
+    updated = summaries.filter(month=month).update(
+        credits=F('credits') + credits,
+        debits=F('debits') + debits,
+        net=F('net') + net,
+        closing_balance=F('closing_balance') + net,
+    )
+    if not updated and create_missing:
+        AccountMonthSummary.objects.create(
+            account_id=account_id,
+            month=month,
+            credits=credits,
+            debits=debits,
+            net=net,
+            closing_balance=_closing_balance_before(account_id, month) + net,
+        )
+    if net:
+        summaries.filter(month__gt=month).update(closing_balance=F('closing_balance') + net)
+
+
+def _apply(deltas, rebuild_missing):
+    """
+    Aplica os deltas por conta. Contas sem linha de saldo são reconstruídas
+    a partir das transações (saldo e resumos mensais), exceto em exclusões,
+    quando a própria conta pode estar sendo removida.
+    """
+    missing = []
+    for account_id, (registered, pending) in deltas.accounts.items():
+        if registered or pending:
+            updated = AccountBalance.objects.filter(account_id=account_id).update(
+                registered_total=F('registered_total') + registered,
+                pending_total=F('pending_total') + pending,
+            )
+            if not updated and account_id in rebuild_missing:
+                missing.append(account_id)
+                continue
+        for month, (credits, debits) in sorted(deltas.months[account_id].items()):
+            if credits or debits:
+                _apply_month(account_id, month, credits, debits, account_id in rebuild_missing)
+    if missing:
+        rebuild_account_balances(missing)
+        rebuild_month_summaries(missing)
+
+
+def _dispatch(deltas, rebuild_missing):
+    buffer = getattr(_state, 'buffer', None)
+    if buffer is not None:
+        # Dentro de deferred(): acumula para aplicar uma única vez por conta e mês
+        buffer['deltas'].merge(deltas)
+        buffer['rebuild_missing'].update(rebuild_missing)
+        return
+    _apply(deltas, rebuild_missing)
+
+
+def record_change(old_entry, new_entry):
+    """Registra a troca de uma contribuição por outra (None = inexistente)."""
+    deltas = _Deltas()
+    deltas.collect(old_entry, -1)
+    deltas.collect(new_entry, 1)
+    rebuild_missing = {new_entry['account_id']} if new_entry else set()
+    _dispatch(deltas, rebuild_missing)
+
+
+def record_transactions(transactions, sign=1):
+    """
+    Registra a inclusão (sign=1) ou remoção (sign=-1) de várias transações,
+    com uma atualização por conta envolvida. Usado pelos caminhos em lote
+    (bulk_create, bulk_update) que não passam por Transaction.save().
+    """
+    deltas = _Deltas()
+    for transaction in transactions:
+        deltas.collect(current_entry(transaction), sign)
+    _dispatch(deltas, set(deltas.accounts) if sign > 0 else set())
+
+
+def record_deleted(transaction):
+    """Remove a contribuição de uma transação excluída (via sinal post_delete)."""
+    deltas = _Deltas()
+    deltas.collect(loaded_entry(transaction), -1)
+    _dispatch(deltas, set())
+
+
+@contextmanager
+def deferred():
+    """
+    Agrupa todas as alterações de saldo feitas dentro do bloco e as aplica
+    ao final, com uma atualização por conta. Deve ser usado dentro de um
+    transaction.atomic() para que o saldo e as transações sejam gravados juntos.
+    """
+    if getattr(_state, 'buffer', None) is not None:
+        # Já existe um bloco externo acumulando
+        yield
+        return
+    _state.buffer = {'deltas': _Deltas(), 'rebuild_missing': set()}
+    try:
+        yield
+        buffer = _state.buffer
+    finally:
+        _state.buffer = None
+    _apply(buffer['deltas'], buffer['rebuild_missing'])
+
+
+def _signed_sum(condition):
+    return Coalesce(
+        Sum(
+            Case(
+                When(transaction_type='CR', then=F('value')),
+                default=-F('value'),
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ),
+            filter=condition,
+        ),
+        Value(ZERO),
+    )
+
+
+def compute_account_totals(account_ids=None):
+    """
+    Calcula, a partir das transações, os totais registrado e pendente de cada
+    conta com um único agregado agrupado. Retorna {account_id: (registrado, pendente)}.
+    """
+    accounts = Account.objects.all()
+    if account_ids is not None:
+        accounts = accounts.filter(id__in=account_ids)
+    totals = {account_id: (ZERO, ZERO) for account_id in accounts.values_list('id', flat=True)}
+
+    transactions = Transaction.objects.filter(account_id__in=list(totals))
+    for row in transactions.values('account_id').annotate(
+        registered=_signed_sum(Q(pay_date__isnull=False)),
+        pending=_signed_sum(Q(pay_date__isnull=True)),
+    ).order_by():
+        totals[row['account_id']] = (row['registered'], row['pending'])
+    return totals
+
+
+def rebuild_account_balances(account_ids=None):
+    """Reconstrói do zero os saldos consolidados das contas informadas (ou de todas)."""
+    totals = compute_account_totals(account_ids)
+    AccountBalance.objects.filter(account_id__in=list(totals)).delete()
+    AccountBalance.objects.bulk_create([
+        AccountBalance(account_id=account_id, registered_total=registered, pending_total=pending)
+        for account_id, (registered, pending) in totals.items()
+    ])
+    return len(totals)
+
+
+def verify_account_balances(account_ids=None):
+    """
+    Compara os saldos consolidados com os recalculados a partir das transações.
+    Contas sem linha de saldo equivalem a totais zerados.
+    Retorna uma lista de (account_id, armazenado, esperado) para as divergências.
+    """
+    expected = compute_account_totals(account_ids)
+    stored = {
+        balance.account_id: (balance.registered_total, balance.pending_total)
+        for balance in AccountBalance.objects.filter(account_id__in=list(expected))
+    }
+    return [
+        (account_id, stored.get(account_id, (ZERO, ZERO)), totals)
+        for account_id, totals in expected.items()
+        if stored.get(account_id, (ZERO, ZERO)) != totals
+    ]
+
+
+def shift_opening_balance(account_id, delta):
+    """Desloca os saldos de fechamento mensais após alteração do saldo de abertura."""
+    AccountMonthSummary.objects.filter(account_id=account_id).update(
+        closing_balance=F('closing_balance') + delta
+    )
+
+
+def _closing_balance_before(account_id, month):
+    """Saldo de fechamento do último mês anterior a `month` (ou o saldo de abertura)."""
+    closing_balance = AccountMonthSummary.objects.filter(
+        account_id=account_id,
+        month__lt=month,
+    ).order_by('-month').values_list('closing_balance', flat=True).first()
+    if closing_balance is None:
+        closing_balance = Account.objects.filter(pk=account_id).values_list(
+            'opening_balance', flat=True
+        ).get()
+    return closing_balance
+
+
+def balance_at(account, day):
+    """
+    Saldo registrado da conta ao final de `day`: fechamento do mês anterior
+    (um registro do resumo mensal) mais as transações pagas no próprio mês
+    até `day`, sem percorrer o histórico da conta.
+    """
+    month = day.replace(day=1)
+    return _closing_balance_before(account.pk, month) + Transaction.objects.filter(
+        account=account,
+        pay_date__gte=month,
+        pay_date__lte=day,
+    ).aggregate(total=_signed_sum(Q()))['total']
+
+
+def compute_month_summaries(account_ids=None):
+    """
+    Calcula, a partir das transações registradas, os resumos mensais das
+    contas com um único agregado agrupado por conta e mês.
+    Retorna {account_id: {mês: (créditos, débitos, resultado, saldo de fechamento)}}.
+    """
+    accounts = Account.objects.all()
+    if account_ids is not None:
+        accounts = accounts.filter(id__in=account_ids)
+    opening_balances = dict(accounts.values_list('id', 'opening_balance'))
+
+    rows = Transaction.objects.filter(
+        account_id__in=list(opening_balances),
+        pay_date__isnull=False,
+    ).annotate(month=TruncMonth('pay_date')).values('account_id', 'month').annotate(
+        credits=Coalesce(Sum('value', filter=Q(transaction_type='CR')), Value(ZERO)),
+        debits=Coalesce(Sum('value', filter=~Q(transaction_type='CR')), Value(ZERO)),
+    ).order_by('account_id', 'month')
+
+    summaries = {account_id: {} for account_id in opening_balances}
+    closing_balances = dict(opening_balances)
+    for row in rows:
+        net = row['credits'] - row['debits']
+        closing_balances[row['account_id']] += net
+        summaries[row['account_id']][row['month']] = (
+            row['credits'], row['debits'], net, closing_balances[row['account_id']],
+        )
+    return summaries
+
+
+def rebuild_month_summaries(account_ids=None):
+    """Reconstrói do zero os resumos mensais das contas informadas (ou de todas)."""
+    summaries = compute_month_summaries(account_ids)
+    AccountMonthSummary.objects.filter(account_id__in=list(summaries)).delete()
+    AccountMonthSummary.objects.bulk_create([
+        AccountMonthSummary(
+            account_id=account_id,
+            month=month,
+            credits=credits,
+            debits=debits,
+            net=net,
+            closing_balance=closing_balance,
+        )
+        for account_id, months in summaries.items()
+        for month, (credits, debits, net, closing_balance) in months.items()
+    ], batch_size=500)
+    return len(summaries)
+
+
+def verify_month_summaries(account_ids=None):
+    """
+    Compara os resumos mensais com os recalculados a partir das transações.
+    Meses sem movimento (zerados) são ignorados dos dois lados.
+    Retorna uma lista de (account_id, mês, armazenado, esperado) para as divergências.
+    """
+    expected = compute_month_summaries(account_ids)
+    stored = defaultdict(dict)
+    for summary in AccountMonthSummary.objects.filter(account_id__in=list(expected)):
+        stored[summary.account_id][summary.month] = (
+            summary.credits, summary.debits, summary.net, summary.closing_balance,
+        )
+
+    mismatches = []
+    for account_id, months in expected.items():
+        stored_months = stored[account_id]
+        for month in sorted(set(months) | set(stored_months)):
+            stored_values = stored_months.get(month)
+            expected_values = months.get(month)
+            if stored_values and expected_values is None and not any(stored_values[:3]):
+                continue
+            if stored_values != expected_values:
+                mismatches.append((account_id, month, stored_values, expected_values))
+    return mismatches
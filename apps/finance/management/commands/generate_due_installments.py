@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.finance.recurrence import generate_due_installments
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as parcelas pendentes que faltam nas recorrências ativas, com vencimento '
+        'até o horizonte informado, em lotes. Pode ser executado periodicamente (cron): '
+        'parcelas já gravadas não são duplicadas. Cada série continua da sua última '
+        'parcela gravada, então uma série parada há meses recebe todas as parcelas '
+        'atrasadas (e seus lançamentos no saldo) de uma vez: séries atrasadas além de '
+        '--catch-up-days são ignoradas e listadas, e as demais séries que receberam '
+        'mais de uma parcela são relatadas com a quantidade gerada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'FINANCE_DUE_INSTALLMENTS_DAYS', 30),
+            help='Horizonte em dias a partir de hoje (padrão: FINANCE_DUE_INSTALLMENTS_DAYS).',
+        )
+        parser.add_argument(
+            '--catch-up-days',
+            type=int,
+            default=getattr(settings, 'FINANCE_DUE_INSTALLMENTS_CATCH_UP_DAYS', 90),
+            help=(
+                'Atraso máximo em dias: séries cuja primeira parcela faltante venceu antes '
+                'disso não são geradas (padrão: FINANCE_DUE_INSTALLMENTS_CATCH_UP_DAYS).'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'FINANCE_DUE_INSTALLMENTS_BATCH_SIZE', 500),
+            help='Quantidade de séries por lote (padrão: FINANCE_DUE_INSTALLMENTS_BATCH_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        until = today + timedelta(days=options['days'])
+        since = today - timedelta(days=options['catch_up_days'])
+        series, created, conflicts, skipped = generate_due_installments(
+            until, since=since, batch_size=options['batch_size']
+        )
+
+        for root_id, count in created.items():
+            if count > 1 or options['verbosity'] >= 2:
+                self.stdout.write(f'Série #{root_id}: {count} parcela(s) gerada(s).')
+        if skipped:
+            ids = ', '.join(f'#{root_id}' for root_id in skipped)
+            self.stdout.write(self.style.WARNING(
+                f'{len(skipped)} série(s) com parcelas vencidas antes de {since:%d/%m/%Y} '
+                f'ignorada(s): {ids}. Gere as parcelas atrasadas manualmente.'
+            ))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f'{conflicts} lote(s) ignorado(s) por conflito com outra gravação; '
+                'serão processados na próxima execução.'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{series} série(s) verificada(s), {sum(created.values())} parcela(s) gerada(s) '
+            f'com vencimento até {until:%d/%m/%Y}.'
+        ))
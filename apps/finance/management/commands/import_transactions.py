@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.finance.importers import FORMAT_CHOICES, detect_format, import_statement
+from apps.finance.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Importa um extrato bancário (CSV ou OFX) em uma conta, em lotes, ignorando linhas já importadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Caminho do arquivo do extrato.')
+        parser.add_argument('--account', type=int, required=True, help='ID da conta de destino.')
+        parser.add_argument(
+            '--format',
+            choices=[value for value, _ in FORMAT_CHOICES],
+            default='auto',
+            help='Formato do arquivo (padrão: detectar pela extensão).',
+        )
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificação do arquivo (padrão: utf-8).')
+        parser.add_argument('--chunk-size', type=int, help='Linhas gravadas por lote (padrão: FINANCE_IMPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(pk=options['account'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Conta {options['account']} não encontrada.")
+
+        file_format = options['format']
+        if file_format == 'auto':
+            file_format = detect_format(options['path'])
+
+        try:
+            with open(options['path'], encoding=options['encoding'], errors='replace', newline='') as stream:
+                report = import_statement(account, stream, file_format, options['chunk_size'])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        for error in report.errors:
+            self.stdout.write(self.style.WARNING(error))
+        if report.error_count > len(report.errors):
+            self.stdout.write(self.style.WARNING(
+                f'... e mais {report.error_count - len(report.errors)} linha(s) com erro.'
+            ))
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from apps.finance import ledger
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói (ou apenas verifica) os saldos consolidados e os resumos mensais das contas a partir das transações.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Apenas compara os saldos armazenados com os recalculados, sem gravar.',
+        )
+        parser.add_argument(
+            '--account',
+            type=int,
+            action='append',
+            dest='accounts',
+            help='Restringe a uma conta (pode ser repetido).',
+        )
+
+    def handle(self, *args, **options):
+        account_ids = options['accounts']
+
+        if options['verify']:
+            mismatches = ledger.verify_account_balances(account_ids)
+            for account_id, stored, expected in mismatches:
+                self.stdout.write(self.style.WARNING(
+                    f'Conta {account_id}: armazenado {stored}, esperado {expected}'
+                ))
+            month_mismatches = ledger.verify_month_summaries(account_ids)
+            for account_id, month, stored, expected in month_mismatches:
+                self.stdout.write(self.style.WARNING(
+                    f'Conta {account_id}, mês {month:%m/%Y}: armazenado {stored}, esperado {expected}'
+                ))
+            if mismatches or month_mismatches:
+                self.stdout.write(self.style.ERROR(
+                    f'{len(mismatches)} conta(s) com saldo divergente e '
+                    f'{len(month_mismatches)} resumo(s) mensal(is) divergente(s).'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS('Todos os saldos estão corretos.'))
+            return
+
+        with db_transaction.atomic():
+            count = ledger.rebuild_account_balances(account_ids)
+            ledger.rebuild_month_summaries(account_ids)
+        self.stdout.write(self.style.SUCCESS(f'Saldos e resumos mensais reconstruídos para {count} conta(s).'))
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from apps.finance.forecast import build_forecast, find_balance_alerts
+from apps.finance.models import BalanceAlert
+
+ALERT_FIELDS = (
+    'kind',
+    'minimum_balance',
+    'current_balance',
+    'lowest_balance',
+    'lowest_balance_date',
+    'breach_date',
+    'updated_at',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica o saldo atual e o previsto de todas as contas abertas e grava '
+        'alertas para as que estão ou ficarão abaixo do saldo mínimo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=getattr(settings, 'FINANCE_FORECAST_MONTHS', 12),
+            help='Horizonte da previsão em meses (padrão: FINANCE_FORECAST_MONTHS).',
+        )
+
+    def handle(self, *args, **options):
+        # Previsão de todas as contas com um número fixo de consultas
+        forecast = build_forecast(months=options['months'])
+        alerts = find_balance_alerts(forecast)
+
+        # Substitui os alertas em lote: atualiza os existentes, cria os novos
+        # e remove os das contas que voltaram ao normal (ou foram encerradas)
+        with db_transaction.atomic():
+            BalanceAlert.objects.exclude(account_id__in=[alert.account_id for alert in alerts]).delete()
+            BalanceAlert.objects.bulk_create(
+                alerts,
+                update_conflicts=True,
+                unique_fields=['account'],
+                update_fields=ALERT_FIELDS,
+            )
+
+        for alert in alerts:
+            self.stdout.write(self.style.WARNING(
+                f'Conta {alert.account_id}: {alert.get_kind_display().lower()} '
+                f'({alert.minimum_balance}) em {alert.breach_date:%d/%m/%Y}, '
+                f'menor saldo {alert.lowest_balance} em {alert.lowest_balance_date:%d/%m/%Y}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(forecast.accounts)} conta(s) verificada(s) até {forecast.end:%d/%m/%Y}, '
+            f'{len(alerts)} com alerta de saldo mínimo.'
+        ))
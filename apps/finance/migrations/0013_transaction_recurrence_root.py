@@ -0,0 +1,19 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_add_recurrence_interrupted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='recurrence_root',
+            field=models.ForeignKey(blank=True, help_text='Primeira parcela da série (a própria transação, se for a raiz)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='series_installments', to='finance.transaction', verbose_name='Raiz da recorrência'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated migration to backfill recurrence_root on existing recurrence chains
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def backfill_recurrence_root(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    # Carrega a estrutura das recorrências uma única vez e resolve as raízes em memória
+    nodes = {
+        node['id']: node
+        for node in Transaction.objects.filter(is_recurring=True).values(
+            'id', 'parent_transaction_id', 'parent_type'
+        )
+    }
+    roots = {}
+
+    def find_root(transaction_id):
+        path = []
+        node = nodes[transaction_id]
+        while (
+            node['id'] not in roots
+            and node['parent_type'] == 'recurring'
+            and node['parent_transaction_id'] in nodes
+        ):
+            path.append(node['id'])
+            node = nodes[node['parent_transaction_id']]
+        root = roots.get(node['id'], node['id'])
+        for visited in path + [node['id']]:
+            roots[visited] = root
+        return root
+
+    series = defaultdict(list)
+    for transaction_id in nodes:
+        series[find_root(transaction_id)].append(transaction_id)
+
+    # Uma atualização por série (em lotes, para respeitar o limite de parâmetros)
+    for root_id, ids in series.items():
+        for start in range(0, len(ids), 500):
+            Transaction.objects.filter(id__in=ids[start:start + 500]).update(
+                recurrence_root_id=root_id
+            )
+
+
+def clear_recurrence_root(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    Transaction.objects.update(recurrence_root=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_transaction_recurrence_root'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_recurrence_root, clear_recurrence_root),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_backfill_recurrence_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('registered_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total registrado')),
+                ('pending_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total pendente')),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='finance.account', verbose_name='Conta')),
+            ],
+            options={
+                'verbose_name': 'Saldo da conta',
+                'verbose_name_plural': 'Saldos das contas',
+            },
+        ),
+    ]
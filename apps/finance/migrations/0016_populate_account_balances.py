@@ -0,0 +1,59 @@
+# Generated migration to populate the consolidated account balances
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def signed_sum(condition):
+    return Coalesce(
+        Sum(
+            Case(
+                When(transaction_type='CR', then=F('value')),
+                default=-F('value'),
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ),
+            filter=condition,
+        ),
+        Value(Decimal('0')),
+    )
+
+
+def populate_account_balances(apps, schema_editor):
+    Account = apps.get_model('finance', 'Account')
+    AccountBalance = apps.get_model('finance', 'AccountBalance')
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    totals = {
+        row['account_id']: row
+        for row in Transaction.objects.values('account_id').annotate(
+            registered=signed_sum(Q(pay_date__isnull=False)),
+            pending=signed_sum(Q(pay_date__isnull=True)),
+        ).order_by()
+    }
+    AccountBalance.objects.bulk_create([
+        AccountBalance(
+            account_id=account_id,
+            registered_total=totals.get(account_id, {}).get('registered', Decimal('0')),
+            pending_total=totals.get(account_id, {}).get('pending', Decimal('0')),
+        )
+        for account_id in Account.objects.values_list('id', flat=True)
+    ], batch_size=500)
+
+
+def clear_account_balances(apps, schema_editor):
+    AccountBalance = apps.get_model('finance', 'AccountBalance')
+    AccountBalance.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_accountbalance'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_account_balances, clear_account_balances),
+    ]
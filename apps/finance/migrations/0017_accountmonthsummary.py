@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0016_populate_account_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountMonthSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('month', models.DateField(help_text='Primeiro dia do mês', verbose_name='Mês')),
+                ('credits', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Créditos')),
+                ('debits', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Débitos')),
+                ('net', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Resultado')),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Saldo de fechamento')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_summaries', to='finance.account', verbose_name='Conta')),
+            ],
+            options={
+                'verbose_name': 'Resumo mensal da conta',
+                'verbose_name_plural': 'Resumos mensais das contas',
+                'ordering': ('account', 'month'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountmonthsummary',
+            constraint=models.UniqueConstraint(fields=('account', 'month'), name='unique_account_month_summary'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated migration to populate the monthly account summaries
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def populate_account_month_summaries(apps, schema_editor):
+    Account = apps.get_model('finance', 'Account')
+    AccountMonthSummary = apps.get_model('finance', 'AccountMonthSummary')
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    closing_balances = dict(Account.objects.values_list('id', 'opening_balance'))
+    rows = Transaction.objects.filter(pay_date__isnull=False).annotate(
+        month=TruncMonth('pay_date')
+    ).values('account_id', 'month').annotate(
+        credits=Coalesce(Sum('value', filter=Q(transaction_type='CR')), Value(Decimal('0'))),
+        debits=Coalesce(Sum('value', filter=~Q(transaction_type='CR')), Value(Decimal('0'))),
+    ).order_by('account_id', 'month')
+
+    summaries = []
+    for row in rows:
+        net = row['credits'] - row['debits']
+        closing_balances[row['account_id']] += net
+        summaries.append(AccountMonthSummary(
+            account_id=row['account_id'],
+            month=row['month'],
+            credits=row['credits'],
+            debits=row['debits'],
+            net=net,
+            closing_balance=closing_balances[row['account_id']],
+        ))
+    AccountMonthSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+def clear_account_month_summaries(apps, schema_editor):
+    AccountMonthSummary = apps.get_model('finance', 'AccountMonthSummary')
+    AccountMonthSummary.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0017_accountmonthsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_account_month_summaries, clear_account_month_summaries),
+    ]
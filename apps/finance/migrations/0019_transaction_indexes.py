@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0018_populate_account_month_summaries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'pay_date', 'id'], name='transaction_account_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('pay_date__isnull', True)), fields=['account', 'due_date'], name='transaction_account_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['parent_transaction', 'parent_type'], name='transaction_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['parent_type', 'recurrence_sequence'], name='transaction_type_sequence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-buy_date', '-created_at', '-id'], name='transaction_list_order_idx'),
+        ),
+    ]
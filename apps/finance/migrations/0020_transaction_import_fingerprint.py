@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0019_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='import_fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Hash da linha do extrato importado, usado para não importar a mesma linha duas vezes', max_length=64, null=True, verbose_name='Identificador de importação'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('account', 'import_fingerprint'), name='unique_transaction_import_fingerprint'),
+        ),
+    ]
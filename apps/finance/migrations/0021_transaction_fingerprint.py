@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0020_transaction_import_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash de conta, data da operação, valor, tipo e descrição normalizada', max_length=64, verbose_name='Impressão digital'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['fingerprint'], name='transaction_fingerprint_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated migration to populate the duplicate-detection fingerprint
+
+import hashlib
+import unicodedata
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def normalize_text(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def build_fingerprint(account_id, buy_date, value, transaction_type, description):
+    if value is not None:
+        value = Decimal(str(value)).quantize(Decimal('0.01'))
+    key = '|'.join((
+        str(account_id),
+        str(buy_date),
+        str(value),
+        str(transaction_type),
+        normalize_text(description),
+    ))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def populate_fingerprints(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    # Lê e grava em lotes para não carregar a tabela inteira em memória
+    batch = []
+    rows = Transaction.objects.order_by().values_list(
+        'id', 'account_id', 'buy_date', 'value', 'transaction_type', 'description'
+    ).iterator(chunk_size=2000)
+    for transaction_id, *fields in rows:
+        batch.append(Transaction(id=transaction_id, fingerprint=build_fingerprint(*fields)))
+        if len(batch) >= 500:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0021_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_fingerprints, migrations.RunPython.noop),
+    ]
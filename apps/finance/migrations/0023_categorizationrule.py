@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0022_populate_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorizationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('pattern', models.CharField(blank=True, help_text='A descrição deve conter este texto. Vazio: qualquer descrição.', max_length=200, verbose_name='Texto da descrição')),
+                ('min_value', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Valor mínimo')),
+                ('max_value', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Valor máximo')),
+                ('transaction_type', models.CharField(blank=True, choices=[('', 'Qualquer'), ('CR', 'Crédito'), ('DB', 'Débito')], max_length=2, verbose_name='Tipo')),
+                ('priority', models.IntegerField(default=0, help_text='Entre regras que atendem à mesma transação, vence a de maior prioridade', verbose_name='Prioridade')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Ativa')),
+                ('account', models.ForeignKey(blank=True, help_text='Vazio: qualquer conta', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to='finance.account', verbose_name='Conta')),
+                ('beneficiary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to='finance.beneficiary', verbose_name='Beneficiário')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to='finance.category', verbose_name='Categoria')),
+            ],
+            options={
+                'verbose_name': 'Regra de categorização',
+                'verbose_name_plural': 'Regras de categorização',
+                'ordering': ('-priority', 'name'),
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0023_categorizationrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('kind', models.CharField(choices=[('current', 'Abaixo do mínimo'), ('projected', 'Ficará abaixo do mínimo')], max_length=10, verbose_name='Tipo')),
+                ('minimum_balance', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Saldo mínimo')),
+                ('current_balance', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Saldo atual')),
+                ('lowest_balance', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Menor saldo previsto')),
+                ('lowest_balance_date', models.DateField(verbose_name='Data do menor saldo')),
+                ('breach_date', models.DateField(verbose_name='Data em que fica abaixo do mínimo')),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance_alert', to='finance.account', verbose_name='Conta')),
+            ],
+            options={
+                'verbose_name': 'Alerta de saldo mínimo',
+                'verbose_name_plural': 'Alertas de saldo mínimo',
+                'ordering': ('breach_date', 'account'),
+            },
+        ),
+    ]
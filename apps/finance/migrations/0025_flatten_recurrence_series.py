@@ -0,0 +1,66 @@
+# Generated migration to link every recurring installment directly to its series root
+
+from django.db import migrations
+from django.db.models import Count, F
+
+
+def flatten_series(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    # Cadeia (cada parcela aponta para a anterior) -> estrela (todas apontam para a raiz)
+    Transaction.objects.filter(
+        parent_type='recurring',
+        recurrence_root__isnull=False,
+    ).exclude(recurrence_root=F('id')).update(parent_transaction=F('recurrence_root'))
+
+    # Séries com sequências repetidas são renumeradas (2, 3, ... pela ordem de
+    # sequência e id) antes da constraint unique_recurrence_root_sequence
+    duplicated_roots = set(
+        Transaction.objects.filter(recurrence_root__isnull=False)
+        .values('recurrence_root_id', 'recurrence_sequence')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+        .values_list('recurrence_root_id', flat=True)
+    )
+    for root_id in duplicated_roots:
+        children = list(
+            Transaction.objects.filter(recurrence_root_id=root_id)
+            .exclude(id=root_id)
+            .order_by('recurrence_sequence', 'id')
+        )
+        # Duas fases: sequências negativas (únicas) e depois as definitivas
+        Transaction.objects.filter(id__in=[child.id for child in children]).update(
+            recurrence_sequence=-F('id')
+        )
+        for sequence, child in enumerate(children, start=2):
+            child.recurrence_sequence = sequence
+        Transaction.objects.bulk_update(children, ['recurrence_sequence'])
+
+
+def chain_series(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+
+    # Volta à cadeia: cada parcela aponta para a anterior na sequência
+    previous_by_root = {}
+    children = Transaction.objects.filter(
+        parent_type='recurring',
+        recurrence_root__isnull=False,
+    ).exclude(recurrence_root=F('id')).order_by('recurrence_root_id', 'recurrence_sequence', 'id')
+    changed = []
+    for child in children:
+        child.parent_transaction_id = previous_by_root.get(child.recurrence_root_id, child.recurrence_root_id)
+        previous_by_root[child.recurrence_root_id] = child.id
+        changed.append(child)
+    Transaction.objects.bulk_update(changed, ['parent_transaction'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0024_balancealert'),
+    ]
+
+    operations = [
+        migrations.RunPython(flatten_series, chain_series),
+    ]
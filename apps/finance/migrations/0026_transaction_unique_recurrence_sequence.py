@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0025_flatten_recurrence_series'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('recurrence_root', 'recurrence_sequence'), name='unique_recurrence_root_sequence'),
+        ),
+    ]
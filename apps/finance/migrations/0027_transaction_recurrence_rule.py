@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0026_transaction_unique_recurrence_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='recurrence_rule',
+            field=models.CharField(blank=True, help_text='Regra RFC 5545 que substitui tipo, intervalo e dias da semana. Ex: FREQ=WEEKLY;BYDAY=MO,WE,FR ou FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1 (último dia útil do mês)', max_length=255, verbose_name='Regra de recorrência (RRULE)'),
+        ),
+    ]
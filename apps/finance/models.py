@@ -1,7 +1,15 @@
-from django.db import models
-from dateutil.relativedelta import relativedelta
-from datetime import timedelta
+from django.db import IntegrityError, models
+from django.db import transaction as db_transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from contextlib import nullcontext
+from decimal import Decimal
+import hashlib
 import re
+import unicodedata
+
+from .recurrence_rules import legacy_rule, next_occurrence
 
 # Create your models here.
 class BaseModel(models.Model):
@@ -72,6 +80,116 @@ class Account(BaseModel):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda o saldo de abertura carregado para detectar alterações no save()
+        if 'opening_balance' in field_names:
+            instance._loaded_opening_balance = instance.opening_balance
+        return instance
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+
+        loaded_opening_balance = getattr(self, '_loaded_opening_balance', None)
+        opening_balance_delta = None
+        if loaded_opening_balance is not None and self.opening_balance != loaded_opening_balance:
+            opening_balance_delta = Decimal(self.opening_balance) - loaded_opening_balance
+
+        with db_transaction.atomic() if opening_balance_delta else nullcontext():
+            super().save(*args, **kwargs)
+            if opening_balance_delta:
+                # Os saldos de fechamento mensais incluem o saldo de abertura
+                ledger.shift_opening_balance(self.pk, opening_balance_delta)
+
+        self._loaded_opening_balance = self.opening_balance
+
+
+class AccountBalance(BaseModel):
+    """
+    Saldo consolidado de uma conta, mantido incrementalmente a cada alteração
+    de transação (ver ledger.py). O saldo atual é opening_balance + registered_total.
+    """
+    account = models.OneToOneField(
+        Account,
+        on_delete=models.CASCADE,
+        related_name='balance',
+        verbose_name='Conta'
+    )
+    registered_total = models.DecimalField('Total registrado', max_digits=15, decimal_places=2, default=0)
+    pending_total = models.DecimalField('Total pendente', max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Saldo da conta'
+        verbose_name_plural = 'Saldos das contas'
+
+    def __str__(self):
+        return f"{self.account} - {self.registered_total}"
+
+
+class AccountMonthSummary(BaseModel):
+    """
+    Resumo mensal das transações registradas de uma conta (pelo mês de
+    pay_date), mantido incrementalmente junto com AccountBalance (ver ledger.py).
+    O saldo de fechamento inclui o saldo de abertura da conta, então o saldo
+    em qualquer data parte do fechamento do mês anterior.
+    """
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name='month_summaries',
+        verbose_name='Conta'
+    )
+    month = models.DateField('Mês', help_text='Primeiro dia do mês')
+    credits = models.DecimalField('Créditos', max_digits=15, decimal_places=2, default=0)
+    debits = models.DecimalField('Débitos', max_digits=15, decimal_places=2, default=0)
+    net = models.DecimalField('Resultado', max_digits=15, decimal_places=2, default=0)
+    closing_balance = models.DecimalField('Saldo de fechamento', max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Resumo mensal da conta'
+        verbose_name_plural = 'Resumos mensais das contas'
+        ordering = ('account', 'month')
+        constraints = [
+            models.UniqueConstraint(fields=('account', 'month'), name='unique_account_month_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} - {self.month:%m/%Y}"
+
+
+class BalanceAlert(BaseModel):
+    """
+    Alerta de saldo mínimo de uma conta, gravado pelo comando
+    scan_minimum_balances: a conta já está abaixo do saldo mínimo ou ficará
+    abaixo dele dentro do horizonte da previsão (ver forecast.py).
+    """
+    KIND_CHOICES = [
+        ('current', 'Abaixo do mínimo'),
+        ('projected', 'Ficará abaixo do mínimo'),
+    ]
+
+    account = models.OneToOneField(
+        Account,
+        on_delete=models.CASCADE,
+        related_name='balance_alert',
+        verbose_name='Conta'
+    )
+    kind = models.CharField('Tipo', max_length=10, choices=KIND_CHOICES)
+    minimum_balance = models.DecimalField('Saldo mínimo', max_digits=15, decimal_places=2)
+    current_balance = models.DecimalField('Saldo atual', max_digits=15, decimal_places=2)
+    lowest_balance = models.DecimalField('Menor saldo previsto', max_digits=15, decimal_places=2)
+    lowest_balance_date = models.DateField('Data do menor saldo')
+    breach_date = models.DateField('Data em que fica abaixo do mínimo')
+
+    class Meta:
+        verbose_name = 'Alerta de saldo mínimo'
+        verbose_name_plural = 'Alertas de saldo mínimo'
+        ordering = ('breach_date', 'account')
+
+    def __str__(self):
+        return f"{self.account} - {self.get_kind_display()} em {self.breach_date:%d/%m/%Y}"
+
 
 class Beneficiary(BaseModel):
     full_name = models.CharField('Nome completo', max_length=200)
@@ -108,6 +226,128 @@ class Category(BaseModel):
         return f"{self.category} - {self.subcategory}"
 
 
+class CategorizationRuleQuerySet(models.QuerySet):
+    """
+    Marca updated_at nas alterações em lote (ações e list_editable do admin),
+    que não passam pelo save(): o motor de categorização em cache só é
+    recompilado quando a contagem ou o maior updated_at das regras muda.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        if 'updated_at' not in fields:
+            fields.append('updated_at')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
+class CategorizationRule(BaseModel):
+    """
+    Regra de categorização automática: quando a descrição contém o texto
+    (sem diferença de caixa e acentos) e as demais condições preenchidas
+    são atendidas, define a categoria e/ou o beneficiário da transação.
+    As regras são compiladas em um único autômato (ver categorization.py).
+    """
+    TRANSACTION_TYPE_CHOICES = [
+        ('', 'Qualquer'),
+        ('CR', 'Crédito'),
+        ('DB', 'Débito'),
+    ]
+
+    name = models.CharField('Nome', max_length=100)
+    pattern = models.CharField(
+        'Texto da descrição',
+        max_length=200,
+        blank=True,
+        help_text='A descrição deve conter este texto. Vazio: qualquer descrição.'
+    )
+    min_value = models.DecimalField('Valor mínimo', max_digits=15, decimal_places=2, null=True, blank=True)
+    max_value = models.DecimalField('Valor máximo', max_digits=15, decimal_places=2, null=True, blank=True)
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='categorization_rules',
+        verbose_name='Conta',
+        help_text='Vazio: qualquer conta'
+    )
+    transaction_type = models.CharField(
+        'Tipo',
+        max_length=2,
+        choices=TRANSACTION_TYPE_CHOICES,
+        blank=True,
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='categorization_rules',
+        verbose_name='Categoria'
+    )
+    beneficiary = models.ForeignKey(
+        Beneficiary,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='categorization_rules',
+        verbose_name='Beneficiário'
+    )
+    priority = models.IntegerField(
+        'Prioridade',
+        default=0,
+        help_text='Entre regras que atendem à mesma transação, vence a de maior prioridade'
+    )
+    is_active = models.BooleanField('Ativa', default=True)
+
+    objects = CategorizationRuleQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Regra de categorização'
+        verbose_name_plural = 'Regras de categorização'
+        ordering = ('-priority', 'name')
+
+    def __str__(self):
+        return self.name
+
+
+def normalize_text(value):
+    """Texto em minúsculas, sem acentos e com espaços simples."""
+    value = value or ''
+    if not value.isascii():
+        value = unicodedata.normalize('NFKD', value)
+        value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+class TransactionQuerySet(models.QuerySet):
+    """Mantém o fingerprint das transações gravadas em lote, que não passam pelo save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.fingerprint = obj.compute_fingerprint()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if Transaction.FINGERPRINT_FIELDS.intersection(fields):
+            for obj in objs:
+                obj.fingerprint = obj.compute_fingerprint()
+            if 'fingerprint' not in fields:
+                fields.append('fingerprint')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Transaction(BaseModel):
     # Campos de estrutura hierárquica
     PARENT_TYPE_CHOICES = [
@@ -132,6 +372,15 @@ class Transaction(BaseModel):
         blank=True,
         null=True
     )
+    recurrence_root = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='series_installments',
+        verbose_name='Raiz da recorrência',
+        help_text='Primeira parcela da série (a própria transação, se for a raiz)'
+    )
     is_split = models.BooleanField('Faz parte de um rateio', default=False)
     is_split_parent = models.BooleanField('É a transação principal de um rateio', default=False)
     split_sequence = models.IntegerField('Ordem do item no rateio', null=True, blank=True)
@@ -245,6 +494,16 @@ class Transaction(BaseModel):
         blank=True,
         help_text='Ex: 1,3,5 para segunda, quarta, sexta'
     )
+    recurrence_rule = models.CharField(
+        'Regra de recorrência (RRULE)',
+        max_length=255,
+        blank=True,
+        help_text=(
+            'Regra RFC 5545 que substitui tipo, intervalo e dias da semana. '
+            'Ex: FREQ=WEEKLY;BYDAY=MO,WE,FR ou FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1 '
+            '(último dia útil do mês)'
+        )
+    )
     recurrence_monthly_day = models.IntegerField(
         'Dia específico do mês (DEPRECATED)',
         null=True,
@@ -285,75 +544,223 @@ class Transaction(BaseModel):
         help_text='Se marcado, a recorrência não gerará mais parcelas automaticamente'
     )
     
+    # Importação de extratos bancários
+    import_fingerprint = models.CharField(
+        'Identificador de importação',
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='Hash da linha do extrato importado, usado para não importar a mesma linha duas vezes'
+    )
+    
+    # Detecção de duplicidade
+    fingerprint = models.CharField(
+        'Impressão digital',
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        help_text='Hash de conta, data da operação, valor, tipo e descrição normalizada'
+    )
+    
+    objects = TransactionQuerySet.as_manager()
+    
+    # Campos que compõem o fingerprint
+    FINGERPRINT_FIELDS = frozenset({
+        'account', 'account_id', 'buy_date', 'value', 'transaction_type', 'description',
+    })
+    
+    # Campos cujo valor carregado do banco é guardado em memória, para que o
+    # save() decida o que fazer a partir da diferença, sem um SELECT prévio
+    TRACKED_FIELDS = (
+        'account_id',
+        'value',
+        'transaction_type',
+        'pay_date',
+        'description',
+        'is_recurring',
+        'recurrence_type',
+        'recurrence_interval',
+        'recurrence_rule',
+        'recurrence_start_date',
+        'recurrence_end_type',
+        'recurrence_end_date',
+        'recurrence_end_count',
+        'recurrence_sequence',
+    )
+    
     class Meta:
         verbose_name = 'Transação'
         verbose_name_plural = 'Transações'
         ordering = ('-buy_date', '-created_at')
+        indexes = [
+            # Extrato: transações executadas da conta, paginadas por (pay_date, id)
+            models.Index(fields=('account', 'pay_date', 'id'), name='transaction_account_paid_idx'),
+            # Extrato: transações pendentes da conta, ordenadas por vencimento
+            models.Index(
+                fields=('account', 'due_date'),
+                condition=models.Q(pay_date__isnull=True),
+                name='transaction_account_due_idx',
+            ),
+            # Filhas de compostas, transferências e recorrências (todas ligadas à raiz)
+            models.Index(fields=('parent_transaction', 'parent_type'), name='transaction_parent_idx'),
+            models.Index(fields=('parent_type', 'recurrence_sequence'), name='transaction_type_sequence_idx'),
+            # Listagem: paginação por (-buy_date, -created_at, -id)
+            models.Index(fields=('-buy_date', '-created_at', '-id'), name='transaction_list_order_idx'),
+            # Detecção de duplicidade por igualdade do fingerprint
+            models.Index(fields=('fingerprint',), name='transaction_fingerprint_idx'),
+        ]
+        constraints = [
+            # Uma linha de extrato só pode ser importada uma vez por conta
+            models.UniqueConstraint(
+                fields=('account', 'import_fingerprint'),
+                name='unique_transaction_import_fingerprint',
+            ),
+            # Cada parcela ocupa uma posição da série
+            models.UniqueConstraint(
+                fields=('recurrence_root', 'recurrence_sequence'),
+                name='unique_recurrence_root_sequence',
+            ),
+        ]
     
     def __str__(self):
         desc = self.description or f"Transação #{self.id}"
         return f"{desc} - {self.value} ({self.get_transaction_type_display()})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._snapshot_tracked_fields(fields)
+    
+    def _snapshot_tracked_fields(self, update_fields=None):
+        """
+        Guarda os valores atuais dos campos acompanhados (apenas os carregados).
+        Com update_fields, atualiza somente os campos efetivamente gravados.
+        """
+        if update_fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        names = self.TRACKED_FIELDS if update_fields is None else [
+            name for name in self.TRACKED_FIELDS if name in update_fields
+        ]
+        for name in names:
+            if name in self.__dict__:
+                self._loaded_values[name] = self.__dict__[name]
+    
+    def has_field_changed(self, name):
+        """
+        Verifica se um campo acompanhado mudou desde que a transação foi
+        carregada do banco (ou salva pela última vez).
+        Transações ainda não salvas são consideradas alteradas em todos os campos.
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return True
+        # Campo adiado (deferred) e nunca atribuído: não mudou
+        if name not in self.__dict__:
+            return False
+        if name not in loaded_values:
+            return True
+        return self.__dict__[name] != loaded_values[name]
+    
+    def get_changed_fields(self):
+        """Retorna os campos acompanhados que mudaram desde o carregamento."""
+        return [name for name in self.TRACKED_FIELDS if self.has_field_changed(name)]
+    
+    def get_loaded_value(self, name):
+        """Retorna o valor de um campo acompanhado como foi carregado do banco."""
+        loaded_values = getattr(self, '_loaded_values', None) or {}
+        if name in loaded_values:
+            return loaded_values[name]
+        return getattr(self, name)
+    
+    @staticmethod
+    def build_fingerprint(account_id, buy_date, value, transaction_type, description):
+        """
+        Hash que identifica transações equivalentes: mesma conta, data da
+        operação, valor, tipo e descrição (sem diferença de caixa, acentos
+        e espaços).
+        """
+        if value is not None:
+            value = Decimal(str(value)).quantize(Decimal('0.01'))
+        key = '|'.join((
+            str(account_id),
+            str(buy_date),
+            str(value),
+            str(transaction_type),
+            normalize_text(description),
+        ))
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    
+    def compute_fingerprint(self):
+        """Fingerprint da transação com os valores atuais (em memória)."""
+        return Transaction.build_fingerprint(
+            self.account_id, self.buy_date, self.value, self.transaction_type, self.description
+        )
+    
+    def get_possible_duplicates(self):
+        """Outras transações com o mesmo fingerprint (consulta indexada por igualdade)."""
+        return Transaction.objects.filter(
+            fingerprint=self.compute_fingerprint()
+        ).exclude(pk=self.pk).order_by('id')
+    
     def is_composite_parent(self):
         """Verifica se esta transação é pai de uma transação composta."""
         return self.child_transactions.filter(parent_type='composite').exists()
     
     def has_next_recurring_installment(self):
-        """Verifica se existe próxima parcela recorrente gerada."""
-        return self.child_transactions.filter(parent_type='recurring').exists()
+        """Verifica se existe próxima parcela recorrente gerada (sequence maior que a atual)."""
+        return self.get_series_installments().filter(
+            recurrence_sequence__gt=self.get_current_installment()
+        ).exists()
     
-    def get_next_pending_installment(self):
-        """Retorna a próxima parcela pendente (sem pay_date), se existir."""
-        return self.child_transactions.filter(
-            parent_type='recurring',
-            pay_date__isnull=True
+    def get_next_installment(self):
+        """Retorna a parcela seguinte a esta na série (sequence + 1), se já gerada."""
+        return self.get_series_installments().filter(
+            recurrence_sequence=self.get_current_installment() + 1
         ).first()
     
+    def get_next_pending_installment(self):
+        """Retorna a próxima parcela pendente (sem pay_date) após esta, se existir."""
+        return self.get_series_installments().filter(
+            recurrence_sequence__gt=self.get_current_installment(),
+            pay_date__isnull=True,
+        ).order_by('recurrence_sequence').first()
+    
+    def get_series_installments(self):
+        """
+        Retorna todas as parcelas da série (inclusive a raiz).
+        Todas as parcelas apontam direto para a raiz (recurrence_root e
+        parent_transaction), portanto é uma única consulta indexada.
+        """
+        root_id = self.recurrence_root_id or self.get_recurring_parent().pk
+        return Transaction.objects.filter(recurrence_root_id=root_id)
+    
     def get_pending_children(self):
-        """Retorna todas as parcelas filhas pendentes (sem pay_date)."""
-        return self.child_transactions.filter(
-            parent_type='recurring',
+        """Retorna todas as parcelas pendentes (sem pay_date) da série, exceto esta."""
+        return self.get_series_installments().exclude(pk=self.pk).filter(
             pay_date__isnull=True
         )
     
     def get_registered_children(self):
-        """Retorna todas as parcelas filhas registradas (com pay_date)."""
-        return self.child_transactions.filter(
-            parent_type='recurring',
+        """Retorna todas as parcelas registradas (com pay_date) da série, exceto esta."""
+        return self.get_series_installments().exclude(pk=self.pk).filter(
             pay_date__isnull=False
         )
     
     def get_all_pending_installments(self):
         """
-        Retorna todas as parcelas pendentes da recorrência (não apenas filhas diretas).
-        Busca recursivamente todas as parcelas da recorrência que são pendentes.
+        Retorna todas as parcelas pendentes da recorrência, ordenadas por
+        recurrence_sequence.
         """
-        parent = self.get_recurring_parent()
-        
-        # Lista para armazenar todas as parcelas pendentes
-        pending_list = []
-        
-        # Se a raiz é pendente, adiciona
-        if not parent.pay_date:
-            pending_list.append(parent)
-        
-        # Busca recursivamente todas as filhas pendentes
-        def get_all_children(transaction):
-            children = transaction.child_transactions.filter(
-                parent_type='recurring'
-            )
-            for child in children:
-                if not child.pay_date:
-                    pending_list.append(child)
-                get_all_children(child)
-        
-        get_all_children(parent)
-        
-        # Retorna um queryset ordenado por recurrence_sequence
-        if pending_list:
-            ids = [t.id for t in pending_list]
-            return Transaction.objects.filter(id__in=ids).order_by('recurrence_sequence')
-        return Transaction.objects.none()
+        return self.get_series_installments().filter(
+            pay_date__isnull=True,
+        ).order_by('recurrence_sequence')
     
     def is_next_pending_installment(self):
         """
@@ -362,105 +769,101 @@ class Transaction(BaseModel):
         - É pendente (sem pay_date) e é a primeira pendente na sequência, OU
         - É a raiz e não tem parcelas pendentes, OU
         - É a última registrada e não há parcelas pendentes (será a próxima a gerar)
+        
+        Custa no máximo duas consultas, independente do tamanho da série.
         """
         if not self.is_recurring:
             return False
         
-        parent = self.get_recurring_parent()
-        
-        # Busca todas as parcelas pendentes da recorrência (não apenas filhas diretas)
-        all_pending = parent.get_all_pending_installments()
-        has_pending = all_pending.exists()
+        # Primeira parcela pendente da recorrência (não apenas filhas diretas)
+        first_pending = self.get_all_pending_installments().first()
         
         # Se há parcelas pendentes, prioriza elas
-        if has_pending:
+        if first_pending:
             # Se a transação é registrada (tem pay_date), não é a próxima pendente
             if self.pay_date:
                 return False
             
             # Se a transação é pendente, verifica se é a primeira pendente na sequência
-            first_pending = all_pending.first()
             return self.id == first_pending.id
         
         # Se não há parcelas pendentes
         # Se a transação é pendente e é a raiz, é a próxima
         if not self.pay_date:
-            if self.parent_type != 'recurring':
-                return True
-            return False
+            return self.parent_type != 'recurring'
         
         # Se a transação é registrada e não há parcelas pendentes
-        # Verifica se é a última registrada
-        if self.pay_date:
-            # Busca todas as parcelas registradas da recorrência
-            registered_list = []
-            if parent.pay_date:
-                registered_list.append(parent)
-            
-            def get_all_registered_children(transaction):
-                children = transaction.child_transactions.filter(
-                    parent_type='recurring'
-                )
-                for child in children:
-                    if child.pay_date:
-                        registered_list.append(child)
-                    get_all_registered_children(child)
-            
-            get_all_registered_children(parent)
-            
-            if registered_list:
-                # Ordena por recurrence_sequence e pega a última
-                registered_list.sort(key=lambda t: t.get_current_installment(), reverse=True)
-                last_registered = registered_list[0]
-                return self.id == last_registered.id
-            # Se não há parcelas registradas, a raiz é a última
-            if self.parent_type != 'recurring':
-                return True
+        # Verifica se é a última registrada (maior número de parcela; sem sequence = 1)
+        last_registered = self.get_series_installments().filter(
+            pay_date__isnull=False,
+        ).order_by(
+            Coalesce('recurrence_sequence', Value(1)).desc(), 'id'
+        ).values_list('id', flat=True).first()
         
-        return False
+        if last_registered is not None:
+            return self.id == last_registered
+        # Se não há parcelas registradas, a raiz é a última
+        return self.parent_type != 'recurring'
     
     def get_subsequent_installments(self):
         """Retorna todas as parcelas subsequentes (com sequence maior que a atual)."""
         current_sequence = self.get_current_installment()
-        parent = self.get_recurring_parent()
         
-        # Busca todas as parcelas filhas do parent com sequence maior
-        return parent.child_transactions.filter(
-            parent_type='recurring',
+        # Busca todas as parcelas da série com sequence maior
+        return self.get_series_installments().filter(
             recurrence_sequence__gt=current_sequence
         ).order_by('recurrence_sequence')
     
     def reorganize_sequences(self):
-        """Reorganiza as sequências das parcelas filhas para manter continuidade."""
+        """
+        Reorganiza as sequências das parcelas filhas para manter continuidade.
+        
+        As parcelas renumeradas são gravadas em lote (UPDATE ... CASE) em duas
+        fases: primeiro com sequências negativas e depois com as definitivas,
+        para não violar a unicidade de (raiz, sequência) no meio da troca.
+        """
         if not self.is_recurring:
             return
         
         parent = self.get_recurring_parent()
-        children = parent.child_transactions.filter(
-            parent_type='recurring'
-        ).order_by('recurrence_sequence', 'id')
+        base_description = parent.get_base_description()
+        total = parent.get_total_installments()
         
-        # A primeira parcela é o pai (sequence 1 ou None), então as filhas começam em 2
-        sequence = 2
-        for child in children:
-            if child.recurrence_sequence != sequence:
-                child.recurrence_sequence = sequence
-                # Atualiza descrição também
-                base_description = parent.get_base_description()
-                total = parent.get_total_installments()
-                if total:
-                    child.description = f"{base_description} - {sequence:02d}/{total:02d}"
-                else:
-                    child.description = f"{base_description} - {sequence}"
-                child.save(update_fields=['recurrence_sequence', 'description'])
-            sequence += 1
+        with db_transaction.atomic():
+            # Serializa com a geração de parcelas da mesma série
+            parent.lock_series()
+            children = parent.get_series_installments().exclude(
+                pk=parent.pk
+            ).order_by('recurrence_sequence', 'id')
+            
+            # A primeira parcela é o pai (sequence 1 ou None), então as filhas começam em 2
+            changed = []
+            for sequence, child in enumerate(children, start=2):
+                if child.recurrence_sequence != sequence:
+                    child.recurrence_sequence = sequence
+                    # Atualiza descrição também
+                    if total:
+                        child.description = f"{base_description} - {sequence:02d}/{total:02d}"
+                    else:
+                        child.description = f"{base_description} - {sequence}"
+                    changed.append(child)
+            if not changed:
+                return
+            
+            Transaction.objects.filter(pk__in=[child.pk for child in changed]).update(
+                recurrence_sequence=-F('recurrence_sequence')
+            )
+            Transaction.objects.bulk_update(changed, ['recurrence_sequence', 'description'])
     
     def get_recurring_parent(self):
         """Retorna a transação pai da recorrência (primeira parcela)."""
         # Se não tem parent_transaction ou parent_type não é 'recurring', é a própria raiz
-        if not self.parent_transaction or self.parent_type != 'recurring':
+        if not self.parent_transaction_id or self.parent_type != 'recurring':
             return self
-        # Segue a cadeia de parent_transaction
+        # Ponteiro desnormalizado: uma única consulta pela chave primária
+        if self.recurrence_root_id and self.recurrence_root_id != self.pk:
+            return self.recurrence_root
+        # Fallback para linhas sem o ponteiro: segue a cadeia de parent_transaction
         return self.parent_transaction.get_recurring_parent()
     
     def promote_first_child_to_root(self):
@@ -486,14 +889,19 @@ class Transaction(BaseModel):
         # Remove parent_transaction e parent_type da primeira parcela
         first_child.parent_transaction = None
         first_child.parent_type = None
-        first_child.save(update_fields=['parent_transaction', 'parent_type'])
+        first_child.recurrence_root = first_child
+        first_child.save(update_fields=['parent_transaction', 'parent_type', 'recurrence_root'])
+        
+        # Toda a série passa a apontar para a nova raiz (uma única atualização)
+        Transaction.objects.filter(recurrence_root=self).exclude(pk=self.pk).update(
+            recurrence_root=first_child
+        )
         
         # Atualiza todas as outras parcelas filhas para referenciarem a primeira
-        other_children = children.exclude(id=first_child.id)
-        for child in other_children:
-            child.parent_transaction = first_child
-            child.parent_type = 'recurring'
-            child.save(update_fields=['parent_transaction', 'parent_type'])
+        children.exclude(id=first_child.id).update(
+            parent_transaction=first_child,
+            parent_type='recurring',
+        )
         
         return first_child
     
@@ -532,31 +940,52 @@ class Transaction(BaseModel):
             total = parent.recurrence_end_count
             return current < total
         
+        # Termina em uma data: a próxima parcela não pode vencer depois dela
+        if parent.recurrence_end_type == 'on_date':
+            next_due_date = self.get_next_due_date()
+            return bool(
+                next_due_date
+                and parent.recurrence_end_date
+                and next_due_date <= parent.recurrence_end_date
+            )
+        
         return False
     
+    def get_recurrence_anchor(self):
+        """Data de referência (DTSTART) da regra da série: o vencimento da primeira parcela."""
+        parent = self.get_recurring_parent()
+        return parent.due_date or parent.recurrence_start_date or parent.pay_date or parent.buy_date
+    
+    def get_recurrence_rule(self):
+        """
+        Regra RRULE da série: a regra gravada na raiz ou, sem ela, a
+        equivalente ao tipo, intervalo e dias da semana.
+        """
+        parent = self.get_recurring_parent()
+        if parent.recurrence_rule:
+            return parent.recurrence_rule
+        return legacy_rule(
+            parent.recurrence_type,
+            parent.recurrence_interval,
+            parent.recurrence_weekdays,
+            self.get_recurrence_anchor(),
+        )
+    
     def get_next_due_date(self):
-        """Calcula a próxima data de vencimento baseado no tipo de recorrência e interval."""
-        if not self.is_recurring or not self.recurrence_type:
+        """
+        Próxima data de vencimento: a primeira ocorrência da regra da série
+        posterior ao vencimento desta parcela (ver recurrence_rules).
+        """
+        if not self.is_recurring:
             return None
         
         # Usa due_date atual ou pay_date como base
         base_date = self.due_date or self.pay_date or self.buy_date
-        if not base_date:
+        rule = self.get_recurrence_rule()
+        anchor = self.get_recurrence_anchor()
+        if not base_date or not rule or not anchor:
             return None
-        
-        parent = self.get_recurring_parent()
-        interval = parent.recurrence_interval or 1
-        
-        if parent.recurrence_type == 'weekly':
-            return base_date + timedelta(weeks=interval)
-        elif parent.recurrence_type == 'monthly':
-            return base_date + relativedelta(months=interval)
-        elif parent.recurrence_type == 'yearly':
-            return base_date + relativedelta(years=interval)
-        elif parent.recurrence_type == 'daily':
-            return base_date + timedelta(days=interval)
-        
-        return None
+        return next_occurrence(rule, anchor, base_date)
     
     def get_base_description(self):
         """Retorna a descrição base sem sufixo de parcela."""
@@ -594,8 +1023,12 @@ class Transaction(BaseModel):
         else:
             return f"{base_description} - {current}"
     
-    def generate_next_installment(self):
-        """Gera a próxima parcela da recorrência."""
+    def build_next_installment(self):
+        """
+        Monta (sem gravar) a próxima parcela da recorrência, ou None se não
+        houver próxima. Usado por generate_next_installment() e pela geração
+        em lote (recurrence.generate_next_installments).
+        """
         if not self.can_generate_next():
             return None
         
@@ -618,20 +1051,24 @@ class Transaction(BaseModel):
         else:
             next_description = f"{base_description} - {next_sequence}"
         
-        # Cria nova transação filha
-        next_transaction = Transaction.objects.create(
-            parent_transaction=self,
+        # Monta a nova transação filha, ligada direto à raiz da série
+        return Transaction(
+            parent_transaction=parent,
             parent_type='recurring',
+            recurrence_root=parent,
             is_recurring=True,
             recurrence_type=parent.recurrence_type,
             recurrence_interval=parent.recurrence_interval,
+            recurrence_weekdays=parent.recurrence_weekdays,
+            recurrence_rule=parent.recurrence_rule,
             recurrence_start_date=parent.recurrence_start_date,
             recurrence_end_type=parent.recurrence_end_type,
+            recurrence_end_date=parent.recurrence_end_date,
             recurrence_end_count=parent.recurrence_end_count,
             recurrence_sequence=next_sequence,
-            account=self.account,
-            beneficiary=self.beneficiary,
-            category=self.category,
+            account_id=self.account_id,
+            beneficiary_id=self.beneficiary_id,
+            category_id=self.category_id,
             transaction_type=self.transaction_type,
             operation_type=self.operation_type,
             value=self.value,
@@ -641,52 +1078,150 @@ class Transaction(BaseModel):
             status='pendente',
             description=next_description,
         )
+    
+    def lock_series(self):
+        """
+        Bloqueia a linha da raiz da série (SELECT ... FOR UPDATE) até o fim da
+        transação atual, serializando a geração de parcelas entre requisições
+        concorrentes. Deve ser chamado dentro de um bloco atômico.
+        """
+        root_id = self.recurrence_root_id or self.get_recurring_parent().pk
+        list(Transaction.objects.select_for_update().filter(pk=root_id).values_list('pk', flat=True))
+    
+    def generate_next_installment(self):
+        """
+        Gera a próxima parcela da recorrência, se ainda não existir.
         
+        Seguro sob concorrência: com a raiz da série bloqueada, verifica se a
+        próxima parcela já existe antes de criá-la; se outra conexão a criou
+        mesmo assim (bancos sem bloqueio de linha), a constraint
+        unique_recurrence_root_sequence rejeita a duplicata e nada é gerado.
+        Retorna a parcela criada ou None.
+        """
+        with db_transaction.atomic():
+            self.lock_series()
+            if self.has_next_recurring_installment():
+                return None
+            next_transaction = self.build_next_installment()
+            if next_transaction is None:
+                return None
+            try:
+                with db_transaction.atomic():
+                    next_transaction.save()
+            except IntegrityError:
+                return None
         return next_transaction
     
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        Com a guarda do saldo consolidado (ver save()), o UPDATE só casa se a
+        linha ainda tiver os valores carregados. Se outra conexão a alterou, a
+        contribuição gravada é lida com a linha bloqueada e o UPDATE é refeito
+        sem a condição.
+        """
+        guard = getattr(self, '_ledger_guard', None)
+        if guard and values and base_qs.filter(pk=pk_val, **guard)._update(values) > 0:
+            return True
+        if guard:
+            from . import ledger
+            self._stored_entry = ledger.stored_entry(pk_val)
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+    
     def save(self, *args, **kwargs):
-        # Define status automaticamente baseado em pay_date
-        old_pay_date = None
-        if self.pk:
-            try:
-                old_instance = Transaction.objects.get(pk=self.pk)
-                old_pay_date = old_instance.pay_date
-            except Transaction.DoesNotExist:
-                pass
+        from . import ledger
         
+        # Diferenças em relação ao que foi carregado (sem consultar o banco)
+        pay_date_changed = self.has_field_changed('pay_date')
+        recurrence_toggled = self.has_field_changed('is_recurring')
+        description_changed = self.has_field_changed('description')
+        is_new = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        ledger_changed = (
+            any(self.has_field_changed(name) for name in ledger.ENTRY_FIELDS)
+            and (update_fields is None or ledger.UPDATE_FIELD_NAMES.intersection(update_fields))
+        )
+        
+        # Define status automaticamente baseado em pay_date
         if self.pay_date:
             self.status = 'registrado'
         else:
             self.status = 'pendente'
         
-        # Salva a transação primeiro
-        super().save(*args, **kwargs)
+        # Mantém o fingerprint, inclusive em gravações parciais dos seus campos
+        self.fingerprint = self.compute_fingerprint()
+        if update_fields is not None and self.FINGERPRINT_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'fingerprint'}
         
-        # Se pay_date está preenchido e é uma transação recorrente, verifica se precisa gerar próxima parcela
-        if self.is_recurring and self.pay_date:
-            # Verifica se já existe próxima parcela gerada
-            existing_next = self.child_transactions.filter(
-                parent_type='recurring'
-            ).first()
-            
+        # Mantém o ponteiro para a raiz da recorrência
+        assign_own_root = False
+        if not self.is_recurring:
+            self.recurrence_root = None
+        elif not self.recurrence_root_id:
+            if self.parent_transaction_id and self.parent_type == 'recurring':
+                self.recurrence_root_id = self.get_recurring_parent().pk
+            elif self.pk:
+                self.recurrence_root_id = self.pk
+            else:
+                # Nova raiz: o ponteiro só pode ser gravado depois do INSERT
+                assign_own_root = True
+        
+        # Salva a transação primeiro, junto com o saldo consolidado da conta
+        # Só abre um bloco atômico quando o saldo consolidado também é gravado
+        with db_transaction.atomic() if ledger_changed else nullcontext():
+            if ledger_changed and not is_new:
+                # O UPDATE só casa se a linha ainda tiver os valores carregados
+                # (ver _do_update), sem consulta prévia no caso comum
+                self._ledger_guard = {name: self.get_loaded_value(name) for name in ledger.ENTRY_FIELDS}
+            try:
+                super().save(*args, **kwargs)
+            finally:
+                self._ledger_guard = None
+            if ledger_changed:
+                if is_new:
+                    old_entry = None
+                elif '_stored_entry' in self.__dict__:
+                    # Outra conexão alterou a transação: parte do que estava gravado
+                    old_entry = self.__dict__.pop('_stored_entry')
+                else:
+                    old_entry = ledger.loaded_entry(self)
+                ledger.record_change(old_entry, ledger.current_entry(self))
+        
+        if assign_own_root:
+            Transaction.objects.filter(pk=self.pk).update(recurrence_root=self.pk)
+            self.recurrence_root_id = self.pk
+        
+        # Se pay_date foi preenchido ou alterado e é uma transação recorrente,
+        # verifica se precisa gerar próxima parcela
+        if self.is_recurring and self.pay_date and (pay_date_changed or recurrence_toggled):
             # Gera próxima parcela se:
-            # 1. Não existe próxima parcela gerada
+            # 1. Não existe próxima parcela gerada (verificado com a série bloqueada)
             # 2. Pode gerar próxima (não está interrompida, não excedeu limite, etc)
             # 3. pay_date foi preenchido (seja pela primeira vez ou alterado)
-            if not existing_next and self.can_generate_next():
+            if self.can_generate_next():
                 self.generate_next_installment()
         
-        # Atualiza descrição com número da parcela se necessário (apenas na primeira vez)
-        # Evita atualizar se já foi atualizado ou se está sendo atualizado via update_fields
-        if self.is_recurring and not kwargs.get('update_fields') and self.pk:
-            new_description = self.get_description_with_installment()
+        # Atualiza descrição com número da parcela se necessário (apenas quando a
+        # descrição ou a recorrência mudaram). Evita atualizar se está sendo
+        # atualizado via update_fields
+        if (
+            self.is_recurring
+            and not kwargs.get('update_fields')
+            and (description_changed or recurrence_toggled)
+        ):
             # Só atualiza se a descrição atual não tem o formato de parcela
             current_desc = self.description or ""
             # Verifica se já tem formato de parcela (contém " - " seguido de número)
             has_installment_pattern = re.search(r' - \d+(\/\d+)?$', current_desc)
             
             if not has_installment_pattern:
-                # Atualiza usando update para evitar recursão
-                Transaction.objects.filter(pk=self.pk).update(description=new_description)
+                new_description = self.get_description_with_installment()
                 # Atualiza o objeto em memória
                 self.description = new_description
+                self.fingerprint = self.compute_fingerprint()
+                # Atualiza usando update para evitar recursão
+                Transaction.objects.filter(pk=self.pk).update(
+                    description=new_description,
+                    fingerprint=self.fingerprint,
+                )
+        
+        self._snapshot_tracked_fields(kwargs.get('update_fields'))
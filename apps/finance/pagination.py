@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+class KeysetPage:
+    """Uma página de resultados obtida por paginação por chave (keyset)."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginação por chave (cursor) sobre uma ordenação estável.
+
+    Ao contrário da paginação por OFFSET, cada página é buscada com um filtro
+    "depois da última chave vista" + LIMIT, então o custo não cresce com a
+    profundidade da página. A ordenação deve terminar em uma coluna única
+    (normalmente 'id'). Valores nulos são tratados como os menores possíveis,
+    isto é, aparecem por último em ordenações decrescentes.
+
+    Os cursores são opacos para o cliente (JSON codificado em base64).
+    """
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.page_size = page_size
+        # Lista de (campo do model, decrescente?)
+        self.keys = []
+        for name in ordering:
+            descending = name.startswith('-')
+            field = queryset.model._meta.get_field(name.lstrip('-'))
+            self.keys.append((field, descending))
+
+    def _order_by(self, reverse):
+        """
+        Ordenação no sentido de leitura. NULLS FIRST/LAST só é emitido nas
+        colunas que aceitam nulo: nas demais, um ORDER BY simples continua
+        casando com os índices declarados sem essa cláusula.
+        """
+        order = []
+        for field, descending in self.keys:
+            if descending != reverse:
+                order.append(F(field.name).desc(nulls_last=True) if field.null else F(field.name).desc())
+            else:
+                order.append(F(field.name).asc(nulls_first=True) if field.null else F(field.name).asc())
+        return order
+
+    def _seek_filter(self, values, reverse):
+        """
+        Monta o filtro que seleciona as linhas posteriores à chave informada,
+        no sentido de leitura (invertido quando reverse=True).
+        """
+        condition = None
+        for (field, descending), value in reversed(list(zip(self.keys, values))):
+            name = field.name
+            decreasing = descending != reverse
+            if value is None:
+                # Nada é menor que NULL; no sentido crescente, qualquer valor é maior
+                beyond = Q(pk__in=[]) if decreasing else Q(**{f'{name}__isnull': False})
+                equal = Q(**{f'{name}__isnull': True})
+            else:
+                beyond = Q(**{f'{name}__{"lt" if decreasing else "gt"}': value})
+                if decreasing and field.null:
+                    beyond |= Q(**{f'{name}__isnull': True})
+                equal = Q(**{name: value})
+            condition = beyond if condition is None else beyond | (equal & condition)
+        return condition
+
+    def _key_of(self, obj):
+        return [getattr(obj, field.attname) for field, _ in self.keys]
+
+    def encode_cursor(self, direction, values):
+        serialized = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ]
+        raw = json.dumps([direction, serialized], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Decodifica um cursor. Retorna (direção, valores) ou None se o cursor
+        estiver ausente ou for inválido.
+        """
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, raw_values = json.loads(raw)
+            if direction not in (self.NEXT, self.PREVIOUS) or len(raw_values) != len(self.keys):
+                return None
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, _), value in zip(self.keys, raw_values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+        return direction, values
+
+    def rows_before(self, cursor):
+        """
+        Retorna um filtro com as linhas que ficam antes da página apontada por
+        um cursor de avanço (inclusive a linha do cursor), ou None quando a
+        página começa no início da ordenação ou o cursor é de retorno.
+        Útil para calcular valores acumulados até o início da página.
+        """
+        decoded = self.decode_cursor(cursor)
+        if decoded is None or decoded[0] != self.NEXT:
+            return None
+        return ~self._seek_filter(decoded[1], reverse=False)
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor)
+        direction, values = decoded if decoded else (self.NEXT, None)
+        reverse = direction == self.PREVIOUS
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, reverse))
+        # Busca uma linha a mais para saber se existe outra página no mesmo sentido
+        rows = list(queryset.order_by(*self._order_by(reverse))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            # O cursor de origem garante que há linhas no sentido oposto à leitura
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(self.NEXT, self._key_of(rows[-1]))
+            if (has_more and reverse) or (values is not None and not reverse):
+                previous_cursor = self.encode_cursor(self.PREVIOUS, self._key_of(rows[0]))
+
+        return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
@@ -0,0 +1,389 @@
+import heapq
+from collections import defaultdict
+from itertools import dropwhile, islice, takewhile
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import ledger
+from .models import Transaction
+from .recurrence_rules import iter_occurrences
+
+
+def _installment_number(node):
+    """Número da parcela a partir dos valores crus (mesma regra de get_current_installment)."""
+    return node['recurrence_sequence'] or 1
+
+
+def resolve_transaction_rows(transactions):
+    """
+    Resolve, para uma página de transações, todas as informações de
+    recorrência e de composição usadas pela listagem, com um número
+    constante de consultas (independente do tamanho da página e da
+    profundidade das cadeias de recorrência), usando o ponteiro recurrence_root.
+
+    Anexa a cada transação:
+    - is_composite_root: se é a transação pai de uma composta
+    - recurring_root: raiz da recorrência (a própria transação se não for filha)
+    - has_next_installment: se já existe a próxima parcela gerada
+    - is_next_pending: mesmo resultado de is_next_pending_installment()
+    - total_installments: total de parcelas se finita, ou None
+
+    Retorna a própria lista de transações.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return transactions
+
+    page_ids = [t.id for t in transactions]
+    composite_parent_ids = set(
+        Transaction.objects.filter(
+            parent_transaction_id__in=page_ids,
+            parent_type='composite',
+        ).order_by().values_list('parent_transaction_id', flat=True)
+    )
+
+    recurring_rows = [t for t in transactions if t.is_recurring]
+    root_ids = {
+        t.id: t.recurrence_root_id or t.get_recurring_parent().pk
+        for t in recurring_rows
+    }
+    roots = Transaction.objects.in_bulk(set(root_ids.values()))
+
+    # Todas as parcelas das séries presentes na página, em uma única consulta
+    # indexada por recurrence_root e apenas com as colunas necessárias.
+    series_by_root = defaultdict(list)
+    for node in Transaction.objects.filter(recurrence_root_id__in=roots).order_by().values(
+        'id', 'pay_date', 'recurrence_sequence', 'recurrence_root_id',
+    ):
+        series_by_root[node['recurrence_root_id']].append(node)
+
+    for transaction in transactions:
+        transaction.is_composite_root = transaction.id in composite_parent_ids
+        transaction.recurring_root = transaction
+        transaction.has_next_installment = False
+        transaction.is_next_pending = False
+        transaction.total_installments = None
+
+        root_id = root_ids.get(transaction.id)
+        if root_id is None:
+            continue
+
+        root = roots.get(root_id, transaction)
+        transaction.recurring_root = root
+        if root.recurrence_end_type == 'after_count':
+            transaction.total_installments = root.recurrence_end_count
+
+        series = series_by_root[root_id]
+        current = transaction.get_current_installment()
+        transaction.has_next_installment = any(
+            _installment_number(node) > current for node in series
+        )
+
+        pending = [node for node in series if not node['pay_date']]
+        if pending:
+            first_pending = min(pending, key=lambda node: (_installment_number(node), node['id']))
+            transaction.is_next_pending = (
+                not transaction.pay_date and transaction.id == first_pending['id']
+            )
+        elif not transaction.pay_date:
+            transaction.is_next_pending = transaction.parent_type != 'recurring'
+        else:
+            registered = [node for node in series if node['pay_date']]
+            if registered:
+                last_registered = max(registered, key=_installment_number)
+                transaction.is_next_pending = transaction.id == last_registered['id']
+
+    return transactions
+
+
+def generate_next_installments(transactions):
+    """
+    Equivalente em lote a generate_next_installment() para transações
+    recorrentes recém-registradas: bloqueia as raízes das séries, resolve as
+    próximas parcelas já existentes com uma consulta e insere as novas
+    parcelas com um único bulk_create. Se o lote colidir com parcelas criadas
+    por outra conexão, cada parcela é gerada individualmente (ignorando as
+    que já existem). Retorna a lista de parcelas criadas.
+    """
+    recurring = [t for t in transactions if t.is_recurring and t.pay_date]
+    if not recurring:
+        return []
+
+    with db_transaction.atomic():
+        return _generate_next_installments(recurring)
+
+
+def _generate_next_installments(recurring):
+    root_ids = {t.id: t.recurrence_root_id or t.get_recurring_parent().pk for t in recurring}
+    roots = Transaction.objects.select_for_update().in_bulk(set(root_ids.values()))
+    # Última sequência gravada de cada série: há próxima parcela se for maior que a atual
+    last_sequences = dict(
+        Transaction.objects.filter(recurrence_root_id__in=roots)
+        .values('recurrence_root_id')
+        .annotate(last=Max(Coalesce('recurrence_sequence', Value(1))))
+        .order_by()
+        .values_list('recurrence_root_id', 'last')
+    )
+
+    installments = []
+    pending = []
+    for transaction in recurring:
+        if last_sequences.get(root_ids[transaction.id], 1) > transaction.get_current_installment():
+            continue
+        root = roots.get(root_ids[transaction.id])
+        if root is not None and transaction.parent_type == 'recurring':
+            # Evita uma consulta por transação em get_recurring_parent()
+            transaction.recurrence_root = root
+        next_transaction = transaction.build_next_installment()
+        if next_transaction is not None:
+            installments.append(next_transaction)
+            pending.append(transaction)
+
+    try:
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(installments)
+    except IntegrityError:
+        return [
+            installment for installment in (t.generate_next_installment() for t in pending)
+            if installment is not None
+        ]
+    ledger.record_transactions(installments)
+    return installments
+
+
+def iter_recurrence_dates(root, last):
+    """
+    Gera (sequência, vencimento) das parcelas ainda não gravadas da série de
+    `root`, a partir da última parcela gravada (`last`), com as mesmas datas
+    que generate_next_installment() usaria. Não consulta o banco.
+
+    Em recorrências infinitas o gerador não termina: quem consome limita a
+    janela de datas.
+    """
+    if not root.is_recurring or root.recurrence_interrupted:
+        return
+    total = until = None
+    if root.recurrence_end_type == 'after_count':
+        total = root.recurrence_end_count
+    elif root.recurrence_end_type == 'on_date':
+        until = root.recurrence_end_date
+        if until is None:
+            return
+    elif root.recurrence_end_type != 'never':
+        return
+
+    rule = root.get_recurrence_rule()
+    anchor = root.get_recurrence_anchor()
+    base_date = last.due_date or last.pay_date or last.buy_date
+    if not rule or not anchor or not base_date:
+        return
+
+    sequence = last.get_current_installment()
+    for due_date in iter_occurrences(rule, anchor, base_date):
+        if (total is not None and sequence >= total) or (until is not None and due_date > until):
+            return
+        sequence += 1
+        yield sequence, due_date
+
+
+def iter_virtual_installments(root, last):
+    """
+    Parcelas virtuais (não salvas, is_virtual=True) da série de `root` após
+    `last`, com os mesmos valores que generate_next_installment() gravaria.
+    """
+    base_description = root.get_base_description()
+    total = root.get_total_installments()
+    for sequence, due_date in iter_recurrence_dates(root, last):
+        if total:
+            description = f"{base_description} - {sequence:02d}/{total:02d}"
+        else:
+            description = f"{base_description} - {sequence}"
+        installment = Transaction(
+            parent_transaction=root,
+            parent_type='recurring',
+            recurrence_root=root,
+            is_recurring=True,
+            recurrence_type=root.recurrence_type,
+            recurrence_interval=root.recurrence_interval,
+            recurrence_weekdays=root.recurrence_weekdays,
+            recurrence_rule=root.recurrence_rule,
+            recurrence_start_date=root.recurrence_start_date,
+            recurrence_end_type=root.recurrence_end_type,
+            recurrence_end_date=root.recurrence_end_date,
+            recurrence_end_count=root.recurrence_end_count,
+            recurrence_sequence=sequence,
+            account_id=last.account_id,
+            beneficiary_id=last.beneficiary_id,
+            category_id=last.category_id,
+            transaction_type=last.transaction_type,
+            operation_type=last.operation_type,
+            value=last.value,
+            buy_date=last.buy_date,
+            due_date=due_date,
+            pay_date=None,
+            status='pendente',
+            description=description,
+        )
+        installment.is_virtual = True
+        yield installment
+
+
+def materialize_installments(transaction, count=None):
+    """
+    Gera de uma vez as próximas `count` parcelas da série de `transaction`
+    (padrão: todas as restantes de uma recorrência finita), a partir da
+    última parcela gravada, com um único bulk_create. Retorna a lista de
+    parcelas criadas.
+
+    Como generate_next_installment(), bloqueia a raiz da série antes de
+    procurar a última parcela. Se mesmo assim o lote colidir com parcelas
+    gravadas por outra conexão (unique_recurrence_root_sequence), nada é
+    gravado e a lista retornada é vazia.
+    """
+    root = transaction.get_recurring_parent()
+    if count is None and root.recurrence_end_type != 'after_count':
+        raise ValueError('Informe a quantidade de parcelas para recorrências sem fim definido.')
+
+    with db_transaction.atomic():
+        root.lock_series()
+        last = root.get_series_installments().order_by(
+            F('recurrence_sequence').desc(nulls_last=True), '-id'
+        ).first() or root
+        installments = list(islice(iter_virtual_installments(root, last), count))
+        if not installments:
+            return installments
+
+        try:
+            with db_transaction.atomic(), ledger.deferred():
+                Transaction.objects.bulk_create(installments)
+                ledger.record_transactions(installments)
+        except IntegrityError:
+            return []
+    return installments
+
+
+def active_series_roots():
+    """Raízes das recorrências ativas (não interrompidas e com término suportado)."""
+    return Transaction.objects.filter(
+        is_recurring=True,
+        recurrence_root=F('id'),
+        recurrence_interrupted=False,
+        recurrence_end_type__in=('never', 'after_count', 'on_date'),
+    )
+
+
+def get_series_anchors(accounts=None, root_ids=None):
+    """
+    Pares (raiz, última parcela gravada) das recorrências ativas (ou só das
+    contas em `accounts`, ou só das raízes em `root_ids`), de onde partem as
+    projeções. Custa no máximo duas consultas.
+
+    As próximas parcelas copiam a conta da última parcela gravada, então o
+    filtro por conta usa a conta dela, e não a da raiz: uma série cuja última
+    parcela foi movida para outra conta passa a ser projetada nessa conta.
+    """
+    last_installment = Transaction.objects.filter(
+        recurrence_root_id=OuterRef('pk'),
+    ).order_by(F('recurrence_sequence').desc(nulls_last=True), '-id')
+    roots = active_series_roots().annotate(
+        last_installment_id=Subquery(last_installment.values('id')[:1]),
+        last_installment_account_id=Subquery(last_installment.values('account_id')[:1]),
+    ).order_by()
+    if accounts is not None:
+        # Séries com alguma parcela nas contas (pelo índice de conta) cuja
+        # última parcela ainda está nelas
+        roots = roots.filter(
+            pk__in=Transaction.objects.filter(account__in=accounts, recurrence_root__isnull=False).values('recurrence_root_id'),
+            last_installment_account_id__in=accounts,
+        )
+    if root_ids is not None:
+        roots = roots.filter(pk__in=root_ids)
+    roots = list(roots)
+
+    last_installments = Transaction.objects.in_bulk(
+        [root.last_installment_id for root in roots if root.last_installment_id != root.id]
+    )
+    return [(root, last_installments.get(root.last_installment_id, root)) for root in roots]
+
+
+def project_installments(date_from, date_to, accounts=None):
+    """
+    Parcelas futuras ainda não geradas de todas as recorrências ativas (ou
+    só das contas em `accounts`) com vencimento entre date_from e date_to,
+    em ordem de vencimento.
+
+    Custa no máximo duas consultas (get_series_anchors); as parcelas em si
+    são expandidas sob demanda, sem gravar nada.
+    """
+    def window(root, last):
+        installments = iter_virtual_installments(root, last)
+        installments = dropwhile(lambda t: t.due_date < date_from, installments)
+        return takewhile(lambda t: t.due_date <= date_to, installments)
+
+    return heapq.merge(
+        *(window(root, last) for root, last in get_series_anchors(accounts)),
+        key=lambda t: (t.due_date, t.recurrence_root_id),
+    )
+
+
+def generate_due_installments(until, since=None, batch_size=500):
+    """
+    Grava as parcelas que faltam, com vencimento até `until`, de todas as
+    recorrências ativas, mesmo as que ninguém registrou. Cada série continua
+    a partir da sua última parcela gravada, então rodar de novo não duplica nada.
+
+    Com `since`, uma série cuja primeira parcela faltante vence antes dessa
+    data não é gerada: anos de parcelas retroativas (e os deltas que elas
+    lançam no saldo) ficam para uma decisão manual, em vez de um cron.
+
+    As séries são percorridas em lotes de `batch_size` raízes, pela chave
+    primária. Cada lote é uma transação: bloqueia as raízes (como
+    generate_next_installment()), resolve as últimas parcelas com duas
+    consultas e insere as novas com um único bulk_create. Se o lote colidir
+    com parcelas gravadas por outra conexão, é desfeito e fica para a próxima
+    execução.
+
+    Retorna (séries verificadas, {id da raiz: parcelas criadas}, lotes com
+    conflito, ids das raízes ignoradas por `since`).
+    """
+    series = conflicts = 0
+    created = {}
+    skipped = []
+    last_id = 0
+    while True:
+        root_ids = list(
+            active_series_roots().filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not root_ids:
+            break
+        last_id = root_ids[-1]
+        series += len(root_ids)
+
+        try:
+            with db_transaction.atomic(), ledger.deferred():
+                list(Transaction.objects.select_for_update().filter(pk__in=root_ids).values_list('pk', flat=True))
+                installments = []
+                batch_created, batch_skipped = {}, []
+                for root, last in get_series_anchors(root_ids=root_ids):
+                    due = list(takewhile(
+                        lambda installment: installment.due_date <= until,
+                        iter_virtual_installments(root, last),
+                    ))
+                    if not due:
+                        continue
+                    if since and due[0].due_date < since:
+                        batch_skipped.append(root.pk)
+                        continue
+                    installments.extend(due)
+                    batch_created[root.pk] = len(due)
+                Transaction.objects.bulk_create(installments)
+                ledger.record_transactions(installments)
+        except IntegrityError:
+            conflicts += 1
+            continue
+        created.update(batch_created)
+        skipped.extend(batch_skipped)
+
+    return series, created, conflicts, skipped
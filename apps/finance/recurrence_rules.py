@@ -0,0 +1,142 @@
+"""
+Regras de recorrência no formato RRULE (RFC 5545), expandidas com dateutil.
+
+A série é descrita por uma regra (ex.: FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1
+para o último dia útil do mês) e por uma data âncora (DTSTART). As recorrências
+simples (tipo, intervalo e dias da semana) são convertidas em regra por
+legacy_rule(), então todas as datas da série saem do mesmo motor.
+
+As ocorrências são expandidas por ano civil e guardadas em um cache LRU
+chaveado por (regra, âncora, ano): a próxima data de milhares de séries com a
+mesma regra e âncora é uma busca binária em uma tupla já calculada.
+"""
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+
+from dateutil.rrule import rrulestr
+
+# Tamanho dos caches de regras compiladas e de anos expandidos
+CACHE_SIZE = 2048
+
+FREQUENCIES = {
+    'DAILY': 'daily',
+    'WEEKLY': 'weekly',
+    'MONTHLY': 'monthly',
+    'YEARLY': 'yearly',
+}
+
+# Partes que só mudam o horário: geram várias ocorrências no mesmo dia
+TIME_PARTS = {'BYHOUR', 'BYMINUTE', 'BYSECOND'}
+
+# recurrence_weekdays usa 1 (segunda) a 7 (domingo); 0 também é domingo
+WEEKDAY_CODES = {0: 'SU', 1: 'MO', 2: 'TU', 3: 'WE', 4: 'TH', 5: 'FR', 6: 'SA', 7: 'SU'}
+
+
+def normalize_rule(rule):
+    """Regra em maiúsculas, sem o prefixo RRULE: e sem espaços."""
+    rule = ''.join((rule or '').split()).upper()
+    if rule.startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    return rule
+
+
+def rule_frequency(rule):
+    """Tipo de recorrência (daily, weekly, ...) correspondente ao FREQ da regra, ou None."""
+    for part in normalize_rule(rule).split(';'):
+        name, _, value = part.partition('=')
+        if name == 'FREQ':
+            return FREQUENCIES.get(value)
+    return None
+
+
+def legacy_rule(recurrence_type, interval=1, weekdays='', anchor=None):
+    """
+    Regra equivalente aos campos simples de recorrência, ou '' se o tipo não
+    for suportado. Nas mensais/anuais com dia acima de 28 o vencimento fica
+    no último dia dos meses mais curtos e volta ao dia da âncora nos demais.
+    """
+    frequency = {value: name for name, value in FREQUENCIES.items()}.get(recurrence_type)
+    if not frequency:
+        return ''
+    parts = [f'FREQ={frequency}']
+    if interval and interval > 1:
+        parts.append(f'INTERVAL={interval}')
+
+    if recurrence_type == 'weekly' and weekdays:
+        codes = []
+        for value in weekdays.split(','):
+            code = WEEKDAY_CODES.get(int(value)) if value.strip().isdigit() else None
+            if code and code not in codes:
+                codes.append(code)
+        if codes:
+            parts.append(f"BYDAY={','.join(codes)}")
+    elif anchor and anchor.day > 28 and recurrence_type in ('monthly', 'yearly'):
+        if recurrence_type == 'yearly':
+            parts.append(f'BYMONTH={anchor.month}')
+        days = ','.join(str(day) for day in range(28, anchor.day + 1))
+        parts.append(f'BYMONTHDAY={days};BYSETPOS=-1')
+    return ';'.join(parts)
+
+
+def validate_rule(rule):
+    """
+    Confere se a regra é válida e gera ao menos uma data. Levanta ValueError
+    com a mensagem para o usuário.
+    """
+    rule = normalize_rule(rule)
+    if rule_frequency(rule) is None:
+        raise ValueError('A regra deve ter FREQ=DAILY, WEEKLY, MONTHLY ou YEARLY.')
+    names = {part.partition('=')[0] for part in rule.split(';')}
+    if names & {'COUNT', 'UNTIL'}:
+        raise ValueError('Use o término da recorrência em vez de COUNT ou UNTIL na regra.')
+    if names & TIME_PARTS:
+        raise ValueError('As parcelas têm apenas data: BYHOUR, BYMINUTE e BYSECOND não são aceitos.')
+    try:
+        compiled = _compile(rule, date(2000, 1, 1))
+    except (ValueError, TypeError) as error:
+        raise ValueError(f'Regra de recorrência inválida: {error}')
+    if compiled.after(datetime(2000, 1, 1), inc=True) is None:
+        raise ValueError('A regra de recorrência não gera nenhuma data.')
+    return rule
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(rule, anchor):
+    return rrulestr(rule, dtstart=datetime(anchor.year, anchor.month, anchor.day), cache=False)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def expand_year(rule, anchor, year):
+    """
+    Datas da regra (com a âncora dada) no ano civil `year`, em ordem e sem
+    repetição (várias ocorrências no mesmo dia contam como uma data).
+    """
+    occurrences = _compile(rule, anchor).between(datetime(year, 1, 1), datetime(year, 12, 31, 23, 59, 59), inc=True)
+    return tuple(sorted({occurrence.date() for occurrence in occurrences}))
+
+
+def iter_occurrences(rule, anchor, after):
+    """
+    Gera as datas da regra posteriores a `after`, ano a ano a partir do
+    cache. Anos sem nenhuma data são pulados de uma vez.
+    """
+    rule = normalize_rule(rule)
+    year = after.year
+    occurrences = expand_year(rule, anchor, year)
+    yield from occurrences[bisect_right(occurrences, after):]
+    while True:
+        year += 1
+        occurrences = expand_year(rule, anchor, year)
+        if not occurrences:
+            following = _compile(rule, anchor).after(datetime(year, 1, 1), inc=True)
+            if following is None:
+                return
+            year = following.year
+            occurrences = expand_year(rule, anchor, year)
+        yield from occurrences
+
+
+def next_occurrence(rule, anchor, after):
+    """Primeira data da regra posterior a `after`, ou None."""
+    return next(iter_occurrences(rule, anchor, after), None)
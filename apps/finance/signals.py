@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import ledger
+from .models import Transaction
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_deleted_transaction_from_balance(sender, instance, **kwargs):
+    """
+    Retira a transação excluída do saldo consolidado da conta.
+    O sinal cobre também as exclusões em cascata e as de QuerySet.delete().
+    """
+    ledger.record_deleted(instance)
@@ -1,3 +1,1984 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import re
+import threading
+import time
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import categorization, importers, ledger, recurrence_rules
+from .forecast import build_forecast
+from .forms import CompositeTransactionForm, RecurringTransactionForm
+from .models import Account, AccountBalance, AccountMonthSummary, BalanceAlert, CategorizationRule, Category, Transaction
+from .pagination import KeysetPaginator
+from .recurrence import iter_virtual_installments, materialize_installments, project_installments, resolve_transaction_rows
+
+
+def create_recurring_chain(account, length, paid=0):
+    """
+    Cria uma série de recorrência mensal com `length` parcelas, todas ligadas
+    à raiz (parent_transaction e recurrence_root), das quais as `paid`
+    primeiras já estão registradas.
+    """
+    root = Transaction.objects.create(
+        account=account,
+        transaction_type='DB',
+        value=100,
+        description='Aluguel',
+        buy_date=date(2024, 1, 1),
+        due_date=date(2024, 1, 10),
+        is_recurring=True,
+        recurrence_type='monthly',
+        recurrence_start_date=date(2024, 1, 10),
+        recurrence_end_type='after_count',
+        recurrence_end_count=length,
+        recurrence_sequence=1,
+    )
+    chain = [root]
+    for sequence in range(2, length + 1):
+        chain.append(Transaction.objects.create(
+            parent_transaction=root,
+            parent_type='recurring',
+            recurrence_root=root,
+            account=account,
+            transaction_type='DB',
+            value=100,
+            description=f'Aluguel - {sequence:02d}/{length:02d}',
+            buy_date=root.buy_date,
+            due_date=root.due_date,
+            is_recurring=True,
+            recurrence_type='monthly',
+            recurrence_start_date=root.recurrence_start_date,
+            recurrence_end_type='after_count',
+            recurrence_end_count=length,
+            recurrence_sequence=sequence,
+        ))
+    # Registra via update para não disparar a geração automática de parcelas
+    ids = [t.id for t in chain]
+    Transaction.objects.filter(id__in=ids[:paid]).update(pay_date=root.due_date, status='registrado')
+    return list(Transaction.objects.filter(id__in=ids).order_by('recurrence_sequence'))
+
+
+class RecurrenceSeriesQueryTests(TestCase):
+    """A resolução da série (todas as parcelas ligadas à raiz) deve custar o mesmo para qualquer tamanho."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+
+    def test_all_pending_installments_resolved_by_series(self):
+        chain = create_recurring_chain(self.account, 6, paid=2)
+
+        pending = list(chain[-1].get_all_pending_installments())
+
+        self.assertEqual([t.id for t in pending], [t.id for t in chain[2:]])
+
+    def test_next_pending_installment(self):
+        chain = create_recurring_chain(self.account, 6, paid=2)
+
+        self.assertTrue(chain[2].is_next_pending_installment())
+        self.assertFalse(chain[3].is_next_pending_installment())
+        self.assertFalse(chain[1].is_next_pending_installment())
+
+    def test_last_registered_is_next_when_nothing_pending(self):
+        chain = create_recurring_chain(self.account, 4, paid=4)
+
+        self.assertTrue(chain[-1].is_next_pending_installment())
+        self.assertFalse(chain[0].is_next_pending_installment())
+
+    def test_query_count_is_constant_in_chain_depth(self):
+        for length in (3, 30, 120):
+            chain = create_recurring_chain(self.account, length, paid=length - 1)
+            with self.subTest(length=length):
+                with self.assertNumQueries(1):
+                    list(chain[-1].get_all_pending_installments())
+                with self.assertNumQueries(1):
+                    chain[-1].is_next_pending_installment()
+                # Sem pendentes, a busca pela última registrada é a segunda consulta
+                Transaction.objects.filter(pk=chain[-1].pk).update(pay_date=date(2024, 2, 10))
+                chain[-1].refresh_from_db()
+                with self.assertNumQueries(2):
+                    chain[-1].is_next_pending_installment()
+
+
+class RecurrenceRootTests(TestCase):
+    """Ponteiro recurrence_root: mantido pelo save() e preenchido pela migração 0014."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+
+    def create(self, parent=None, sequence=1, description='Aluguel'):
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=100,
+            description=description,
+            buy_date=date(2024, 1, 1),
+            is_recurring=True,
+            recurrence_type='monthly',
+            recurrence_sequence=sequence,
+            parent_transaction=parent,
+            parent_type='recurring' if parent else None,
+        )
+
+    def create_chain(self):
+        """Cadeia antiga: cada parcela aponta para a anterior (pai -> filha -> neta)."""
+        head = self.create()
+        child = self.create(parent=head, sequence=2)
+        grandchild = self.create(parent=child, sequence=3)
+        return [head, child, grandchild]
+
+    def roots(self, chain):
+        return list(
+            Transaction.objects.filter(pk__in=[t.pk for t in chain]).order_by('recurrence_sequence')
+            .values_list('recurrence_root_id', flat=True)
+        )
+
+    def test_new_root_points_at_itself(self):
+        root = self.create()
+
+        self.assertEqual(root.recurrence_root_id, root.pk)
+        self.assertEqual(Transaction.objects.get(pk=root.pk).recurrence_root_id, root.pk)
+
+    def test_save_points_every_installment_at_the_head(self):
+        chain = self.create_chain()
+
+        self.assertEqual(self.roots(chain), [chain[0].pk] * 3)
+
+    def test_non_recurring_has_no_root(self):
+        root = self.create()
+
+        root.is_recurring = False
+        root.save()
+
+        self.assertIsNone(Transaction.objects.get(pk=root.pk).recurrence_root_id)
+
+    def test_backfill_migration(self):
+        backfill = importlib.import_module('apps.finance.migrations.0014_backfill_recurrence_root')
+        chain = self.create_chain()
+        other = self.create(description='Internet')
+        Transaction.objects.update(recurrence_root=None)
+
+        backfill.backfill_recurrence_root(django_apps, None)
+
+        self.assertEqual(self.roots(chain), [chain[0].pk] * 3)
+        self.assertEqual(self.roots([other]), [other.pk])
+
+
+class ResolveTransactionRowsTests(TestCase):
+    """Dados de recorrência e composição da página resolvidos em lote, iguais aos dos helpers por linha."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+
+    def create_rows(self, series_count):
+        """Séries em estados diferentes, uma composta e uma transação simples."""
+        for index in range(series_count):
+            length = 3 + index % 3
+            create_recurring_chain(self.account, length, paid=index % (length + 1))
+        parent = Transaction.objects.create(
+            account=self.account, transaction_type='DB', value=30, description='Composta', buy_date=date(2024, 1, 2),
+        )
+        Transaction.objects.create(
+            account=self.account, transaction_type='DB', value=10, description='Item', buy_date=date(2024, 1, 2),
+            parent_transaction=parent, parent_type='composite',
+        )
+        Transaction.objects.create(
+            account=self.account, transaction_type='CR', value=5, description='Avulsa', buy_date=date(2024, 1, 3),
+        )
+        return list(Transaction.objects.order_by('id'))
+
+    def test_query_count_is_constant(self):
+        small = self.create_rows(1)
+        large = self.create_rows(12)
+        self.assertGreater(len(large), len(small) * 5)
+
+        # Filhas de compostas, raízes das séries e parcelas das séries
+        for rows in (small, large):
+            with self.assertNumQueries(3):
+                resolve_transaction_rows(rows)
+
+    def test_matches_row_helpers(self):
+        rows = resolve_transaction_rows(self.create_rows(6))
+
+        for row in rows:
+            fresh = Transaction.objects.get(pk=row.pk)
+            with self.subTest(row=row.description):
+                self.assertEqual(row.is_composite_root, fresh.is_composite_parent())
+                if not fresh.is_recurring:
+                    self.assertEqual(row.recurring_root, row)
+                    continue
+                self.assertEqual(row.recurring_root.pk, fresh.get_recurring_parent().pk)
+                self.assertEqual(row.total_installments, fresh.get_total_installments())
+                self.assertEqual(row.has_next_installment, fresh.has_next_recurring_installment())
+                self.assertEqual(row.is_next_pending, fresh.is_next_pending_installment())
+        # Há parcelas pendentes e séries totalmente registradas na amostra
+        self.assertTrue(any(row.is_next_pending and not row.pay_date for row in rows))
+        self.assertTrue(any(row.is_next_pending and row.pay_date for row in rows))
+
+
+class ConcurrentInstallmentGenerationTests(TransactionTestCase):
+    """Registros simultâneos da mesma parcela devem gerar uma única próxima parcela."""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.chain = create_recurring_chain(self.account, 3, paid=1)
+        # Série sem fim, para que a parcela registrada sempre gere a seguinte
+        Transaction.objects.filter(recurrence_root=self.chain[0]).update(
+            recurrence_end_type='never',
+            recurrence_end_count=None,
+        )
+        ledger.rebuild_account_balances()
+
+    def register_concurrently(self, transaction_id):
+        """Registra a mesma transação em várias threads, todas a partir de cópias carregadas antes."""
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def register():
+            try:
+                transaction = Transaction.objects.get(pk=transaction_id)
+                barrier.wait()
+                transaction.pay_date = date(2024, 3, 10)
+                for _ in range(200):
+                    try:
+                        transaction.save()
+                        break
+                    except OperationalError:
+                        # SQLite em memória: tabela travada por outra conexão
+                        time.sleep(0.01)
+                else:
+                    errors.append('tabela travada em todas as tentativas')
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_single_next_installment(self):
+        last = self.chain[-1]
+
+        errors = self.register_concurrently(last.pk)
+
+        self.assertEqual(errors, [])
+        series = Transaction.objects.filter(recurrence_root=self.chain[0])
+        self.assertEqual(series.filter(recurrence_sequence=last.recurrence_sequence + 1).count(), 1)
+        self.assertEqual(series.count(), len(self.chain) + 1)
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+
+class DirtyTrackingSaveTests(TestCase):
+    """O save() decide pelo que mudou desde o carregamento, sem SELECT prévio."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.chain = create_recurring_chain(self.account, 3, paid=1)
+        self.plain = Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=10,
+            description='Mercado',
+            buy_date=date(2024, 1, 5),
+        )
+
+    def installments(self):
+        return Transaction.objects.filter(recurrence_root=self.chain[0]).count()
+
+    def test_save_of_loaded_instance_does_not_read_first(self):
+        transaction = Transaction.objects.get(pk=self.plain.pk)
+
+        # Só o UPDATE da própria linha
+        transaction.due_date = date(2024, 1, 20)
+        with self.assertNumQueries(1):
+            transaction.save()
+
+        # Campo do saldo: UPDATE condicional e saldo, dentro de um savepoint
+        transaction.value = 15
+        with CaptureQueriesContext(connection) as context:
+            transaction.save()
+        statements = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT')], statements)
+
+    def test_next_installment_only_when_pay_date_changes(self):
+        pending = Transaction.objects.get(pk=self.chain[1].pk)
+        pending.pay_date = date(2024, 2, 10)
+        pending.save()
+        self.assertEqual(self.installments(), 3)
+
+        # Outra alteração na parcela registrada não volta a gerar parcelas
+        Transaction.objects.filter(pk=self.chain[2].pk).delete()
+        pending = Transaction.objects.get(pk=self.chain[1].pk)
+        pending.due_date = date(2024, 2, 11)
+        pending.save()
+        self.assertEqual(self.installments(), 2)
+
+        pending.pay_date = date(2024, 2, 12)
+        pending.save()
+        self.assertEqual(self.installments(), 3)
+
+    def test_description_rewritten_only_when_changed(self):
+        # Descrição sem o número da parcela, gravada sem passar pelo save()
+        Transaction.objects.filter(pk=self.chain[0].pk).update(description='Aluguel')
+        root = Transaction.objects.get(pk=self.chain[0].pk)
+
+        root.due_date = date(2024, 1, 11)
+        with self.assertNumQueries(1):
+            root.save()
+        self.assertEqual(Transaction.objects.get(pk=root.pk).description, 'Aluguel')
+
+        root.description = 'Aluguel do apartamento'
+        root.save()
+        self.assertEqual(Transaction.objects.get(pk=root.pk).description, 'Aluguel do apartamento - 01/03')
+        self.assertEqual(root.description, 'Aluguel do apartamento - 01/03')
+
+
+class LedgerSaveTests(TestCase):
+    """Gravação do saldo consolidado junto com a transação, sem leitura prévia da linha."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.transaction = Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=1000,
+            description='Aluguel',
+            buy_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 10),
+        )
+
+    def test_register_does_not_read_the_row(self):
+        self.transaction.pay_date = date(2024, 1, 10)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.transaction.save()
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        table = Transaction._meta.db_table
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT') and table in sql])
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE') and table in sql]), 1)
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_stale_copy_uses_stored_values(self):
+        stale = Transaction.objects.get(pk=self.transaction.pk)
+        self.transaction.value = 1500
+        self.transaction.save()
+
+        stale.pay_date = date(2024, 1, 10)
+        stale.save()
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.value, 1000)
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+
+class MaterializeInstallmentsTests(TestCase):
+    """Geração antecipada das parcelas restantes e renumeração da série, em lote."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.chain = create_recurring_chain(self.account, 2)
+        self.root = self.chain[0]
+        Transaction.objects.filter(recurrence_root=self.root).update(recurrence_end_count=5)
+        self.root.refresh_from_db()
+
+    def series(self):
+        return list(Transaction.objects.filter(recurrence_root=self.root).order_by('recurrence_sequence'))
+
+    def test_materializes_remaining_installments_in_one_insert(self):
+        with CaptureQueriesContext(connection) as context:
+            installments = materialize_installments(self.root)
+
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([t.recurrence_sequence for t in installments], [3, 4, 5])
+        self.assertEqual(
+            [t.due_date for t in installments],
+            [date(2024, 2, 10), date(2024, 3, 10), date(2024, 4, 10)],
+        )
+        self.assertEqual(installments[0].description, 'Aluguel - 03/05')
+        self.assertEqual([t.recurrence_sequence for t in self.series()], [1, 2, 3, 4, 5])
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_second_call_creates_nothing(self):
+        materialize_installments(self.root)
+
+        self.assertEqual(materialize_installments(self.root), [])
+        self.assertEqual(len(self.series()), 5)
+
+    def test_infinite_series_requires_count(self):
+        Transaction.objects.filter(recurrence_root=self.root).update(recurrence_end_type='never')
+        self.root.refresh_from_db()
+
+        with self.assertRaises(ValueError):
+            materialize_installments(self.root)
+        self.assertEqual(len(materialize_installments(self.root, count=4)), 4)
+
+    def test_collision_with_existing_sequence_creates_nothing(self):
+        def colliding(root, last):
+            for installment in iter_virtual_installments(root, last):
+                # Outra conexão já gravou esta sequência
+                installment.recurrence_sequence = 2
+                yield installment
+
+        with mock.patch('apps.finance.recurrence.iter_virtual_installments', colliding):
+            self.assertEqual(materialize_installments(self.root), [])
+
+        self.assertEqual(len(self.series()), 2)
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_view_double_submit(self):
+        url = reverse('finance:recurring_transaction_materialize', args=[self.root.id])
+
+        self.client.post(url)
+        response = self.client.post(url, follow=True)
+
+        self.assertEqual(len(self.series()), 5)
+        self.assertIn('Não há parcelas restantes', [str(m) for m in response.context['messages']][-1])
+
+    def test_reorganize_sequences_closes_gaps(self):
+        materialize_installments(self.root)
+        self.series()[2].delete()
+
+        self.root.reorganize_sequences()
+
+        series = self.series()
+        self.assertEqual([t.recurrence_sequence for t in series], [1, 2, 3, 4])
+        self.assertEqual([t.description for t in series[2:]], ['Aluguel - 03/05', 'Aluguel - 04/05'])
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+
+class ConcurrentBulkRegisterTests(TransactionTestCase):
+    """Envios simultâneos do registro em lote não podem aplicar o pagamento duas vezes."""
+
+    THREADS = 4
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.transactions = [
+            Transaction.objects.create(
+                account=self.account,
+                transaction_type='DB',
+                value=10 * (i + 1),
+                description=f'Conta {i}',
+                buy_date=date(2024, 1, 1),
+                due_date=date(2024, 1, 10 + i),
+            )
+            for i in range(3)
+        ]
+
+    def test_concurrent_submissions_register_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        data = {'transaction_ids': [t.id for t in self.transactions], 'use_due_date': 'on'}
+        registered, errors = [], []
+
+        def submit():
+            try:
+                client = Client()
+                barrier.wait()
+                for _ in range(200):
+                    try:
+                        response = client.post(reverse('finance:transaction_bulk_register'), data)
+                        break
+                    except OperationalError:
+                        # SQLite em memória: tabela travada por outra conexão
+                        time.sleep(0.01)
+                registered.extend(response.json()['registered'])
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Uma tentativa desfeita por bloqueio pode ter sido repetida: cada id no máximo uma vez
+        self.assertEqual(len(registered), len(set(registered)))
+        self.assertFalse(Transaction.objects.filter(pay_date__isnull=True).exists())
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Paginação por cursor: empates na data, created_at nulo e cursores inválidos."""
+
+    ORDERING = ('-buy_date', '-created_at', '-id')
+
+    def setUp(self):
+        account = Account.objects.create(name='Conta corrente')
+        for day in (5, 5, 5, 4, 4, 3, 1):
+            Transaction.objects.create(
+                account=account,
+                transaction_type='DB',
+                value=10,
+                description='Mercado',
+                buy_date=date(2024, 1, day),
+            )
+        # Linhas antigas, anteriores ao created_at, no meio dos empates
+        ids = list(Transaction.objects.order_by('id').values_list('id', flat=True))
+        Transaction.objects.filter(id__in=[ids[1], ids[3], ids[6]]).update(created_at=None)
+        rows = Transaction.objects.values_list('id', 'buy_date', 'created_at')
+        # Nulos são os menores valores: aparecem por último nas ordenações decrescentes
+        self.expected = [
+            row[0] for row in sorted(
+                rows,
+                key=lambda row: (row[1], row[2] is not None, row[2] or 0, row[0]),
+                reverse=True,
+            )
+        ]
+        self.paginator = KeysetPaginator(Transaction.objects.all(), self.ORDERING, 2)
+
+    def ids(self, page):
+        return [transaction.id for transaction in page]
+
+    def test_forward_and_backward_paging(self):
+        pages = [self.paginator.get_page()]
+        self.assertFalse(pages[0].has_previous)
+        while pages[-1].has_next:
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([transaction_id for page in pages for transaction_id in self.ids(page)], self.expected)
+        # Última página: a linha que sobra, sem próxima
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(self.ids(pages[-1]), self.expected[-1:])
+
+        backward = [pages[-1]]
+        while backward[-1].has_previous:
+            backward.append(self.paginator.get_page(backward[-1].previous_cursor))
+        self.assertEqual([self.ids(page) for page in reversed(backward)], [self.ids(page) for page in pages])
+        # A volta à primeira página mantém o cursor de avanço
+        self.assertTrue(backward[-1].has_next)
+
+    def test_invalid_cursors_start_from_the_first_page(self):
+        first = self.ids(self.paginator.get_page())
+        encode = lambda payload: base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for cursor in (
+            'não é base64',
+            encode({'n': 1}),
+            encode(['x', ['2024-01-05', None, 1]]),
+            encode(['n', ['2024-01-05', 1]]),
+            encode(['n', ['2024-13-45', None, 1]]),
+            encode(['n', ['2024-01-05', 'ontem', 1]]),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(self.paginator.decode_cursor(cursor))
+                self.assertEqual(self.ids(self.paginator.get_page(cursor)), first)
+
+    def test_nulls_ordering_only_on_nullable_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            self.paginator.get_page()
+
+        sql = context.captured_queries[-1]['sql']
+        self.assertIn('"created_at" DESC NULLS LAST', sql)
+        self.assertNotIn('"buy_date" DESC NULLS', sql)
+        self.assertNotIn('"id" DESC NULLS', sql)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Planos de execução verificados apenas no SQLite')
+class TransactionIndexUsageTests(TestCase):
+    """As consultas das telas principais devem usar os índices de Transaction, sem varredura completa."""
+
+    FULL_SCAN = re.compile(r'SCAN (TABLE )?finance_transaction(?! USING)')
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        create_recurring_chain(self.account, 5, paid=2)
+
+    def query_plans(self, url):
+        """Executa a view e retorna o plano de cada SELECT sobre finance_transaction."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or '"finance_transaction"' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        return plans
+
+    def assert_uses_indexes(self, plans, index_names):
+        for plan in plans:
+            self.assertIsNone(self.FULL_SCAN.search(plan), plan)
+        joined = '\n'.join(plans)
+        for index_name in index_names:
+            self.assertIn(index_name, joined)
+
+    def test_account_statement_uses_account_indexes(self):
+        url = reverse('finance:account_statement', args=[self.account.id])
+        plans = self.query_plans(f'{url}?from=2024-01-01&to=2024-12-31')
+
+        self.assert_uses_indexes(plans, ['transaction_account_paid_idx', 'transaction_account_due_idx'])
+
+    def test_transactions_list_uses_ordering_and_parent_indexes(self):
+        plans = self.query_plans(reverse('finance:transactions_list'))
+
+        self.assert_uses_indexes(plans, ['transaction_list_order_idx', 'transaction_parent_idx'])
+
+
+class CompositeTransactionFormTests(TestCase):
+    """A validação das linhas resolve contas e categorias em lote."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+        self.categories = [
+            Category.objects.create(category='Mercado', subcategory=str(i)) for i in range(5)
+        ]
+
+    def build_data(self, line_count):
+        data = QueryDict(mutable=True)
+        data.update({'account': self.account.id, 'buy_date': '2024-03-01'})
+        for i in range(line_count):
+            data[f'line_{i}_value'] = '10.00'
+            data[f'line_{i}_description'] = f'Item {i}'
+            data[f'line_{i}_transaction_type'] = 'DB'
+            if i % 10 == 9:
+                data[f'line_{i}_is_transfer'] = 'on'
+                data[f'line_{i}_destination_account'] = self.savings.id
+            else:
+                data[f'line_{i}_category'] = self.categories[i % 5].id
+        return data
+
+    def test_query_count_is_constant_in_line_count(self):
+        for line_count in (10, 50, 100):
+            form = CompositeTransactionForm(self.build_data(line_count))
+            with self.subTest(line_count=line_count):
+                # Conta principal, contas de destino e categorias
+                with self.assertNumQueries(3):
+                    self.assertTrue(form.is_valid(), form.errors)
+                self.assertEqual(len(form.cleaned_data['lines']), line_count)
+
+    def test_invalid_references_keep_line_errors(self):
+        data = self.build_data(10)
+        data['line_0_category'] = '999999'
+        data['line_9_destination_account'] = 'abc'
+        data['line_1_is_transfer'] = 'on'
+        data['line_1_destination_account'] = self.account.id
+        del data['line_1_category']
+
+        form = CompositeTransactionForm(data)
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), [
+            'Linha 1: Categoria inválida.',
+            'Linha 2: A conta de destino deve ser diferente da conta principal.',
+            'Linha 10: Conta de destino inválida.',
+        ])
+
+
+class CompositeTransactionUpdateTests(TestCase):
+    """Reenviar a composta sem alterações não deve recriar nem excluir transações."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+        self.category = Category.objects.create(category='Mercado', subcategory='Geral')
+
+    def post_data(self, lines):
+        data = {'account': self.account.id, 'buy_date': '2024-03-01', 'pay_date': '2024-03-01'}
+        for i, (value, destination) in enumerate(lines):
+            data[f'line_{i}_value'] = value
+            data[f'line_{i}_description'] = f'Item {i}'
+            data[f'line_{i}_transaction_type'] = 'DB'
+            if destination:
+                data[f'line_{i}_is_transfer'] = 'on'
+                data[f'line_{i}_destination_account'] = destination.id
+            else:
+                data[f'line_{i}_category'] = self.category.id
+        return data
+
+    def composite_ids(self, parent):
+        return sorted(Transaction.objects.filter(
+            Q(pk=parent.pk) | Q(parent_transaction=parent, parent_type='composite')
+        ).values_list('pk', flat=True))
+
+    def test_resubmit_after_adding_transfer_keeps_rows(self):
+        self.client.post(reverse('finance:composite_transaction_create'), self.post_data([
+            ('10.00', None), ('20.00', None), ('30.00', None),
+        ]))
+        parent = Transaction.objects.get(parent_transaction__isnull=True, account=self.account)
+        url = reverse('finance:composite_transaction_update', args=[parent.id])
+
+        # A segunda linha vira transferência: a contrapartida é criada depois da terceira linha
+        edited = self.post_data([('10.00', None), ('20.00', self.savings), ('30.00', None)])
+        self.client.post(url, edited)
+        ids = self.composite_ids(parent)
+        self.assertEqual(len(ids), 4)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, edited)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(self.composite_ids(parent), ids)
+        writes = [q['sql'] for q in context.captured_queries if q['sql'].startswith(('INSERT', 'DELETE', 'UPDATE'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+
+class BulkRegisterTests(TestCase):
+    """Registro em lote: o reenvio das mesmas transações não altera os saldos."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.pending = [
+            Transaction.objects.create(
+                account=self.account,
+                transaction_type='DB',
+                value=10 * (i + 1),
+                description=f'Conta {i}',
+                buy_date=date(2024, 1, 1),
+                due_date=date(2024, 1 + i, 10),
+            )
+            for i in range(3)
+        ]
+        self.chain = create_recurring_chain(self.account, 2, paid=1)
+        # A última parcela gravada ainda tem uma seguinte a gerar
+        Transaction.objects.filter(recurrence_root=self.chain[0]).update(recurrence_end_count=3)
+        ledger.rebuild_account_balances()
+        ledger.rebuild_month_summaries()
+
+    def register(self, ids):
+        response = self.client.post(reverse('finance:transaction_bulk_register'), {
+            'transaction_ids': ids,
+            'use_due_date': 'on',
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_registering_same_ids_twice(self):
+        ids = [t.id for t in self.pending] + [self.chain[1].id]
+
+        first = self.register(ids)
+        second = self.register(ids)
+
+        self.assertEqual(sorted(first['registered']), sorted(ids))
+        self.assertEqual(len(first['generated']), 1)
+        self.assertEqual(second['registered'], [])
+        self.assertEqual(second['generated'], [])
+        self.assertEqual(
+            {item['reason'] for item in second['skipped']},
+            {'Transação já registrada'},
+        )
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_unknown_ids_are_skipped(self):
+        result = self.register([self.pending[0].id, 999999])
+
+        self.assertEqual(result['registered'], [self.pending[0].id])
+        self.assertEqual(result['skipped'], [{'id': 999999, 'reason': 'Transação não encontrada'}])
+
+
+class RecurrenceRuleTests(SimpleTestCase):
+    """Validação, expansão e cache das regras RRULE."""
+
+    def setUp(self):
+        recurrence_rules.expand_year.cache_clear()
+
+    def occurrences(self, rule, anchor, count):
+        return list(islice(recurrence_rules.iter_occurrences(rule, anchor, anchor), count))
+
+    def test_last_business_day_of_month(self):
+        rule = 'FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1'
+
+        self.assertEqual(self.occurrences(rule, date(2024, 1, 10), 4), [
+            date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 29), date(2024, 4, 30),
+        ])
+
+    def test_weekdays_across_year_boundary(self):
+        self.assertEqual(self.occurrences('FREQ=WEEKLY;BYDAY=MO,WE,FR', date(2024, 12, 27), 3), [
+            date(2024, 12, 30), date(2025, 1, 1), date(2025, 1, 3),
+        ])
+
+    def test_legacy_rules(self):
+        self.assertEqual(recurrence_rules.legacy_rule('weekly', 2, '1,3,5'), 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR')
+        self.assertEqual(recurrence_rules.legacy_rule('monthly', 1, '', date(2024, 1, 10)), 'FREQ=MONTHLY')
+        self.assertEqual(recurrence_rules.legacy_rule('daily', 1, ''), 'FREQ=DAILY')
+        self.assertEqual(recurrence_rules.legacy_rule('hourly', 1, ''), '')
+
+    def test_month_end_clamps_and_returns_to_anchor_day(self):
+        rule = recurrence_rules.legacy_rule('monthly', 1, '', date(2024, 1, 31))
+
+        self.assertEqual(self.occurrences(rule, date(2024, 1, 31), 3), [
+            date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30),
+        ])
+
+    def test_leap_day_yearly(self):
+        rule = recurrence_rules.legacy_rule('yearly', 1, '', date(2024, 2, 29))
+
+        self.assertEqual(self.occurrences(rule, date(2024, 2, 29), 4), [
+            date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29),
+        ])
+
+    def test_sparse_rule_skips_empty_years(self):
+        rule = 'FREQ=YEARLY;INTERVAL=4;BYMONTH=2;BYMONTHDAY=29'
+
+        self.assertEqual(self.occurrences(rule, date(2024, 2, 29), 2), [date(2028, 2, 29), date(2032, 2, 29)])
+
+    def test_validate_rule(self):
+        self.assertEqual(recurrence_rules.validate_rule('rrule:freq=weekly; byday=mo'), 'FREQ=WEEKLY;BYDAY=MO')
+        for rule in (
+            'FREQ=HOURLY',
+            'FREQ=MONTHLY;COUNT=3',
+            'FREQ=MONTHLY;UNTIL=20250101',
+            'FREQ=DAILY;BYHOUR=1,2',
+            'FREQ=DAILY;BYMINUTE=0,30',
+            'FREQ=MONTHLY;BYMONTH=2;BYMONTHDAY=30',
+            'FREQ=MONTHLY;BYDAY=XX',
+            'lixo',
+        ):
+            with self.subTest(rule=rule), self.assertRaises(ValueError):
+                recurrence_rules.validate_rule(rule)
+
+    def test_several_occurrences_per_day_count_once(self):
+        # Regras gravadas sem passar pela validação (ex.: pelo admin)
+        self.assertEqual(self.occurrences('FREQ=DAILY;BYHOUR=1,2', date(2024, 1, 1), 2), [
+            date(2024, 1, 2), date(2024, 1, 3),
+        ])
+
+    def test_expansion_is_cached_per_year(self):
+        rule = 'FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1'
+        for day in range(1, 28):
+            recurrence_rules.next_occurrence(rule, date(2024, 1, 10), date(2024, 3, day))
+
+        info = recurrence_rules.expand_year.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 26)
+
+
+class RecurrenceRuleSeriesTests(TestCase):
+    """As parcelas seguem a regra da raiz e respeitam o término em uma data."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.root = Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=100,
+            description='Folha',
+            buy_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 10),
+            is_recurring=True,
+            recurrence_type='monthly',
+            recurrence_rule='FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1',
+            recurrence_start_date=date(2024, 1, 10),
+            recurrence_end_type='on_date',
+            recurrence_end_date=date(2024, 4, 15),
+            recurrence_sequence=1,
+        )
+
+    def test_registering_follows_rule_until_end_date(self):
+        current = self.root
+        due_dates = [current.due_date]
+        while True:
+            current.pay_date = current.due_date
+            current.save()
+            current = current.get_next_installment()
+            if current is None:
+                break
+            due_dates.append(current.due_date)
+
+        self.assertEqual(due_dates, [date(2024, 1, 10), date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 29)])
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_form_rejects_time_parts(self):
+        form = RecurringTransactionForm(data={
+            'account': self.account.id,
+            'transaction_type': 'DB',
+            'operation_type': 'simple',
+            'value': '10',
+            'buy_date': '2024-01-01',
+            'is_recurring': 'on',
+            'recurrence_rule': 'FREQ=DAILY;BYHOUR=1,2',
+            'recurrence_interval': 1,
+            'recurrence_start_date': '2024-01-01',
+            'recurrence_end_type': 'never',
+        })
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('recurrence_rule', form.errors)
+
+
+class ForecastTests(TestCase):
+    """Previsão vetorizada comparada com a soma ingênua, dia a dia."""
+
+    START = date(2024, 2, 1)
+    MONTHS = 3
+
+    def setUp(self):
+        self.checking = Account.objects.create(name='Conta corrente', opening_balance=500)
+        self.savings = Account.objects.create(name='Poupança', opening_balance=200)
+        self.chain = create_recurring_chain(self.checking, 2, paid=1)
+        Transaction.objects.filter(recurrence_root=self.chain[0]).update(
+            recurrence_end_type='never',
+            recurrence_end_count=None,
+        )
+        for account, transaction_type, value, due_date in (
+            (self.checking, 'CR', 1000, date(2024, 1, 20)),
+            (self.checking, 'DB', 250, date(2024, 3, 5)),
+            (self.savings, 'CR', 80, date(2024, 4, 30)),
+            (self.savings, 'DB', 30, date(2024, 9, 1)),
+        ):
+            Transaction.objects.create(
+                account=account,
+                transaction_type=transaction_type,
+                value=value,
+                description='Avulsa',
+                buy_date=date(2024, 1, 1),
+                due_date=due_date,
+            )
+        ledger.rebuild_account_balances()
+
+    def naive_balances(self, account):
+        """Saldo de cada dia do horizonte, somando transação por transação."""
+        end = date(2024, 5, 1)
+        signed = lambda t: t.value if t.transaction_type == 'CR' else -t.value
+        transactions = Transaction.objects.filter(account=account)
+        balance = account.opening_balance + sum(signed(t) for t in transactions if t.pay_date)
+        pending = [(max(t.due_date, self.START), signed(t)) for t in transactions if not t.pay_date and t.due_date <= end]
+        pending += [
+            (t.due_date, signed(t))
+            for t in project_installments(self.START, end, [account])
+        ]
+        balances = []
+        day = self.START
+        while day <= end:
+            balances.append((day, Decimal(balance + sum(value for due, value in pending if due == day)).quantize(Decimal('0.01'))))
+            balance = balances[-1][1]
+            day += timedelta(days=1)
+        return balances
+
+    def assert_matches_naive(self, forecast):
+        for account in forecast.accounts:
+            self.assertEqual(forecast.daily_balances(account.id), self.naive_balances(account))
+
+    def test_matches_naive_sum(self):
+        forecast = build_forecast(Account.objects.all(), self.MONTHS, self.START)
+
+        self.assert_matches_naive(forecast)
+        # Aluguel pago e pendente, a avulsa de 05/03 e três parcelas projetadas
+        self.assertEqual(forecast.daily_balances(self.checking.id)[-1][1], Decimal('500') - 100 + 1000 - 100 - 250 - 100 * 3)
+
+    def test_installment_moved_to_other_account(self):
+        self.chain[-1].account = self.savings
+        self.chain[-1].save()
+
+        # A série é projetada na conta da última parcela, mesmo fora da seleção
+        only_checking = build_forecast(Account.objects.filter(pk=self.checking.pk), self.MONTHS, self.START)
+        both = build_forecast(Account.objects.all(), self.MONTHS, self.START)
+
+        self.assertEqual(only_checking.daily_balances(self.checking.id), both.daily_balances(self.checking.id))
+        self.assert_matches_naive(both)
+        self.assertEqual(both.daily_balances(self.savings.id)[-1][1], Decimal('200') + 80 - 100 - 100 * 3)
+
+    def test_past_due_projections_start_on_first_day(self):
+        forecast = build_forecast(Account.objects.filter(pk=self.checking.pk), 1, date(2024, 3, 1))
+        balances = dict(forecast.daily_balances(self.checking.id))
+
+        # A parcela de 10/02 ainda não gerada entra no primeiro dia, com as pendentes vencidas
+        self.assertEqual(balances[date(2024, 3, 1)], Decimal('500') - 100 - 100 + 1000 - 100)
+        self.assertEqual(balances[date(2024, 3, 10)], Decimal('1200') - 250 - 100)
+        self.assertEqual(balances[date(2024, 4, 1)], Decimal('850'))
+
+
+class StatementImportTests(TestCase):
+    """Leitura de extratos CSV e OFX e importação sem duplicar lançamentos."""
+
+    CSV = (
+        'Data;Descrição;Valor\n'
+        '05/01/2024;Padaria   Central;-12,50\n'
+        '05/01/2024;Padaria Central;-12,50\n'
+        '06/01/2024;Salário;R$ 3.500,00\n'
+        '\n'
+        '07/01/2024;Sem valor;\n'
+        '31/02/2024;Data errada;10,00\n'
+        '08/01/2024;Zerado;0,00\n'
+    )
+
+    OFX = (
+        'OFXHEADER:100\n'
+        '<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+        '<STMTTRN>\n'
+        '<TRNTYPE>DEBIT\n'
+        '<DTPOSTED>20240110120000[-3:BRT]\n'
+        '<TRNAMT>-89.90\n'
+        '<FITID>A1\n'
+        '<MEMO>Farm&aacute;cia\n'
+        '</STMTTRN>\n'
+        '<STMTTRN>\n'
+        '<DTPOSTED>20240111\n'
+        '<TRNAMT>150.00\n'
+        '<FITID>A2\n'
+        '<NAME>Pix recebido\n'
+        '</STMTTRN>\n'
+        '<STMTTRN>\n'
+        '<DTPOSTED>20240112\n'
+        '<TRNAMT>-20.00\n'
+        '<FITID>A1\n'
+        '<MEMO>Repetido no arquivo\n'
+        '</STMTTRN>\n'
+        '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+    )
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+
+    def import_csv(self, chunk_size=None):
+        return importers.import_statement(self.account, io.StringIO(self.CSV), 'csv', chunk_size)
+
+    def test_parse_amount(self):
+        for text, expected in (
+            ('1.234,56', '1234.56'),
+            ('1,234.56', '1234.56'),
+            ('R$ -10,00', '-10.00'),
+            ('(7,5)', '-7.5'),
+            ('42,00 D', '-42.00'),
+            ('42,00C', '42.00'),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(importers.parse_amount(text), Decimal(expected))
+        with self.assertRaises(ValueError):
+            importers.parse_amount('abc')
+
+    def test_read_csv(self):
+        rows = list(importers.read_csv(io.StringIO(self.CSV)))
+
+        # A linha em branco é pulada, sem perder a numeração das demais
+        self.assertEqual([line_number for line_number, _ in rows], [2, 3, 4, 6, 7, 8])
+        self.assertEqual(rows[2][1], {'date': '06/01/2024', 'description': 'Salário', 'value': 'R$ 3.500,00'})
+        with self.assertRaises(ValueError):
+            list(importers.read_csv(io.StringIO('Descrição;Histórico\nx;y\n')))
+
+    def test_read_ofx(self):
+        rows = list(importers.read_ofx(io.StringIO(self.OFX)))
+
+        self.assertEqual([line_number for line_number, _ in rows], [3, 10, 16])
+        self.assertEqual(rows[0][1], {
+            'date': '20240110120000[-3:BRT]',
+            'value': '-89.90',
+            'description': 'Farmácia',
+            'reference': 'A1',
+        })
+        self.assertEqual(rows[1][1]['description'], 'Pix recebido')
+
+    def test_malformed_rows_are_reported(self):
+        report = self.import_csv()
+
+        self.assertEqual((report.created, report.skipped, report.error_count), (3, 0, 3))
+        self.assertEqual(
+            report.errors,
+            ['Linha 6: valor inválido', 'Linha 7: data inválida', 'Linha 8: valor zerado'],
+        )
+        # Duas compras iguais no mesmo dia continuam sendo duas transações
+        self.assertEqual(Transaction.objects.filter(description='Padaria Central').count(), 2)
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_reimport_skips_existing_lines(self):
+        self.import_csv()
+
+        report = self.import_csv(chunk_size=2)
+
+        self.assertEqual((report.created, report.skipped), (0, 3))
+        self.assertEqual(Transaction.objects.filter(account=self.account).count(), 3)
+
+    def test_ofx_reference_is_imported_once(self):
+        report = importers.import_statement(self.account, io.StringIO(self.OFX), 'ofx')
+        again = importers.import_statement(self.account, io.StringIO(self.OFX), 'ofx')
+
+        # FITID repetido no arquivo conta como a mesma transação
+        self.assertEqual((report.created, report.skipped), (2, 1))
+        self.assertEqual((again.created, again.skipped), (0, 3))
+        first = Transaction.objects.get(account=self.account, transaction_type='DB')
+        self.assertEqual((first.description, first.value, first.pay_date), ('Farmácia', Decimal('89.90'), date(2024, 1, 10)))
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_concurrent_import_of_same_lines(self):
+        engine = importers.get_engine()
+        categorize = engine.categorize
+        imported = []
+
+        def concurrent_import(transactions):
+            # Outra importação grava as mesmas linhas antes deste INSERT
+            if not imported:
+                imported.append(None)
+                imported[0] = importers.import_statement(self.account, io.StringIO(self.CSV), 'csv')
+            return categorize(transactions)
+
+        with mock.patch.object(engine, 'categorize', side_effect=concurrent_import) as patched:
+            report = self.import_csv()
+
+        # O primeiro INSERT colide; o lote é refeito já sem as linhas gravadas
+        self.assertEqual(patched.call_count, 3)
+        self.assertEqual((report.created, report.skipped), (0, 3))
+        self.assertEqual(imported[0].created, 3)
+        self.assertEqual(Transaction.objects.filter(account=self.account).count(), 3)
+        self.assertEqual(ledger.verify_account_balances(), [])
+
+    def test_other_integrity_error_is_not_retried(self):
+        # Violação de outra constraint: nenhum hash novo aparece na conta
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=IntegrityError) as patched:
+            with self.assertRaises(IntegrityError):
+                self.import_csv()
+
+        self.assertEqual(patched.call_count, 1)
+        self.assertFalse(Transaction.objects.filter(account=self.account).exists())
+
+
+class LedgerTests(TestCase):
+    """Saldos consolidados mantidos por deltas em cada caminho de gravação e exclusão."""
+
+    def setUp(self):
+        self.checking = Account.objects.create(name='Conta corrente', opening_balance=100)
+        self.savings = Account.objects.create(name='Poupança')
+
+    def create(self, **kwargs):
+        values = {
+            'account': self.checking,
+            'transaction_type': 'DB',
+            'value': 50,
+            'description': 'Mercado',
+            'buy_date': date(2024, 1, 5),
+            'due_date': date(2024, 1, 10),
+        }
+        values.update(kwargs)
+        return Transaction.objects.create(**values)
+
+    def totals(self, account):
+        balance = AccountBalance.objects.filter(account=account).first()
+        return (balance.registered_total, balance.pending_total) if balance else (0, 0)
+
+    def assert_consistent(self):
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_create_pending_and_registered(self):
+        self.create()
+        self.create(transaction_type='CR', value=200, pay_date=date(2024, 1, 5))
+
+        self.assertEqual(self.totals(self.checking), (200, -50))
+        self.assert_consistent()
+
+    def test_register_and_unregister(self):
+        transaction = self.create()
+
+        transaction.pay_date = date(2024, 1, 10)
+        transaction.save()
+        self.assertEqual(self.totals(self.checking), (-50, 0))
+        self.assert_consistent()
+
+        transaction.pay_date = None
+        transaction.save()
+        self.assertEqual(self.totals(self.checking), (0, -50))
+        self.assert_consistent()
+
+    def test_change_account_and_value(self):
+        transaction = self.create(pay_date=date(2024, 1, 10))
+
+        transaction.account = self.savings
+        transaction.value = 80
+        transaction.transaction_type = 'CR'
+        transaction.save()
+
+        self.assertEqual(self.totals(self.checking), (0, 0))
+        self.assertEqual(self.totals(self.savings), (80, 0))
+        self.assert_consistent()
+
+    def test_update_fields_without_ledger_fields(self):
+        transaction = self.create()
+        transaction.value = 70
+        transaction.description = 'Feira'
+
+        # Só a descrição é gravada: o saldo continua com o valor gravado
+        transaction.save(update_fields=['description'])
+
+        self.assertEqual(self.totals(self.checking), (0, -50))
+        self.assert_consistent()
+
+    def test_transfer_create_and_delete(self):
+        client = Client()
+        client.post(reverse('finance:transfer_create'), {
+            'source_account': self.checking.pk,
+            'destination_account': self.savings.pk,
+            'value': '30.00',
+            'buy_date': '2024-01-05',
+            'pay_date': '2024-01-05',
+        })
+        self.assertEqual(self.totals(self.checking), (-30, 0))
+        self.assertEqual(self.totals(self.savings), (30, 0))
+        self.assert_consistent()
+
+        # A exclusão do débito cascateia o crédito; os dois saem pelo sinal post_delete
+        debit = Transaction.objects.get(account=self.checking, operation_type='transfer')
+        client.post(reverse('finance:transfer_delete', args=[debit.pk]))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.totals(self.checking), (0, 0))
+        self.assertEqual(self.totals(self.savings), (0, 0))
+        self.assert_consistent()
+
+    def test_queryset_delete(self):
+        self.create(pay_date=date(2024, 1, 10))
+        self.create(value=20)
+        self.create(account=self.savings, transaction_type='CR', value=10, pay_date=date(2024, 2, 1))
+
+        Transaction.objects.filter(account=self.checking).delete()
+
+        self.assertEqual(self.totals(self.checking), (0, 0))
+        self.assertEqual(self.totals(self.savings), (10, 0))
+        self.assert_consistent()
+
+
+class MonthSummaryTests(TestCase):
+    """Resumo mensal e saldo de fechamento atualizados por deltas, inclusive em lançamentos retroativos."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente', opening_balance=1000)
+        for month, transaction_type, value in ((1, 'CR', 500), (2, 'DB', 200), (4, 'DB', 100), (6, 'CR', 50)):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_type=transaction_type,
+                value=value,
+                description='Lançamento',
+                buy_date=date(2024, month, 3),
+                pay_date=date(2024, month, 3),
+            )
+
+    def closing_balances(self):
+        return dict(
+            AccountMonthSummary.objects.filter(account=self.account).values_list('month', 'closing_balance')
+        )
+
+    def recomputed_balance(self, day):
+        """Saldo ao final de `day` somando todas as transações pagas até ele."""
+        signed = lambda t: t.value if t.transaction_type == 'CR' else -t.value
+        return self.account.opening_balance + sum(
+            signed(t) for t in Transaction.objects.filter(account=self.account, pay_date__lte=day)
+        )
+
+    def test_closing_balances(self):
+        self.assertEqual(self.closing_balances(), {
+            date(2024, 1, 1): 1500,
+            date(2024, 2, 1): 1300,
+            date(2024, 4, 1): 1200,
+            date(2024, 6, 1): 1250,
+        })
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_backdated_entry_shifts_later_months(self):
+        Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=30,
+            description='Retroativo',
+            buy_date=date(2024, 3, 15),
+            pay_date=date(2024, 3, 15),
+        )
+
+        # Março é criado a partir do fechamento de fevereiro; abril e junho deslocam
+        self.assertEqual(self.closing_balances(), {
+            date(2024, 1, 1): 1500,
+            date(2024, 2, 1): 1300,
+            date(2024, 3, 1): 1270,
+            date(2024, 4, 1): 1170,
+            date(2024, 6, 1): 1220,
+        })
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_backdated_edit_moves_between_months(self):
+        transaction = Transaction.objects.get(account=self.account, pay_date=date(2024, 4, 3))
+
+        transaction.pay_date = date(2024, 1, 20)
+        transaction.value = 150
+        transaction.save()
+
+        closing = self.closing_balances()
+        self.assertEqual(closing[date(2024, 1, 1)], 1350)
+        self.assertEqual(closing[date(2024, 2, 1)], 1150)
+        self.assertEqual(closing[date(2024, 6, 1)], 1200)
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_opening_balance_change_shifts_every_month(self):
+        account = Account.objects.get(pk=self.account.pk)
+        account.opening_balance = 900
+        account.save()
+
+        self.assertEqual(self.closing_balances()[date(2024, 6, 1)], 1150)
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_balance_at_matches_full_recompute(self):
+        Transaction.objects.create(
+            account=self.account,
+            transaction_type='DB',
+            value=75,
+            description='Retroativo',
+            buy_date=date(2024, 2, 20),
+            pay_date=date(2024, 2, 20),
+        )
+
+        for day in (date(2023, 12, 31), date(2024, 1, 2), date(2024, 1, 3), date(2024, 2, 19),
+                    date(2024, 2, 20), date(2024, 3, 31), date(2024, 5, 10), date(2024, 12, 31)):
+            with self.subTest(day=day):
+                self.assertEqual(ledger.balance_at(self.account, day), self.recomputed_balance(day))
+
+
+class AccountStatementTests(TestCase):
+    """Saldo acumulado do extrato paginado por cursor e filtros de período."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente', opening_balance=1000)
+        # Datas repetidas para que o desempate por id atravesse as páginas
+        for day, transaction_type, value in ((3, 'CR', 500), (3, 'DB', 20), (3, 'DB', 30), (8, 'DB', 200),
+                                             (8, 'CR', 15), (12, 'DB', 100), (20, 'CR', 50)):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_type=transaction_type,
+                value=value,
+                description='Lançamento',
+                buy_date=date(2024, 3, day),
+                pay_date=date(2024, 3, day),
+            )
+        self.url = reverse('finance:account_statement', args=[self.account.id])
+
+    def get(self, **params):
+        response = self.client.get(self.url, {'page_size': 3, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def expected_balances(self):
+        balance = self.account.opening_balance
+        balances = []
+        for transaction in Transaction.objects.filter(account=self.account).order_by('pay_date', 'id'):
+            balance += transaction.value if transaction.transaction_type == 'CR' else -transaction.value
+            balances.append((transaction.id, balance))
+        return balances
+
+    def page_balances(self, context):
+        return [(t.id, t.running_balance) for t in context['paid_transactions_with_balance']]
+
+    def test_running_balance_continues_across_pages(self):
+        expected = self.expected_balances()
+
+        forward = []
+        context = self.get()
+        pages = [context]
+        forward += self.page_balances(context)
+        while context['page'].has_next:
+            context = self.get(cursor=context['page'].next_cursor)
+            pages.append(context)
+            forward += self.page_balances(context)
+        self.assertEqual(forward, expected)
+        self.assertEqual(context['final_balance'], expected[-1][1])
+
+        # Voltando pelos cursores de retorno, cada página repete os mesmos saldos
+        for previous_page in reversed(pages[:-1]):
+            context = self.get(cursor=context['page'].previous_cursor)
+            self.assertEqual(self.page_balances(context), self.page_balances(previous_page))
+
+    def test_period_opening_balance_matches_ledger(self):
+        context = self.get(**{'from': '2024-03-08', 'to': '2024-03-12'})
+
+        self.assertEqual(context['opening_balance'], ledger.balance_at(self.account, date(2024, 3, 7)))
+        self.assertEqual(context['opening_balance'], 1450)
+        self.assertEqual([t.running_balance for t in context['paid_transactions_with_balance']], [1250, 1265, 1165])
+        self.assertEqual(context['final_balance'], 1165)
+
+    def test_pending_without_due_date_survives_period_filter(self):
+        undated = Transaction.objects.create(
+            account=self.account, transaction_type='DB', value=10, description='Sem vencimento',
+            buy_date=date(2024, 3, 1),
+        )
+        in_period = Transaction.objects.create(
+            account=self.account, transaction_type='DB', value=10, description='No período',
+            buy_date=date(2024, 3, 1), due_date=date(2024, 3, 10),
+        )
+        Transaction.objects.create(
+            account=self.account, transaction_type='DB', value=10, description='Fora do período',
+            buy_date=date(2024, 3, 1), due_date=date(2024, 4, 10),
+        )
+
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2024, 3, 1)):
+            context = self.get(**{'from': '2024-03-01', 'to': '2024-03-31'})
+
+        self.assertEqual({t.id for t in context['pending_transactions']}, {undated.id, in_period.id})
+
+
+class CompositeTransactionCreateTests(TestCase):
+    """A composta é gravada com um número de consultas que não cresce com as linhas."""
+
+    # Validação, INSERT da pai, INSERT das filhas e saldos das duas contas
+    MAX_QUERIES = 20
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+        self.category = Category.objects.create(category='Mercado', subcategory='Geral')
+
+    def post_data(self, line_count):
+        data = {'account': self.account.id, 'buy_date': '2024-03-01', 'pay_date': '2024-03-01'}
+        for i in range(line_count):
+            data[f'line_{i}_value'] = '10.00'
+            data[f'line_{i}_description'] = f'Item {i}'
+            data[f'line_{i}_transaction_type'] = 'DB'
+            if i % 10 == 9:
+                data[f'line_{i}_is_transfer'] = 'on'
+                data[f'line_{i}_destination_account'] = self.savings.id
+            else:
+                data[f'line_{i}_category'] = self.category.id
+        return data
+
+    def create(self, line_count):
+        """Consultas do POST, separando os INSERTs (que o banco pode dividir em lotes)."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('finance:composite_transaction_create'), self.post_data(line_count))
+        self.assertEqual(response.status_code, 302)
+        statements = [query['sql'] for query in context.captured_queries]
+        inserts = [sql for sql in statements if sql.startswith('INSERT')]
+        return len(statements), len(statements) - len(inserts)
+
+    def test_query_count_does_not_grow_per_line(self):
+        # A primeira composta cria os saldos e resumos mensais das contas
+        self.create(10)
+        _, small = self.create(10)
+        total, large = self.create(50)
+
+        self.assertLessEqual(total, self.MAX_QUERIES)
+        self.assertEqual(large, small)
+        # 50 linhas, das quais 5 transferências com contrapartida na poupança
+        self.assertEqual(Transaction.objects.filter(account=self.savings).count(), 1 + 1 + 5)
+        self.assertEqual(Transaction.objects.count(), 11 + 11 + 55)
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+
+class DuplicateTransactionTests(TestCase):
+    """Fingerprint normalizado, aviso de duplicidade no formulário e relatório de duplicidades."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+
+    def create(self, **kwargs):
+        values = {
+            'account': self.account,
+            'transaction_type': 'DB',
+            'value': Decimal('42.00'),
+            'description': 'Padaria São João',
+            'buy_date': date(2024, 1, 5),
+        }
+        values.update(kwargs)
+        return Transaction.objects.create(**values)
+
+    def test_fingerprint_normalization(self):
+        fingerprint = Transaction.build_fingerprint(self.account.pk, date(2024, 1, 5), Decimal('42.00'), 'DB', 'Padaria São João')
+
+        for description, value in (
+            ('  padaria   SAO joão ', Decimal('42.00')),
+            ('PADARIA SÃO JOÃO', 42),
+            ('Padaria Sao Joao', '42.0'),
+        ):
+            with self.subTest(description=description, value=value):
+                self.assertEqual(
+                    Transaction.build_fingerprint(self.account.pk, date(2024, 1, 5), value, 'DB', description),
+                    fingerprint,
+                )
+        for args in (
+            (self.savings.pk, date(2024, 1, 5), Decimal('42.00'), 'DB', 'Padaria São João'),
+            (self.account.pk, date(2024, 1, 6), Decimal('42.00'), 'DB', 'Padaria São João'),
+            (self.account.pk, date(2024, 1, 5), Decimal('42.01'), 'DB', 'Padaria São João'),
+            (self.account.pk, date(2024, 1, 5), Decimal('42.00'), 'CR', 'Padaria São João'),
+            (self.account.pk, date(2024, 1, 5), Decimal('42.00'), 'DB', 'Padaria Santa Rita'),
+        ):
+            with self.subTest(args=args):
+                self.assertNotEqual(Transaction.build_fingerprint(*args), fingerprint)
+
+    def test_fingerprint_kept_on_every_write_path(self):
+        transaction = self.create()
+        self.assertEqual(transaction.fingerprint, transaction.compute_fingerprint())
+
+        transaction.description = 'Mercado'
+        transaction.save(update_fields=['description'])
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.fingerprint, transaction.compute_fingerprint())
+
+        transaction.value = Decimal('10.00')
+        Transaction.objects.bulk_update([transaction], ['value'])
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.fingerprint, transaction.compute_fingerprint())
+
+        [created] = Transaction.objects.bulk_create([Transaction(
+            account=self.account,
+            transaction_type='DB',
+            value=Decimal('10.00'),
+            description='  MERCADO ',
+            buy_date=date(2024, 1, 5),
+        )])
+        self.assertEqual(Transaction.objects.get(pk=created.pk).fingerprint, transaction.fingerprint)
+
+    def test_get_possible_duplicates(self):
+        first = self.create()
+        second = self.create(description='padaria sao joao')
+        self.create(buy_date=date(2024, 1, 6))
+
+        self.assertEqual(list(first.get_possible_duplicates()), [second])
+
+    def test_create_warns_about_duplicates(self):
+        existing = self.create()
+
+        response = self.client.post(reverse('finance:transaction_create'), {
+            'account': self.account.id,
+            'transaction_type': 'DB',
+            'operation_type': 'simple',
+            'value': '42',
+            'description': 'PADARIA SAO JOAO',
+            'buy_date': '2024-01-05',
+            'recurrence_interval': 1,
+        }, follow=True)
+
+        # O aviso não impede a gravação
+        self.assertEqual(Transaction.objects.filter(fingerprint=existing.fingerprint).count(), 2)
+        warnings = [str(message) for message in response.context['messages'] if message.level_tag == 'warning']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn(f'#{existing.id}', warnings[0])
+
+    def test_recurring_create_compares_saved_description(self):
+        installment = self.create(description='Padaria São João - 1')
+        self.create()
+        data = {
+            'account': self.account.id,
+            'transaction_type': 'DB',
+            'operation_type': 'simple',
+            'value': '42',
+            'description': 'Padaria São João',
+            'buy_date': '2024-01-05',
+            'is_recurring': 'on',
+            'recurrence_type': 'monthly',
+            'recurrence_interval': 1,
+            'recurrence_start_date': '2024-01-10',
+            'recurrence_end_type': 'never',
+        }
+
+        response = self.client.post(reverse('finance:transaction_create'), data, follow=True)
+
+        # A parcela gravada é "Padaria São João - 1": só ela é duplicidade
+        warnings = [str(message) for message in response.context['messages'] if message.level_tag == 'warning']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn(f'#{installment.id})', warnings[0])
+
+    def test_register_does_not_look_for_duplicates(self):
+        transaction = self.create(due_date=date(2024, 1, 10))
+        self.create()
+
+        with mock.patch.object(Transaction, 'get_possible_duplicates') as patched:
+            response = self.client.post(reverse('finance:transaction_register', args=[transaction.id]), {
+                'account': self.account.id,
+                'transaction_type': 'DB',
+                'operation_type': 'simple',
+                'value': '42',
+                'description': 'Padaria São João',
+                'buy_date': '2024-01-05',
+                'due_date': '2024-01-10',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        patched.assert_not_called()
+
+    def test_duplicate_transactions_view(self):
+        pair = [self.create(), self.create(description='padaria sao joao')]
+        triple = [self.create(value=5, description='Café') for _ in range(3)]
+        self.create(buy_date=date(2024, 1, 6))
+
+        with self.settings(FINANCE_DUPLICATES_PAGE_SIZE=50):
+            response = self.client.get(reverse('finance:duplicate_transactions'))
+
+        # Maiores grupos primeiro, transações em ordem de id
+        self.assertEqual(response.context['duplicate_groups'], [triple, pair])
+
+
+class AutomatonTests(SimpleTestCase):
+    """Busca de vários padrões em uma passada pelo texto."""
+
+    def test_overlapping_patterns(self):
+        patterns = ['he', 'she', 'his', 'hers']
+        automaton = categorization.Automaton(patterns)
+
+        self.assertEqual({patterns[i] for i in automaton.search('ushers')}, {'he', 'she', 'hers'})
+        self.assertEqual({patterns[i] for i in automaton.search('ahishe')}, {'his', 'she', 'he'})
+        self.assertEqual(automaton.search('xyz'), set())
+
+    def test_pattern_inside_another(self):
+        patterns = ['posto', 'posto shell', 'shell']
+        automaton = categorization.Automaton(patterns)
+
+        self.assertEqual({patterns[i] for i in automaton.search('compra posto shell br')}, set(patterns))
+        self.assertEqual({patterns[i] for i in automaton.search('postos')}, {'posto'})
+
+
+class CategorizationRuleTests(TestCase):
+    """Escolha da regra: texto sem caixa e acentos, prioridade, especificidade e condições."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+        self.fuel = Category.objects.create(category='Transporte', subcategory='Combustível')
+        self.food = Category.objects.create(category='Alimentação', subcategory='Padaria')
+        self.other = Category.objects.create(category='Outros', subcategory='Geral')
+        # O motor em cache pode ter vindo de outro teste com a mesma marca
+        categorization._cache['stamp'] = None
+
+    def rule(self, name, pattern, category, **kwargs):
+        return CategorizationRule.objects.create(name=name, pattern=pattern, category=category, **kwargs)
+
+    def match(self, description, **kwargs):
+        rule = categorization.get_engine().match(description, **kwargs)
+        return rule.name if rule else None
+
+    def test_case_and_accent_folding(self):
+        self.rule('Padaria', '  Padaria   São João ', self.food)
+
+        self.assertEqual(self.match('COMPRA PADARIA SAO JOAO 05/01'), 'Padaria')
+        self.assertEqual(self.match('padaria são  joão'), 'Padaria')
+        self.assertIsNone(self.match('padaria santa rita'))
+
+    def test_more_specific_pattern_wins_at_same_priority(self):
+        self.rule('Posto', 'posto', self.fuel)
+        self.rule('Conveniência', 'posto shell conveniencia', self.food)
+
+        self.assertEqual(self.match('POSTO SHELL CONVENIÊNCIA'), 'Conveniência')
+        self.assertEqual(self.match('posto shell'), 'Posto')
+
+    def test_priority_beats_specificity(self):
+        self.rule('Conveniência', 'posto shell conveniencia', self.food)
+        self.rule('Posto', 'posto', self.fuel, priority=10)
+
+        self.assertEqual(self.match('POSTO SHELL CONVENIÊNCIA'), 'Posto')
+
+    def test_conditions_fall_through_to_next_rule(self):
+        self.rule('Posto caro', 'posto', self.other, priority=5, min_value=Decimal('500'))
+        self.rule('Posto da poupança', 'posto', self.other, priority=4, account=self.savings)
+        self.rule('Estorno', 'posto', self.other, priority=3, transaction_type='CR')
+        self.rule('Posto', 'posto', self.fuel)
+        self.rule('Qualquer débito', '', self.other, priority=-1, transaction_type='DB')
+
+        self.assertEqual(self.match('posto', value=Decimal('600'), account_id=self.account.id, transaction_type='DB'), 'Posto caro')
+        self.assertEqual(self.match('posto', value=Decimal('50'), account_id=self.savings.id, transaction_type='DB'), 'Posto da poupança')
+        self.assertEqual(self.match('posto', value=Decimal('50'), account_id=self.account.id, transaction_type='CR'), 'Estorno')
+        self.assertEqual(self.match('posto', value=Decimal('50'), account_id=self.account.id, transaction_type='DB'), 'Posto')
+        # Regra sem texto vale para qualquer descrição
+        self.assertEqual(self.match('mercado', transaction_type='DB'), 'Qualquer débito')
+        self.assertIsNone(self.match('mercado', transaction_type='CR'))
+
+    def test_engine_is_rebuilt_when_rules_change(self):
+        rule = self.rule('Posto', 'posto', self.fuel)
+        engine = categorization.get_engine()
+        self.assertIs(categorization.get_engine(), engine)
+
+        rule.is_active = False
+        rule.save()
+
+        self.assertIsNot(categorization.get_engine(), engine)
+        self.assertIsNone(self.match('posto'))
+
+    def test_engine_is_rebuilt_after_bulk_changes(self):
+        rule = self.rule('Posto', 'posto', self.fuel)
+        self.rule('Padaria', 'padaria', self.food)
+        engine = categorization.get_engine()
+
+        # Ação em lote do admin: nenhum save() é chamado
+        CategorizationRule.objects.filter(pk=rule.pk).update(is_active=False)
+
+        self.assertIsNot(categorization.get_engine(), engine)
+        self.assertIsNone(self.match('posto'))
+        engine = categorization.get_engine()
+
+        rule.is_active = True
+        CategorizationRule.objects.bulk_update([rule], ['is_active'])
+
+        self.assertIsNot(categorization.get_engine(), engine)
+        self.assertEqual(self.match('posto'), 'Posto')
+
+    def test_categorize_fills_only_empty_fields(self):
+        self.rule('Posto', 'posto', self.fuel)
+        transactions = [
+            Transaction(account=self.account, transaction_type='DB', value=10, description='Posto Ipiranga'),
+            Transaction(account=self.account, transaction_type='DB', value=10, description='Posto Shell', category=self.other),
+            Transaction(account=self.account, transaction_type='DB', value=10, description='Mercado'),
+        ]
+
+        self.assertEqual(categorization.get_engine().categorize(transactions), 1)
+        self.assertEqual([t.category_id for t in transactions], [self.fuel.id, self.other.id, None])
+
+
+class RecurrenceProjectionTests(TestCase):
+    """Parcelas virtuais, projeção por janela de datas e calendário, sem sobrepor as parcelas gravadas."""
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.savings = Account.objects.create(name='Poupança')
+        # Aluguel em seis parcelas mensais (dia 10), das quais três gravadas
+        self.root = self.create_series(self.account, 6)
+        self.generate(2)
+
+    def create_series(self, account, length):
+        root = create_recurring_chain(account, 1)[0]
+        Transaction.objects.filter(pk=root.pk).update(recurrence_end_count=length)
+        root.refresh_from_db()
+        return root
+
+    def generate(self, count):
+        """Grava as próximas `count` parcelas da série, uma a uma."""
+        for _ in range(count):
+            self.last_installment(self.root).generate_next_installment()
+
+    def last_installment(self, root):
+        return Transaction.objects.filter(recurrence_root=root).order_by('-recurrence_sequence').first()
+
+    def calendar_days(self, month, today, **params):
+        with mock.patch('django.utils.timezone.localdate', return_value=today):
+            response = self.client.get(reverse('finance:recurrence_calendar'), {'month': month, **params})
+        return {
+            day: [(t.description, getattr(t, 'is_virtual', False)) for t in transactions]
+            for week in response.context['weeks']
+            for day, transactions in week
+            if transactions
+        }
+
+    def test_virtual_installments_follow_materialized(self):
+        last = self.last_installment(self.root)
+        self.assertEqual(last.recurrence_sequence, 3)
+
+        virtual = list(iter_virtual_installments(self.root, last))
+
+        self.assertEqual(
+            [(t.recurrence_sequence, t.due_date, t.description) for t in virtual],
+            [
+                (4, date(2024, 4, 10), 'Aluguel - 04/06'),
+                (5, date(2024, 5, 10), 'Aluguel - 05/06'),
+                (6, date(2024, 6, 10), 'Aluguel - 06/06'),
+            ],
+        )
+        self.assertTrue(all(t.is_virtual and t.pk is None for t in virtual))
+        self.assertEqual(Transaction.objects.filter(recurrence_root=self.root).count(), 3)
+
+    def test_project_installments_window_is_inclusive(self):
+        def projected(date_from, date_to):
+            return [t.recurrence_sequence for t in project_installments(date_from, date_to)]
+
+        self.assertEqual(projected(date(2024, 4, 10), date(2024, 5, 10)), [4, 5])
+        self.assertEqual(projected(date(2024, 4, 11), date(2024, 5, 9)), [])
+        # As parcelas gravadas (até março) não são projetadas de novo
+        self.assertEqual(projected(date(2024, 1, 1), date(2024, 12, 31)), [4, 5, 6])
+
+    def test_project_installments_merges_series_by_date(self):
+        other = self.create_series(self.savings, 4)
+        Transaction.objects.filter(pk=other.pk).update(due_date=date(2024, 1, 5), recurrence_start_date=date(2024, 1, 5))
+        other.refresh_from_db()
+
+        projected = [
+            (t.due_date, t.account_id)
+            for t in project_installments(date(2024, 3, 1), date(2024, 5, 31))
+        ]
+
+        self.assertEqual(projected, [
+            (date(2024, 3, 5), self.savings.id),
+            (date(2024, 4, 5), self.savings.id),
+            (date(2024, 4, 10), self.account.id),
+            (date(2024, 5, 10), self.account.id),
+        ])
+        only_savings = list(project_installments(date(2024, 3, 1), date(2024, 5, 31), [self.savings]))
+        self.assertEqual([t.due_date for t in only_savings], [date(2024, 3, 5), date(2024, 4, 5)])
+
+    def test_calendar_shows_each_installment_once(self):
+        # Uma parcela projetada passa a ser gravada: aparece só como pendente
+        self.generate(1)
+
+        days = self.calendar_days('2024-04', today=date(2024, 4, 1))
+        self.assertEqual(days, {date(2024, 4, 10): [('Aluguel - 04/06', False)]})
+
+        days = self.calendar_days('2024-05', today=date(2024, 4, 1))
+        self.assertEqual(days, {date(2024, 5, 10): [('Aluguel - 05/06', True)]})
+
+    def test_calendar_projects_only_from_today(self):
+        # Abril já passou do dia 10: a parcela não gerada não é projetada
+        self.assertEqual(self.calendar_days('2024-04', today=date(2024, 4, 11)), {})
+        self.assertEqual(
+            self.calendar_days('2024-04', today=date(2024, 4, 10)),
+            {date(2024, 4, 10): [('Aluguel - 04/06', True)]},
+        )
+        self.assertEqual(self.calendar_days('2024-06', today=date(2024, 4, 11), account=self.savings.id), {})
+
+
+class ScanMinimumBalancesTests(TestCase):
+    """Alertas de saldo mínimo gravados pelo comando scan_minimum_balances."""
+
+    TODAY = date(2024, 3, 1)
+
+    def setUp(self):
+        self.below = Account.objects.create(name='Abaixo', opening_balance=100, minimum_balance=200)
+        self.projected = Account.objects.create(name='Prevista', opening_balance=1000)
+        self.healthy = Account.objects.create(name='Saudável', opening_balance=1000, minimum_balance=100)
+        Account.objects.create(name='Encerrada', opening_balance=-50, is_closed=True)
+        Transaction.objects.create(
+            account=self.projected,
+            transaction_type='DB',
+            value=1500,
+            description='Cartão',
+            buy_date=date(2024, 2, 20),
+            due_date=date(2024, 3, 11),
+        )
+
+    def scan(self):
+        output = io.StringIO()
+        with mock.patch('django.utils.timezone.localdate', return_value=self.TODAY):
+            call_command('scan_minimum_balances', months=2, stdout=output)
+        return output.getvalue()
+
+    def test_scan_creates_alerts(self):
+        output = self.scan()
+
+        alerts = {alert.account_id: alert for alert in BalanceAlert.objects.all()}
+        self.assertEqual(set(alerts), {self.below.id, self.projected.id})
+        below = alerts[self.below.id]
+        self.assertEqual(
+            (below.kind, below.current_balance, below.breach_date),
+            ('current', Decimal('100.00'), self.TODAY),
+        )
+        projected = alerts[self.projected.id]
+        self.assertEqual(
+            (projected.kind, projected.current_balance, projected.lowest_balance, projected.breach_date),
+            ('projected', Decimal('1000.00'), Decimal('-500.00'), date(2024, 3, 11)),
+        )
+        self.assertIn('3 conta(s) verificada(s) até 01/05/2024, 2 com alerta', output)
+
+    def test_rescan_updates_and_removes_alerts(self):
+        self.scan()
+        projected = BalanceAlert.objects.get(account=self.projected)
+
+        account = Account.objects.get(pk=self.below.pk)
+        account.opening_balance = 500
+        account.save()
+        Transaction.objects.filter(account=self.projected).update(due_date=date(2024, 4, 5))
+        ledger.rebuild_account_balances()
+        self.scan()
+
+        # A conta que voltou ao normal perde o alerta; a outra é atualizada na mesma linha
+        self.assertEqual(list(BalanceAlert.objects.values_list('account_id', flat=True)), [self.projected.id])
+        updated = BalanceAlert.objects.get(account=self.projected)
+        self.assertEqual(updated.pk, projected.pk)
+        self.assertEqual(updated.breach_date, date(2024, 4, 5))
+
+
+class GenerateDueInstallmentsTests(TestCase):
+    """O comando generate_due_installments alcança as séries atrasadas, em lotes, sem duplicar parcelas."""
+
+    TODAY = date(2024, 4, 1)
+
+    def setUp(self):
+        self.account = Account.objects.create(name='Conta corrente')
+        self.roots = [create_recurring_chain(self.account, 1)[0] for _ in range(3)]
+        Transaction.objects.filter(pk__in=[root.pk for root in self.roots]).update(
+            recurrence_end_type='never',
+            recurrence_end_count=None,
+        )
+        # Série finita com duas parcelas e série interrompida
+        self.finite = create_recurring_chain(self.account, 2)[0]
+        self.interrupted = create_recurring_chain(self.account, 1)[0]
+        Transaction.objects.filter(pk=self.interrupted.pk).update(
+            recurrence_end_type='never',
+            recurrence_end_count=None,
+            recurrence_interrupted=True,
+        )
+
+    def generate(self, **options):
+        output = io.StringIO()
+        with mock.patch('django.utils.timezone.localdate', return_value=self.TODAY):
+            with CaptureQueriesContext(connection) as context:
+                call_command('generate_due_installments', days=30, stdout=output, **options)
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT INTO "finance_transaction"')]
+        return output.getvalue(), len(inserts)
+
+    def due_dates(self, root):
+        return list(
+            Transaction.objects.filter(recurrence_root=root).order_by('recurrence_sequence').values_list('due_date', flat=True)
+        )
+
+    def test_catches_up_lagging_series(self):
+        output, _ = self.generate()
+
+        # Até 01/05: fevereiro, março e abril nas séries sem fim
+        for root in self.roots:
+            self.assertEqual(self.due_dates(root), [date(2024, month, 10) for month in (1, 2, 3, 4)])
+        self.assertEqual(self.due_dates(self.finite), [date(2024, 1, 10), date(2024, 1, 10)])
+        self.assertEqual(self.due_dates(self.interrupted), [date(2024, 1, 10)])
+        self.assertIn('4 série(s) verificada(s), 9 parcela(s) gerada(s) com vencimento até 01/05/2024', output)
+        for root in self.roots:
+            self.assertIn(f'Série #{root.pk}: 3 parcela(s) gerada(s).', output)
+        self.assertEqual(ledger.verify_account_balances(), [])
+        self.assertEqual(ledger.verify_month_summaries(), [])
+
+    def test_series_lagging_beyond_catch_up_window_are_skipped(self):
+        lagging = self.roots[0]
+        # As outras duas séries já têm fevereiro: falta a partir de março
+        for root in Transaction.objects.filter(pk__in=[root.pk for root in self.roots[1:]]):
+            Transaction.objects.bulk_create(list(islice(iter_virtual_installments(root, root), 1)))
+
+        output, _ = self.generate(catch_up_days=40)
+
+        # Corte em 21/02: a série parada desde janeiro não recebe nada
+        self.assertEqual(self.due_dates(lagging), [date(2024, 1, 10)])
+        for root in self.roots[1:]:
+            self.assertEqual(self.due_dates(root), [date(2024, month, 10) for month in (1, 2, 3, 4)])
+        self.assertIn(f'1 série(s) com parcelas vencidas antes de 21/02/2024 ignorada(s): #{lagging.pk}', output)
+        self.assertIn('4 série(s) verificada(s), 4 parcela(s) gerada(s)', output)
+
+    def test_second_run_is_idempotent(self):
+        self.generate()
+        count = Transaction.objects.count()
+
+        output, inserts = self.generate()
+
+        self.assertEqual(Transaction.objects.count(), count)
+        self.assertEqual(inserts, 0)
+        self.assertIn('0 parcela(s) gerada(s)', output)
+
+    def test_one_insert_per_batch(self):
+        _, inserts = self.generate(batch_size=10)
+        self.assertEqual(inserts, 1)
+
+    def test_small_batches_give_the_same_result(self):
+        output, inserts = self.generate(batch_size=1)
+
+        # Um lote por série; só as três séries sem fim têm parcelas a gerar
+        self.assertEqual(inserts, 3)
+        self.assertIn('4 série(s) verificada(s), 9 parcela(s) gerada(s)', output)
+        for root in self.roots:
+            self.assertEqual(len(self.due_dates(root)), 4)
+        self.assertEqual(ledger.verify_account_balances(), [])
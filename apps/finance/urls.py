@@ -16,6 +16,8 @@ urlpatterns = [
     path('transactions/create/simple/', views.transaction_create, name='transaction_create'),
     path('transactions/create/transfer/', views.transfer_create, name='transfer_create'),
     path('transactions/create/composite/', views.composite_transaction_create, name='composite_transaction_create'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
+    path('transactions/duplicates/', views.duplicate_transactions, name='duplicate_transactions'),
     path('transactions/<int:transaction_id>/update/', views.transaction_update, name='transaction_update'),
     path('transactions/<int:transaction_id>/update/transfer/', views.transfer_update, name='transfer_update'),
     path('transactions/<int:transaction_id>/update/composite/', views.composite_transaction_update, name='composite_transaction_update'),
@@ -24,7 +26,11 @@ urlpatterns = [
     path('transactions/<int:transaction_id>/delete/composite/', views.composite_transaction_delete, name='composite_transaction_delete'),
     path('transactions/<int:transaction_id>/recurring/undo/', views.recurring_transaction_undo_payment, name='recurring_transaction_undo_payment'),
     path('transactions/<int:transaction_id>/recurring/interrupt/', views.recurring_transaction_interrupt, name='recurring_transaction_interrupt'),
+    path('transactions/<int:transaction_id>/recurring/materialize/', views.recurring_transaction_materialize, name='recurring_transaction_materialize'),
     path('transactions/<int:transaction_id>/register/', views.transaction_register, name='transaction_register'),
+    path('transactions/register/bulk/', views.transaction_bulk_register, name='transaction_bulk_register'),
     path('account/<int:account_id>/statement/', views.account_statement, name='account_statement'),
+    path('calendar/', views.recurrence_calendar, name='recurrence_calendar'),
+    path('forecast/', views.cash_flow_forecast, name='cash_flow_forecast'),
 ]
 
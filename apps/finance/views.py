@@ -1,22 +1,215 @@
 from django import forms
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib import messages
+from django.db.models import Case, Count, DecimalField, F, Max, Q, Sum, Value, When, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+from dateutil.relativedelta import relativedelta
+from datetime import timedelta
 from decimal import Decimal
+import calendar
+import io
 import json
-from .models import Account, Transaction, Beneficiary, Category
-from .forms import AccountForm, TransactionForm, TransferTransactionForm, CompositeTransactionForm, RecurringTransactionForm
+from django.db import transaction as db_transaction
+from .models import Account, BalanceAlert, Transaction, Beneficiary, Category
+from . import ledger
+from .forms import AccountForm, TransactionForm, TransferTransactionForm, CompositeTransactionForm, RecurringTransactionForm, TransactionImportForm
+from .forecast import build_forecast
+from .importers import detect_format, import_statement
+from .pagination import KeysetPaginator
+from .recurrence import generate_next_installments, materialize_installments, project_installments, resolve_transaction_rows
+
+
+def signed_value_expression():
+    """Valor da transação com sinal: positivo para crédito, negativo para débito."""
+    return Case(
+        When(transaction_type='CR', then=F('value')),
+        default=-F('value'),
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+
+
+def with_balances(accounts):
+    """
+    Anota saldo atual e total pendente das contas a partir do saldo
+    consolidado (AccountBalance), na mesma consulta que lista as contas.
+    """
+    zero = Value(Decimal('0'))
+    return accounts.annotate(
+        current_balance=F('opening_balance') + Coalesce(F('balance__registered_total'), zero),
+        pending_total=Coalesce(F('balance__pending_total'), zero),
+    )
+
+
+def build_composite_transactions(account, buy_date, pay_date, lines):
+    """
+    Monta em memória (sem gravar) as transações de uma composta a partir das
+    linhas validadas do CompositeTransactionForm.
+    
+    A primeira linha é a transação pai; as demais linhas e as contrapartidas
+    de crédito das transferências são filhas com parent_type='composite'.
+    Retorna (pai, filhas); o parent_transaction das filhas deve ser definido
+    depois que a pai for gravada.
+    """
+    # Determina status baseado em pay_date
+    status = 'registrado' if pay_date else 'pendente'
+    
+    parent_transaction = None
+    children = []
+    
+    for line in lines:
+        # Determina operation_type baseado no tipo de linha
+        if line['line_type'] == 'transfer':
+            operation_type = 'transfer'
+            # Para transferências, sempre cria débito na conta principal
+            transaction_type = 'DB'
+        else:
+            operation_type = 'simple'
+            transaction_type = line['transaction_type']
+        
+        # Transação principal (débito ou crédito na conta compartilhada)
+        transaction = Transaction(
+            account=account,
+            destination_account=line['destination_account'],
+            transaction_type=transaction_type,
+            operation_type=operation_type,
+            value=Decimal(str(line['value'])),
+            category=line['category'],
+            description=line['description'],
+            buy_date=buy_date,
+            pay_date=pay_date,
+            status=status
+        )
+        
+        # Primeira transação é a pai, demais são filhas
+        if parent_transaction is None:
+            parent_transaction = transaction
+        else:
+            transaction.parent_type = 'composite'
+            children.append(transaction)
+        
+        # Se for transferência, cria também a transação de crédito na conta de destino
+        if line['line_type'] == 'transfer' and line['destination_account']:
+            children.append(Transaction(
+                account=line['destination_account'],
+                destination_account=account,
+                transaction_type='CR',
+                operation_type='transfer',
+                value=Decimal(str(line['value'])),
+                category=None,
+                description=line['description'] or f'Transferência de {account.name}',
+                buy_date=buy_date,
+                pay_date=pay_date,
+                status=status,
+                parent_type='composite'
+            ))
+    
+    return parent_transaction, children
+
+
+# Campos de uma transação composta definidos pelas linhas do formulário
+COMPOSITE_FIELDS = (
+    'account', 'destination_account', 'transaction_type', 'operation_type', 'value',
+    'category', 'description', 'buy_date', 'pay_date', 'status',
+)
+
+
+def is_credit_leg(row):
+    """Contrapartida de crédito (na conta de destino) de uma linha de transferência."""
+    return row.operation_type == 'transfer' and row.transaction_type == 'CR'
+
+
+def group_composite_slots(rows):
+    """
+    Agrupa as transações de uma composta (pai primeiro, filhas na ordem de
+    criação) em pares (linha, contrapartida de crédito ou None), um por linha
+    do formulário, para comparar a composta existente com a submetida.
+
+    A contrapartida é associada ao débito pela conta de destino, valor e
+    descrição, não pela posição: contrapartidas criadas em uma edição ficam
+    no fim da ordem de criação. Contrapartidas sem débito correspondente
+    viram linhas próprias no fim.
+    """
+    legs = [row for row in rows if is_credit_leg(row)]
+    slots = []
+    for row in rows:
+        if is_credit_leg(row):
+            continue
+        leg = None
+        if row.operation_type == 'transfer':
+            candidates = [l for l in legs if l.account_id == row.destination_account_id]
+            leg = next(
+                (l for l in candidates if l.value == row.value and l.description == row.description),
+                next((l for l in candidates if l.value == row.value), next(iter(candidates), None)),
+            )
+            if leg is not None:
+                legs.remove(leg)
+        slots.append((row, leg))
+    slots.extend((leg, None) for leg in legs)
+    return slots
+
+
+def copy_composite_fields(source, target):
+    """Copia os campos da composta de source para target; retorna se algo mudou."""
+    changed = False
+    for name in COMPOSITE_FIELDS:
+        attname = Transaction._meta.get_field(name).attname
+        value = getattr(source, attname)
+        if getattr(target, attname) != value:
+            setattr(target, attname, value)
+            changed = True
+    if changed:
+        target.updated_at = timezone.now()
+    return changed
+
+
+def warn_possible_duplicates(request, transaction):
+    """
+    Avisa (sem impedir a gravação) sobre transações iguais à que acabou de
+    ser gravada, pelo fingerprint da descrição efetivamente salva (com o
+    sufixo de parcela das recorrências).
+    """
+    duplicates = list(transaction.get_possible_duplicates()[:5])
+    if duplicates:
+        ids = ', '.join(f'#{duplicate.id}' for duplicate in duplicates)
+        messages.warning(
+            request,
+            f'Atenção: já existe transação com mesma conta, data, valor, tipo e descrição ({ids}).'
+        )
+
+
+def get_page_size(request, setting_name, default):
+    """
+    Lê o tamanho de página da query string (page_size), limitado ao máximo
+    configurado em FINANCE_MAX_PAGE_SIZE.
+    """
+    page_size = getattr(settings, setting_name, default)
+    max_page_size = getattr(settings, 'FINANCE_MAX_PAGE_SIZE', 500)
+    try:
+        page_size = int(request.GET.get('page_size', page_size))
+    except (TypeError, ValueError):
+        pass
+    return max(1, min(page_size, max_page_size))
 
 
 def finance_home(request):
     """
     Página inicial da aplicação finance com visão geral.
+    
+    Os alertas de saldo mínimo vêm da última execução do comando
+    scan_minimum_balances.
     """
-    accounts = Account.objects.filter(is_closed=False).order_by('-is_favorite', 'name')
+    accounts = with_balances(Account.objects.filter(is_closed=False)).order_by('-is_favorite', 'name')
     total_accounts = accounts.count()
     total_transactions = Transaction.objects.count()
+    balance_alerts = BalanceAlert.objects.select_related('account')
     
     context = {
         'accounts': accounts,
+        'balance_alerts': balance_alerts,
         'total_accounts': total_accounts,
         'total_transactions': total_transactions,
     }
@@ -28,7 +221,7 @@ def accounts_list(request):
     """
     Lista todas as contas.
     """
-    accounts = Account.objects.all().order_by('-is_favorite', 'name')
+    accounts = with_balances(Account.objects.all()).order_by('-is_favorite', 'name')
     
     context = {
         'accounts': accounts,
@@ -87,7 +280,8 @@ def account_delete(request, account_id):
     account = get_object_or_404(Account, id=account_id)
     
     if request.method == 'POST':
-        account.delete()
+        with db_transaction.atomic(), ledger.deferred():
+            account.delete()
         messages.success(request, 'Conta deletada com sucesso!')
         return redirect('finance:accounts_list')
     
@@ -126,12 +320,28 @@ def categories_list(request):
 
 def transactions_list(request):
     """
-    Lista todas as transações.
+    Lista as transações, uma página por vez.
+    
+    Usa paginação por cursor sobre (buy_date, created_at, id), então o custo de
+    cada página é o mesmo independentemente de quão fundo se navega.
+    
+    Parâmetros via query string:
+    - cursor: cursor opaco retornado pela página anterior/seguinte (opcional)
+    - page_size: quantidade de transações por página (opcional)
     """
-    transactions = Transaction.objects.all().order_by('-buy_date', '-created_at')
+    page_size = get_page_size(request, 'FINANCE_TRANSACTIONS_PAGE_SIZE', 50)
+    transactions = Transaction.objects.select_related('account', 'category')
+    paginator = KeysetPaginator(transactions, ('-buy_date', '-created_at', '-id'), page_size)
+    page = paginator.get_page(request.GET.get('cursor'))
+    
+    # Resolve recorrências e composições da página de uma só vez,
+    # evitando consultas por linha durante a renderização
+    transactions = resolve_transaction_rows(page.object_list)
     
     context = {
         'transactions': transactions,
+        'page': page,
+        'page_size': page_size,
     }
     
     return render(request, 'finance/transactions_list.html', context)
@@ -161,8 +371,10 @@ def transaction_create(request):
                 transaction.is_recurring = True
                 transaction.recurrence_type = form.cleaned_data.get('recurrence_type')
                 transaction.recurrence_interval = form.cleaned_data.get('recurrence_interval', 1)
+                transaction.recurrence_rule = form.cleaned_data.get('recurrence_rule', '')
                 transaction.recurrence_start_date = form.cleaned_data.get('recurrence_start_date')
                 transaction.recurrence_end_type = form.cleaned_data.get('recurrence_end_type', 'never')
+                transaction.recurrence_end_date = form.cleaned_data.get('recurrence_end_date')
                 transaction.recurrence_end_count = form.cleaned_data.get('recurrence_end_count')
                 # Define due_date como recurrence_start_date se não foi preenchido
                 if not transaction.due_date and transaction.recurrence_start_date:
@@ -181,6 +393,7 @@ def transaction_create(request):
             
             transaction.save()
             messages.success(request, 'Transação criada com sucesso!')
+            warn_possible_duplicates(request, transaction)
             return redirect('finance:transactions_list')
     else:
         form = RecurringTransactionForm()
@@ -404,7 +617,7 @@ def transaction_update(request, transaction_id):
     # Para transações recorrentes, usa RecurringTransactionForm
     # Mas não permite editar campos de recorrência se já houver parcelas geradas
     is_recurring = transaction.is_recurring
-    has_children = transaction.child_transactions.filter(parent_type='recurring').exists()
+    has_children = is_recurring and transaction.has_next_recurring_installment()
     
     if request.method == 'POST':
         if is_recurring:
@@ -424,8 +637,10 @@ def transaction_update(request, transaction_id):
                     # Mantém valores originais de recorrência
                     transaction.recurrence_type = parent.recurrence_type
                     transaction.recurrence_interval = parent.recurrence_interval
+                    transaction.recurrence_rule = parent.recurrence_rule
                     transaction.recurrence_start_date = parent.recurrence_start_date
                     transaction.recurrence_end_type = parent.recurrence_end_type
+                    transaction.recurrence_end_date = parent.recurrence_end_date
                     transaction.recurrence_end_count = parent.recurrence_end_count
                 else:
                     # Permite alterar se ainda não há parcelas geradas
@@ -433,12 +648,15 @@ def transaction_update(request, transaction_id):
                     if transaction.is_recurring:
                         transaction.recurrence_type = form.cleaned_data.get('recurrence_type')
                         transaction.recurrence_interval = form.cleaned_data.get('recurrence_interval', 1)
+                        transaction.recurrence_rule = form.cleaned_data.get('recurrence_rule', '')
                         transaction.recurrence_start_date = form.cleaned_data.get('recurrence_start_date')
                         transaction.recurrence_end_type = form.cleaned_data.get('recurrence_end_type', 'never')
+                        transaction.recurrence_end_date = form.cleaned_data.get('recurrence_end_date')
                         transaction.recurrence_end_count = form.cleaned_data.get('recurrence_end_count')
             
             transaction.save()
             messages.success(request, 'Transação atualizada com sucesso!')
+            warn_possible_duplicates(request, transaction)
             return redirect('finance:transactions_list')
     else:
         if is_recurring:
@@ -496,8 +714,9 @@ def transaction_delete(request, transaction_id):
                     registered_count = registered_subsequent.count()
                     
                     # Deleta a parcela atual e as subsequentes pendentes
-                    transaction.delete()
-                    pending_subsequent.delete()
+                    with db_transaction.atomic(), ledger.deferred():
+                        transaction.delete()
+                        pending_subsequent.delete()
                     
                     # Reorganiza as sequências das parcelas restantes
                     parent.reorganize_sequences()
@@ -560,8 +779,9 @@ def transaction_delete(request, transaction_id):
                         # Fallback: se não conseguiu promover, deleta normalmente
                         pending_children = transaction.get_pending_children()
                         pending_count = pending_children.count()
-                        pending_children.delete()
-                        transaction.delete()
+                        with db_transaction.atomic(), ledger.deferred():
+                            pending_children.delete()
+                            transaction.delete()
                         messages.success(request, f'Transação recorrente e {pending_count} parcela(s) pendente(s) deletada(s) com sucesso.')
                 else:
                     # Não há parcelas filhas, pode deletar normalmente
@@ -595,32 +815,221 @@ def transaction_delete(request, transaction_id):
     return render(request, 'finance/transaction_delete.html', context)
 
 
+def parse_date_param(request, name):
+    """Lê uma data (AAAA-MM-DD) da query string, ignorando valores inválidos."""
+    try:
+        return parse_date(request.GET.get(name) or '')
+    except ValueError:
+        return None
+
+
+def transaction_bulk_register(request):
+    """
+    Registra o pagamento de várias transações pendentes de uma vez (POST).
+    
+    Parâmetros:
+    - transaction_ids: IDs das transações (repetido)
+    - pay_date: data de pagamento (AAAA-MM-DD), usada para todas as transações
+    - use_due_date: se 'on', usa o vencimento de cada transação (pay_date,
+      se informado, vale para as que não têm vencimento)
+    
+    Todas as transações são registradas em um único bloco atômico e as
+    próximas parcelas das recorrentes são geradas em lote. Retorna um resumo
+    em JSON.
+    """
+    from django.http import JsonResponse
+    
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
+    
+    transaction_ids = set()
+    for value in request.POST.getlist('transaction_ids'):
+        try:
+            transaction_ids.add(int(value))
+        except ValueError:
+            return JsonResponse({'success': False, 'message': f'ID inválido: {value}'}, status=400)
+    if not transaction_ids:
+        return JsonResponse({'success': False, 'message': 'Nenhuma transação informada'}, status=400)
+    
+    use_due_date = request.POST.get('use_due_date') == 'on'
+    pay_date = None
+    if request.POST.get('pay_date'):
+        try:
+            pay_date = parse_date(request.POST['pay_date'])
+        except ValueError:
+            pay_date = None
+        if pay_date is None:
+            return JsonResponse({'success': False, 'message': 'Data de pagamento inválida'}, status=400)
+    if not pay_date and not use_due_date:
+        return JsonResponse({
+            'success': False,
+            'message': 'Informe a data de pagamento ou use o vencimento',
+        }, status=400)
+    
+    skipped = []
+    registered = []
+    with db_transaction.atomic(), ledger.deferred():
+        # Só as pendentes, bloqueadas até o fim do bloco: um envio repetido (ou
+        # simultâneo) das mesmas transações não aplica o pagamento duas vezes
+        transactions = Transaction.objects.select_for_update().filter(
+            pk__in=transaction_ids,
+            pay_date__isnull=True,
+        ).in_bulk()
+        missing = transaction_ids.difference(transactions)
+        registered_ids = set(
+            Transaction.objects.filter(pk__in=missing).values_list('pk', flat=True)
+        ) if missing else set()
+        now = timezone.now()
+        for transaction_id in sorted(transaction_ids):
+            transaction = transactions.get(transaction_id)
+            if transaction_id in registered_ids:
+                skipped.append({'id': transaction_id, 'reason': 'Transação já registrada'})
+                continue
+            if transaction is None:
+                skipped.append({'id': transaction_id, 'reason': 'Transação não encontrada'})
+                continue
+            transaction_pay_date = (use_due_date and transaction.due_date) or pay_date
+            if not transaction_pay_date:
+                skipped.append({'id': transaction_id, 'reason': 'Transação sem vencimento'})
+                continue
+            
+            transaction.pay_date = transaction_pay_date
+            transaction.status = 'registrado'
+            transaction.updated_at = now
+            ledger.record_change(ledger.loaded_entry(transaction), ledger.current_entry(transaction))
+            registered.append(transaction)
+        
+        Transaction.objects.bulk_update(registered, ('pay_date', 'status', 'updated_at'))
+        generated = generate_next_installments(registered)
+    
+    return JsonResponse({
+        'success': True,
+        'message': f'{len(registered)} transação(ões) registrada(s) com sucesso!',
+        'registered': [transaction.id for transaction in registered],
+        'generated': [transaction.id for transaction in generated],
+        'skipped': skipped,
+    })
+
+
+def transaction_import(request):
+    """
+    Importa um extrato bancário (CSV ou OFX) enviado pelo usuário.
+    O arquivo é processado em fluxo, em lotes, e linhas já importadas são ignoradas.
+    """
+    report = None
+    
+    if request.method == 'POST':
+        form = TransactionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            statement_file = form.cleaned_data['statement_file']
+            file_format = form.cleaned_data['file_format']
+            if file_format == 'auto':
+                file_format = detect_format(statement_file.name)
+            
+            stream = io.TextIOWrapper(
+                statement_file.file,
+                encoding=form.cleaned_data['encoding'],
+                errors='replace',
+                newline='',
+            )
+            try:
+                report = import_statement(form.cleaned_data['account'], stream, file_format)
+            except ValueError as error:
+                form.add_error('statement_file', str(error))
+            else:
+                messages.success(request, f'Extrato importado: {report}')
+    else:
+        form = TransactionImportForm()
+    
+    context = {
+        'form': form,
+        'report': report,
+    }
+    
+    return render(request, 'finance/transaction_import.html', context)
+
+
+def duplicate_transactions(request):
+    """
+    Relatório de possíveis duplicidades: grupos de transações com o mesmo
+    fingerprint (conta, data da operação, valor, tipo e descrição normalizada).
+    """
+    page_size = get_page_size(request, 'FINANCE_DUPLICATES_PAGE_SIZE', 50)
+    
+    # Agrupamento sobre o índice do fingerprint, maiores grupos primeiro
+    groups = list(
+        Transaction.objects.exclude(fingerprint='')
+        .values('fingerprint')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('-count', 'fingerprint')[:page_size]
+    )
+    
+    transactions_by_fingerprint = {group['fingerprint']: [] for group in groups}
+    for transaction in Transaction.objects.filter(
+        fingerprint__in=transactions_by_fingerprint
+    ).select_related('account', 'category').order_by('id'):
+        transactions_by_fingerprint[transaction.fingerprint].append(transaction)
+    
+    context = {
+        'duplicate_groups': list(transactions_by_fingerprint.values()),
+        'page_size': page_size,
+    }
+    
+    return render(request, 'finance/duplicate_transactions.html', context)
+
+
 def account_statement(request, account_id):
     """
-    Exibe o extrato de uma conta.
+    Exibe o extrato de uma conta, uma página por vez.
     
     Filtros disponíveis via query parameter:
     - status: 'executado' ou 'pendente' (opcional)
+    - from / to: intervalo de datas (AAAA-MM-DD) do extrato (opcional)
+    - cursor / page_size: navegação entre páginas das transações executadas
+    
+    As parcelas futuras ainda não geradas das recorrências da conta aparecem
+    como projeções (não gravadas) entre hoje e 'to' (ou FINANCE_PROJECTION_MONTHS
+    meses à frente).
+    
+    O saldo de abertura do período parte do resumo mensal da conta
+    (AccountMonthSummary), então consultar o último mês custa o mesmo em uma
+    conta nova ou em uma conta com dez anos de histórico.
     """
     account = get_object_or_404(Account, id=account_id)
     
-    # Obtém o filtro de status da query string
+    # Obtém os filtros da query string
     status_filter = request.GET.get('status', None)
-    
-    # Query base para transações da conta
-    transactions = Transaction.objects.filter(account=account)
-    
-    # Aplica filtro de status se fornecido
-    if status_filter == 'executado':
-        # Transações pagas (com pay_date preenchido)
-        transactions = transactions.filter(pay_date__isnull=False)
-    elif status_filter == 'pendente':
-        # Transações pendentes (sem pay_date)
-        transactions = transactions.filter(pay_date__isnull=True)
-    
-    # Separa transações pagas e pendentes
-    paid_transactions = transactions.filter(pay_date__isnull=False).order_by('pay_date')
-    pending_transactions = transactions.filter(pay_date__isnull=True).order_by('due_date')
+    date_from = parse_date_param(request, 'from')
+    date_to = parse_date_param(request, 'to')
+    page_size = get_page_size(request, 'FINANCE_STATEMENT_PAGE_SIZE', 50)
+    
+    # Transações executadas e pendentes da conta dentro do período
+    paid_transactions = Transaction.objects.filter(account=account, pay_date__isnull=False)
+    pending_transactions = Transaction.objects.filter(account=account, pay_date__isnull=True)
+    pending_in_period = Q()
+    if date_from:
+        paid_transactions = paid_transactions.filter(pay_date__gte=date_from)
+        pending_in_period &= Q(due_date__gte=date_from)
+    if date_to:
+        paid_transactions = paid_transactions.filter(pay_date__lte=date_to)
+        pending_in_period &= Q(due_date__lte=date_to)
+    if pending_in_period:
+        # Pendentes sem vencimento não pertencem a nenhum período: aparecem sempre
+        pending_transactions = pending_transactions.filter(pending_in_period | Q(due_date__isnull=True))
+    pending_transactions = pending_transactions.select_related(
+        'beneficiary', 'category'
+    ).order_by('due_date')
+    
+    # Parcelas futuras projetadas das recorrências (não executadas)
+    projected_transactions = []
+    if status_filter != 'executado':
+        today = timezone.localdate()
+        projection_from = max(date_from, today) if date_from else today
+        projection_to = date_to or today + relativedelta(
+            months=getattr(settings, 'FINANCE_PROJECTION_MONTHS', 12)
+        )
+        projected_transactions = list(project_installments(projection_from, projection_to, [account]))
     
     # Se houver filtro, mostra apenas o tipo filtrado
     if status_filter == 'executado':
@@ -628,38 +1037,172 @@ def account_statement(request, account_id):
     elif status_filter == 'pendente':
         paid_transactions = Transaction.objects.none()
     
-    # Calcula o saldo acumulado para transações executadas
-    current_balance = account.opening_balance
-    paid_transactions_with_balance = []
-    
-    for transaction in paid_transactions:
-        # Atualiza o saldo baseado no tipo de transação
-        if transaction.transaction_type == 'CR':
-            current_balance += transaction.value
-        else:  # Débito
-            current_balance -= transaction.value
-        
-        # Adiciona a transação com seu saldo acumulado
-        paid_transactions_with_balance.append({
-            'transaction': transaction,
-            'balance': current_balance
-        })
-    
-    # Calcula o saldo final (último saldo calculado)
-    final_balance = current_balance
+    # Saldo de abertura do período: saldo registrado ao final do dia anterior a 'from'
+    opening_balance = account.opening_balance
+    if date_from:
+        opening_balance = ledger.balance_at(account, date_from - timedelta(days=1))
+    
+    # Saldo ao final do período
+    final_balance = opening_balance + paid_transactions.aggregate(
+        total=Coalesce(Sum(signed_value_expression()), Value(Decimal('0')))
+    )['total']
+    
+    # Total acumulado calculado no banco com uma função de janela. A janela
+    # começa na primeira linha que passa pelo filtro do cursor
+    cursor = request.GET.get('cursor')
+    paginator = KeysetPaginator(
+        paid_transactions.select_related('beneficiary', 'category').annotate(
+            running_total=Window(
+                expression=Sum(signed_value_expression()),
+                order_by=[F('pay_date').asc(), F('id').asc()],
+                frame=RowRange(start=None, end=0),
+            ),
+        ),
+        ('pay_date', 'id'),
+        page_size,
+    )
+    
+    # Saldo transportado até o início da janela: o das linhas anteriores à
+    # página, nos cursores de avanço (nos de retorno a janela já parte do início)
+    carried_balance = opening_balance
+    rows_before = paginator.rows_before(cursor)
+    if rows_before is not None:
+        carried_balance += paid_transactions.filter(rows_before).aggregate(
+            total=Coalesce(Sum(signed_value_expression()), Value(Decimal('0')))
+        )['total']
+    
+    page = paginator.get_page(cursor)
+    for transaction in page.object_list:
+        transaction.running_balance = carried_balance + transaction.running_total
+    
+    # Query string sem o cursor, para montar os links de navegação
+    query_params = request.GET.copy()
+    query_params.pop('cursor', None)
     
     context = {
         'account': account,
-        'opening_balance': account.opening_balance,
-        'paid_transactions_with_balance': paid_transactions_with_balance,
+        'opening_balance': opening_balance,
+        'paid_transactions_with_balance': page.object_list,
+        'page': page,
         'pending_transactions': pending_transactions,
+        'projected_transactions': projected_transactions,
         'final_balance': final_balance,
         'status_filter': status_filter,
+        'date_from': date_from,
+        'date_to': date_to,
+        'query_string': query_params.urlencode(),
     }
     
     return render(request, 'finance/account_statement.html', context)
 
 
+def cash_flow_forecast(request):
+    """
+    Previsão de fluxo de caixa em JSON: saldo registrado, pendentes e parcelas
+    projetadas das recorrências, dia a dia, para cada conta aberta.
+    
+    Parâmetros via query string:
+    - months: horizonte em meses (padrão FINANCE_FORECAST_MONTHS, limitado a
+      FINANCE_FORECAST_MAX_MONTHS)
+    - account: restringe a algumas contas (pode ser repetido)
+    - daily: se '1', inclui o saldo de cada dia
+    
+    Para cada conta retorna o menor saldo do período e a primeira data em que
+    o saldo fica abaixo do saldo mínimo da conta.
+    """
+    from django.http import JsonResponse
+    
+    months = getattr(settings, 'FINANCE_FORECAST_MONTHS', 12)
+    max_months = getattr(settings, 'FINANCE_FORECAST_MAX_MONTHS', 60)
+    try:
+        months = int(request.GET.get('months', months))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Horizonte inválido'}, status=400)
+    months = max(1, min(months, max_months))
+    
+    accounts = Account.objects.filter(is_closed=False)
+    account_ids = request.GET.getlist('account')
+    if account_ids:
+        try:
+            accounts = accounts.filter(id__in=[int(value) for value in account_ids])
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Conta inválida'}, status=400)
+    
+    forecast = build_forecast(accounts, months)
+    rows = forecast.summary()
+    if request.GET.get('daily') == '1':
+        for row in rows:
+            row['daily_balances'] = [
+                {'date': day, 'balance': balance}
+                for day, balance in forecast.daily_balances(row['account_id'])
+            ]
+    
+    return JsonResponse({
+        'success': True,
+        'start': forecast.start,
+        'end': forecast.end,
+        'accounts': rows,
+    })
+
+
+def recurrence_calendar(request):
+    """
+    Calendário mensal dos compromissos: transações pendentes com vencimento
+    no mês e parcelas futuras projetadas das recorrências (não gravadas).
+    
+    Filtros via query parameter:
+    - month: mês exibido (AAAA-MM, padrão: mês atual)
+    - account: restringe a uma conta (opcional)
+    """
+    today = timezone.localdate()
+    try:
+        month = parse_date(f"{request.GET.get('month')}-01")
+    except ValueError:
+        month = None
+    month = (month or today).replace(day=1)
+    month_end = month + relativedelta(months=1) - timedelta(days=1)
+    
+    accounts = Account.objects.order_by('name')
+    account = None
+    if request.GET.get('account'):
+        account = get_object_or_404(Account, id=request.GET['account'])
+    
+    pending_transactions = Transaction.objects.filter(
+        pay_date__isnull=True,
+        due_date__range=(month, month_end),
+    ).select_related('account').order_by('due_date', 'id')
+    if account:
+        pending_transactions = pending_transactions.filter(account=account)
+    
+    # Projeções só a partir de hoje: o que já venceu e não foi gerado não é projetado
+    projected_transactions = []
+    if month_end >= today:
+        projected_transactions = project_installments(
+            max(month, today), month_end, [account] if account else None
+        )
+    
+    transactions_by_day = {}
+    for transaction in list(pending_transactions) + list(projected_transactions):
+        transactions_by_day.setdefault(transaction.due_date, []).append(transaction)
+    
+    weeks = [
+        [(day, transactions_by_day.get(day, [])) for day in week]
+        for week in calendar.Calendar(firstweekday=6).monthdatescalendar(month.year, month.month)
+    ]
+    
+    context = {
+        'month': month,
+        'previous_month': month - relativedelta(months=1),
+        'next_month': month + relativedelta(months=1),
+        'weeks': weeks,
+        'today': today,
+        'accounts': accounts,
+        'selected_account': account,
+    }
+    
+    return render(request, 'finance/recurrence_calendar.html', context)
+
+
 def composite_transaction_create(request):
     """
     Cria uma transação composta com múltiplas linhas.
@@ -673,67 +1216,17 @@ def composite_transaction_create(request):
             pay_date = form.cleaned_data.get('pay_date')
             lines = form.cleaned_data['lines']
             
-            # Determina status baseado em pay_date
-            status = 'registrado' if pay_date else 'pendente'
-            
-            # Cria a primeira transação como "pai"
-            parent_transaction = None
-            transaction_count = 0
+            # Monta toda a composta em memória: a primeira linha é a "pai"
+            parent_transaction, children = build_composite_transactions(account, buy_date, pay_date, lines)
             
-            for i, line in enumerate(lines):
-                # Determina operation_type baseado no tipo de linha
-                if line['line_type'] == 'transfer':
-                    operation_type = 'transfer'
-                    # Para transferências, sempre cria débito na conta principal
-                    transaction_type = 'DB'
-                else:
-                    operation_type = 'simple'
-                    transaction_type = line['transaction_type']
-                
-                # Cria a transação principal (débito ou crédito na conta compartilhada)
-                transaction = Transaction.objects.create(
-                    account=account,
-                    destination_account=line['destination_account'],
-                    transaction_type=transaction_type,
-                    operation_type=operation_type,
-                    value=Decimal(str(line['value'])),
-                    category=line['category'],
-                    description=line['description'],
-                    buy_date=buy_date,
-                    pay_date=pay_date,
-                    status=status
-                )
-                
-                # Primeira transação é a pai, demais são filhas
-                if transaction_count == 0:
-                    parent_transaction = transaction
-                else:
-                    transaction.parent_transaction = parent_transaction
-                    transaction.parent_type = 'composite'
-                    transaction.save()
-                
-                transaction_count += 1
-                
-                # Se for transferência, cria também a transação de crédito na conta de destino
-                if line['line_type'] == 'transfer' and line['destination_account']:
-                    destination_account = line['destination_account']
-                    credit_description = line['description'] or f'Transferência de {account.name}'
-                    
-                    credit_transaction = Transaction.objects.create(
-                        account=destination_account,
-                        destination_account=account,
-                        transaction_type='CR',
-                        operation_type='transfer',
-                        value=Decimal(str(line['value'])),
-                        category=None,
-                        description=credit_description,
-                        buy_date=buy_date,
-                        pay_date=pay_date,
-                        status=status,
-                        parent_transaction=parent_transaction,
-                        parent_type='composite'
-                    )
-                    transaction_count += 1
+            # Pai inserida primeiro, filhas e contrapartidas de transferência em um único INSERT
+            with db_transaction.atomic(), ledger.deferred():
+                parent_transaction.save()
+                for child in children:
+                    child.parent_transaction = parent_transaction
+                Transaction.objects.bulk_create(children)
+                ledger.record_transactions(children)
+            transaction_count = 1 + len(children)
             
             messages.success(
                 request,
@@ -787,72 +1280,40 @@ def composite_transaction_update(request, transaction_id):
             pay_date = form.cleaned_data.get('pay_date')
             lines = form.cleaned_data['lines']
             
-            # Determina status baseado em pay_date
-            status = 'registrado' if pay_date else 'pendente'
-            
-            # Deleta todas as transações antigas (pai e filhas)
-            # Primeiro deleta as filhas para evitar problemas de CASCADE
-            for child in child_transactions:
-                child.delete()
-            parent_transaction.delete()
+            # Monta a composta desejada em memória e compara com as linhas existentes:
+            # linhas iguais ficam intactas, alteradas são atualizadas em lote,
+            # sobras são excluídas em uma consulta e novas inseridas em lote
+            new_parent, new_children = build_composite_transactions(account, buy_date, pay_date, lines)
+            existing_slots = group_composite_slots([parent_transaction] + list(child_transactions))
+            desired_slots = group_composite_slots([new_parent] + new_children)
             
-            # Cria novas transações seguindo a mesma lógica do create
-            new_parent_transaction = None
-            transaction_count = 0
+            changed, created, removed = [], [], []
+            for index in range(max(len(existing_slots), len(desired_slots))):
+                existing_slot = existing_slots[index] if index < len(existing_slots) else (None, None)
+                desired_slot = desired_slots[index] if index < len(desired_slots) else (None, None)
+                for existing, desired in zip(existing_slot, desired_slot):
+                    if existing is not None and desired is not None:
+                        if copy_composite_fields(desired, existing):
+                            changed.append(existing)
+                    elif existing is not None:
+                        removed.append(existing.id)
+                    elif desired is not None:
+                        desired.parent_transaction = parent_transaction
+                        created.append(desired)
             
-            for i, line in enumerate(lines):
-                # Determina operation_type baseado no tipo de linha
-                if line['line_type'] == 'transfer':
-                    operation_type = 'transfer'
-                    transaction_type = 'DB'
-                else:
-                    operation_type = 'simple'
-                    transaction_type = line['transaction_type']
-                
-                # Cria a transação principal
-                transaction = Transaction.objects.create(
-                    account=account,
-                    destination_account=line['destination_account'],
-                    transaction_type=transaction_type,
-                    operation_type=operation_type,
-                    value=Decimal(str(line['value'])),
-                    category=line['category'],
-                    description=line['description'],
-                    buy_date=buy_date,
-                    pay_date=pay_date,
-                    status=status
-                )
-                
-                # Primeira transação é a pai, demais são filhas
-                if transaction_count == 0:
-                    new_parent_transaction = transaction
-                else:
-                    transaction.parent_transaction = new_parent_transaction
-                    transaction.parent_type = 'composite'
-                    transaction.save()
-                
-                transaction_count += 1
-                
-                # Se for transferência, cria também a transação de crédito na conta de destino
-                if line['line_type'] == 'transfer' and line['destination_account']:
-                    destination_account = line['destination_account']
-                    credit_description = line['description'] or f'Transferência de {account.name}'
-                    
-                    credit_transaction = Transaction.objects.create(
-                        account=destination_account,
-                        destination_account=account,
-                        transaction_type='CR',
-                        operation_type='transfer',
-                        value=Decimal(str(line['value'])),
-                        category=None,
-                        description=credit_description,
-                        buy_date=buy_date,
-                        pay_date=pay_date,
-                        status=status,
-                        parent_transaction=new_parent_transaction,
-                        parent_type='composite'
-                    )
-                    transaction_count += 1
+            with db_transaction.atomic(), ledger.deferred():
+                if changed:
+                    for row in changed:
+                        ledger.record_change(ledger.loaded_entry(row), ledger.current_entry(row))
+                    Transaction.objects.bulk_update(changed, COMPOSITE_FIELDS + ('updated_at',))
+                if removed:
+                    Transaction.objects.filter(id__in=removed).delete()
+                if created:
+                    Transaction.objects.bulk_create(created)
+                    ledger.record_transactions(created)
+            transaction_count = sum(
+                1 for slot in desired_slots for row in slot if row is not None
+            )
             
             messages.success(
                 request,
@@ -869,7 +1330,7 @@ def composite_transaction_update(request, transaction_id):
         # Processa transações filhas diretas (não são transferências de crédito)
         for child in child_transactions:
             # Ignora transações de crédito de transferências (serão processadas junto com a débito)
-            if child.operation_type == 'transfer' and child.transaction_type == 'CR':
+            if is_credit_leg(child):
                 continue
             
             # Determina o tipo de linha
@@ -976,7 +1437,8 @@ def composite_transaction_delete(request, transaction_id):
     
     if request.method == 'POST':
         # Deleta a transação pai (que vai cascatear as filhas via CASCADE)
-        parent_transaction.delete()
+        with db_transaction.atomic(), ledger.deferred():
+            parent_transaction.delete()
         messages.success(
             request,
             f'Transação composta com {total_count} transação(ões) deletada(s) com sucesso!'
@@ -998,7 +1460,9 @@ def composite_transaction_delete(request, transaction_id):
 def recurring_transaction_undo_payment(request, transaction_id):
     """
     Desfaz o pagamento de uma transação recorrente, removendo pay_date
-    e deletando a próxima parcela gerada (se existir).
+    e deletando a próxima parcela gerada (se existir). A próxima parcela só
+    é removida se ainda estiver pendente e for a última da série, ou seja, se
+    foi gerada por este pagamento (parcelas geradas antecipadamente ficam).
     """
     transaction = get_object_or_404(Transaction, id=transaction_id)
     
@@ -1016,12 +1480,12 @@ def recurring_transaction_undo_payment(request, transaction_id):
         messages.error(request, 'A funcionalidade "Desfazer Pagamento" está disponível apenas para transações com recorrência finita.')
         return redirect('finance:transactions_list')
     
+    # Próxima parcela, se foi gerada por este pagamento
+    next_installment = transaction.get_next_installment()
+    if next_installment and (next_installment.pay_date or next_installment.has_next_recurring_installment()):
+        next_installment = None
+    
     if request.method == 'POST':
-        # Busca próxima parcela gerada
-        next_installment = transaction.child_transactions.filter(
-            parent_type='recurring'
-        ).first()
-        
         if next_installment:
             next_installment.delete()
             messages.success(request, 'Pagamento desfeito e próxima parcela removida.')
@@ -1036,10 +1500,6 @@ def recurring_transaction_undo_payment(request, transaction_id):
         return redirect('finance:transactions_list')
     
     # GET - mostra confirmação
-    next_installment = transaction.child_transactions.filter(
-        parent_type='recurring'
-    ).first()
-    
     context = {
         'transaction': transaction,
         'next_installment': next_installment,
@@ -1097,6 +1557,51 @@ def recurring_transaction_interrupt(request, transaction_id):
     return render(request, 'finance/recurring_transaction_interrupt.html', context)
 
 
+def recurring_transaction_materialize(request, transaction_id):
+    """
+    Gera de uma vez todas as parcelas restantes de uma recorrência finita
+    (em vez de uma a uma, a cada pagamento).
+    """
+    transaction = get_object_or_404(Transaction, id=transaction_id)
+    
+    if not transaction.is_recurring:
+        messages.error(request, 'Esta transação não é recorrente.')
+        return redirect('finance:transactions_list')
+    
+    # Obtém a raiz da recorrência (pode ser chamada de qualquer parcela)
+    parent = transaction.get_recurring_parent()
+    
+    if parent.recurrence_end_type != 'after_count':
+        messages.error(request, 'A geração antecipada está disponível apenas para recorrências com quantidade de parcelas definida.')
+        return redirect('finance:transactions_list')
+    
+    last_sequence = parent.get_series_installments().aggregate(
+        last=Coalesce(Max('recurrence_sequence'), Value(1))
+    )['last']
+    remaining_count = max(parent.recurrence_end_count - last_sequence, 0)
+    if parent.recurrence_interrupted or not remaining_count:
+        messages.warning(request, 'Não há parcelas restantes a gerar nesta recorrência.')
+        return redirect('finance:transactions_list')
+    
+    if request.method == 'POST':
+        installments = materialize_installments(parent)
+        if installments:
+            messages.success(request, f'{len(installments)} parcela(s) pendente(s) gerada(s) com sucesso.')
+        else:
+            messages.warning(request, 'Nenhuma parcela gerada: a série foi alterada ao mesmo tempo. Tente novamente.')
+        return redirect('finance:transactions_list')
+    
+    # GET - mostra confirmação
+    context = {
+        'transaction': transaction,
+        'parent': parent,
+        'last_sequence': last_sequence,
+        'remaining_count': remaining_count,
+    }
+    
+    return render(request, 'finance/recurring_transaction_materialize.html', context)
+
+
 def transaction_register(request, transaction_id):
     """
     Registra o pagamento de uma transação, permitindo editar campos e preenchendo pay_date com due_date.
@@ -122,3 +122,35 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Finance
+# Tamanho padrão das páginas das listagens paginadas por cursor
+
+FINANCE_TRANSACTIONS_PAGE_SIZE = 50
+
+FINANCE_MAX_PAGE_SIZE = 500
+
+FINANCE_STATEMENT_PAGE_SIZE = 50
+
+FINANCE_DUPLICATES_PAGE_SIZE = 50
+
+# Quantidade de linhas gravadas por lote na importação de extratos
+FINANCE_IMPORT_CHUNK_SIZE = 1000
+
+# Horizonte (em meses) das parcelas futuras projetadas no extrato sem data final
+FINANCE_PROJECTION_MONTHS = 12
+
+# Horizonte padrão e máximo (em meses) da previsão de fluxo de caixa
+FINANCE_FORECAST_MONTHS = 12
+
+FINANCE_FORECAST_MAX_MONTHS = 60
+
+# Horizonte (em dias) e tamanho do lote (em séries) do comando generate_due_installments
+FINANCE_DUE_INSTALLMENTS_DAYS = 30
+
+FINANCE_DUE_INSTALLMENTS_BATCH_SIZE = 500
+
+# Atraso máximo (em dias) recuperado pelo generate_due_installments: séries
+# paradas há mais tempo são ignoradas e listadas na saída do comando
+FINANCE_DUE_INSTALLMENTS_CATCH_UP_DAYS = 90